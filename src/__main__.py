@@ -1,24 +1,46 @@
-try:
-    import os 
-    print(f"Current dir = {os.getcwd()}")
-    from config.logger_setup import setup_logging
-    setup_logging()  # Call this once at app startup
-    print("Loading tk UI : ...")
-    from ui.ui import initialiser_interface_tk
-    print("Loading tk UI : DONE")
-    print("Loading Calulator : ...")
-    from calculateur import CalculateurFraisLivraison
-    print("Loading Calulator : DONE")
-    print("Loading qt UI  : ... ")
-    from ui.ui_qt import initialize_qt_interface
-    print("Loading qt UI  : DONE ")
+import logging
+import multiprocessing
+import sys
+from utils.timing import DEMARRAGE
 
+# Spawned worker processes (optimizer pool) import this module as __mp_main__ : nothing may run outside the guard
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    print("Welcome to MAGE Calculator")
+    try:
+        import os
+        print(f"Current dir = {os.getcwd()}")
+        with DEMARRAGE.mesurer("logger setup"):
+            from config.logger_setup import setup_logging
+            setup_logging()  # Call this once at app startup
+        logger = logging.getLogger("__main__")
+        logger.info("Loading Calulator : ...")
+        with DEMARRAGE.mesurer("import calculateur"):
+            from calculateur import CalculateurFraisLivraison
+        logger.info("Loading Calulator : DONE")
 
-    if __name__ == "__main__":
-            print("Welcome to Transport Calculator 2025 !")
+        logger.info("Welcome to Transport Calculator 2025 !")
+        with DEMARRAGE.mesurer("CalculateurFraisLivraison()"):
             calculateur = CalculateurFraisLivraison()
-            initialize_qt_interface(calculateur)
+        if "--tk" in sys.argv:
+            # Outdated tk UI, only loaded on request
+            logger.info("Loading tk UI : ...")
+            from ui.ui import initialiser_interface_tk
+            logger.info("Loading tk UI : DONE")
             initialiser_interface_tk(calculateur)
-except Exception as e:
-    print(f'[ERROR] Fatal error programm will stop \n{e}')
-    input("...")
+        else:
+            logger.info("Loading qt UI  : ... ")
+            with DEMARRAGE.mesurer("import ui_qt"):
+                from ui.ui_qt import initialize_qt_interface
+            logger.info("Loading qt UI  : DONE ")
+            if "--startup-report" in sys.argv:
+                logger.info("%s", DEMARRAGE.rapport())
+            # Optimizer workers prewarmed in the background while the window opens
+            calculateur.demarrer_pool()
+            try:
+                initialize_qt_interface(calculateur)
+            finally:
+                calculateur.arreter_pool()
+    except Exception as e:
+        print(f'[ERROR] Fatal error programm will stop \n{e}')
+        input("...")
@@ -0,0 +1,234 @@
+"""
+Headless batch quoting of orders, e.g. re-quoting the order history after a carrier rate change.
+
+Run from the src directory :
+    python batch.py commandes.jsonl --output devis.jsonl
+    python batch.py commandes.csv --output devis.csv --workers 8 --marge 10
+
+Input formats (by extension) :
+    - JSONL : one order per line
+        {"id": "C001", "country": "france", "departement": "75", "articles": [{"nom": "vis", "poids": 0.2, "quantite": 3}]}
+    - CSV : one cart line per row, columns id, country, departement, nom, poids (kg), quantite
+      The rows of an order must be contiguous.
+Output (JSONL, or CSV when --output ends with .csv) : one line per order, in input order, with the
+price of each carrier, the best carrier and the DPD colis arrangement.
+
+Orders are streamed : at most --fenetre orders are in flight, quoted by a pool of worker processes
+(one prewarmed calculator each). Identical carts (same articles, country and departement) are
+optimized once : duplicates share the in-flight computation, and the last --cache results are kept.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from calculateur import initialiser_worker, calculer_worker
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTEURS = ["dpd", "schenker_palette", "schenker_messagerie"]
+COLONNES_CSV = ["id", "country", "departement", "articles"] + [f"prix_{nom}" for nom in TRANSPORTEURS] + ["meilleur", "prix_meilleur", "erreurs", "dpd_colis"]
+
+
+def normaliser_commande(identifiant, country, departement, articles):
+    """ Order with its cart as canonical (nom, masse_g, quantite) lines, the deduplication key """
+    from models.cart import Cart
+    panier = Cart.depuis_articles(articles)
+    return {
+        "id": identifiant,
+        "country": (country or "france").strip().lower(),
+        "departement": str(departement).strip(),
+        "articles": len(panier),
+        "lignes": panier.empreinte(),
+    }
+
+
+def lire_jsonl(flux):
+    for numero, ligne in enumerate(flux, 1):
+        if not ligne.strip():
+            continue
+        commande = json.loads(ligne)
+        yield normaliser_commande(commande.get("id", numero), commande.get("country"), commande["departement"], commande["articles"])
+
+
+def lire_csv(flux):
+    courante = None
+    articles = []
+    for ligne in csv.DictReader(flux):
+        if courante is not None and ligne["id"] != courante["id"]:
+            yield normaliser_commande(courante["id"], courante.get("country"), courante["departement"], articles)
+            articles = []
+        courante = ligne
+        articles.append({"nom": ligne["nom"], "poids": ligne["poids"], "quantite": int(ligne.get("quantite") or 1)})
+    if courante is not None:
+        yield normaliser_commande(courante["id"], courante.get("country"), courante["departement"], articles)
+
+
+def lire_commandes(fichier):
+    """ Orders of fichier ('-' : JSONL on stdin), read one at a time """
+    if fichier == "-":
+        yield from lire_jsonl(sys.stdin)
+        return
+    with open(fichier, newline="") as flux:
+        if fichier.lower().endswith(".csv"):
+            yield from lire_csv(flux)
+        else:
+            yield from lire_jsonl(flux)
+
+
+def quoter(commandes, executor, fenetre, taille_cache, statistiques):
+    """
+    Yields (commande, resultats) in input order, with at most fenetre orders in flight.
+    Identical carts share one computation, in flight or among the last taille_cache results.
+    """
+    en_cours = deque()
+    futures = {}
+    cache = OrderedDict()
+
+    def terminer():
+        commande, cle, future = en_cours.popleft()
+        try:
+            resultats = future.result()
+        except Exception as e:
+            logger.error("Order %s could not be quoted : %s", commande["id"], e)
+            statistiques["erreurs"] += 1
+            resultats = {"error": str(e)}
+        if futures.get(cle) is future:
+            del futures[cle]
+            cache[cle] = resultats
+            if len(cache) > taille_cache:
+                cache.popitem(last=False)
+        return commande, resultats
+
+    for commande in commandes:
+        cle = (commande["country"], commande["departement"], commande["lignes"])
+        if cle in cache:
+            cache.move_to_end(cle)
+            future = Future()
+            future.set_result(cache[cle])
+            statistiques["dedupliquees"] += 1
+        elif cle in futures:
+            future = futures[cle]
+            statistiques["dedupliquees"] += 1
+        else:
+            options = {"country": commande["country"], "departement": commande["departement"]}
+            future = executor.submit(calculer_worker, commande["lignes"], options)
+            futures[cle] = future
+            statistiques["calculees"] += 1
+        en_cours.append((commande, cle, future))
+        while len(en_cours) >= fenetre:
+            yield terminer()
+    while en_cours:
+        yield terminer()
+
+
+def resumer(commande, resultats):
+    """ Output line of an order : carrier prices, best carrier, DPD arrangement """
+    ligne = {"id": commande["id"], "country": commande["country"], "departement": commande["departement"], "articles": commande["articles"]}
+    if "error" in resultats:
+        ligne["erreurs"] = {"calcul": resultats["error"]}
+        return ligne
+    prix = {}
+    erreurs = {}
+    for nom in TRANSPORTEURS:
+        resultat = resultats.get(nom) or {}
+        prix[nom] = float(resultat["prix"]) if "prix" in resultat else None
+        if "error" in resultat:
+            erreurs[nom] = resultat["error"]
+    valides = {nom: valeur for nom, valeur in prix.items() if valeur is not None}
+    ligne["prix"] = prix
+    ligne["meilleur"] = min(valides, key=valides.get) if valides else None
+    ligne["prix_meilleur"] = valides.get(ligne["meilleur"])
+    ligne["erreurs"] = erreurs
+    dpd = resultats.get("dpd") or {}
+    if "arrangement (labels)" in dpd:
+        ligne["dpd"] = {
+            "colis": dpd["arrangement (labels)"],
+            "masses_colis": dpd["masses colis"],
+            "prix_colis": dpd["prix_colis"],
+            "moteur": dpd.get("moteur"),
+        }
+    return ligne
+
+
+class SortieJsonl:
+    def __init__(self, flux):
+        self.flux = flux
+
+    def ecrire(self, ligne):
+        self.flux.write(json.dumps(ligne, ensure_ascii=False) + "\n")
+
+
+class SortieCsv:
+    def __init__(self, flux):
+        self.writer = csv.DictWriter(flux, fieldnames=COLONNES_CSV)
+        self.writer.writeheader()
+
+    def ecrire(self, ligne):
+        prix = ligne.get("prix", {})
+        self.writer.writerow({
+            "id": ligne["id"],
+            "country": ligne["country"],
+            "departement": ligne["departement"],
+            "articles": ligne["articles"],
+            **{f"prix_{nom}": prix.get(nom) for nom in TRANSPORTEURS},
+            "meilleur": ligne.get("meilleur"),
+            "prix_meilleur": ligne.get("prix_meilleur"),
+            "erreurs": json.dumps(ligne["erreurs"], ensure_ascii=False) if ligne.get("erreurs") else "",
+            "dpd_colis": json.dumps(ligne["dpd"]["colis"], ensure_ascii=False) if "dpd" in ligne else "",
+        })
+
+
+def parser_option(texte):
+    """ KEY=VALUE, VALUE read as JSON when possible (numbers, null...) """
+    cle, _, valeur = texte.partition("=")
+    try:
+        return cle, json.loads(valeur)
+    except ValueError:
+        return cle, valeur
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch quoting of orders read from CSV or JSONL")
+    parser.add_argument("entree", help="orders file (.csv or .jsonl), '-' for JSONL on stdin")
+    parser.add_argument("--output", help="results file (.csv or .jsonl), JSONL on stdout when omitted")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--fenetre", type=int, help="max orders in flight (default 4 per worker)")
+    parser.add_argument("--cache", type=int, default=10000, help="quoted carts kept for deduplication")
+    parser.add_argument("--marge", type=float, default=0, help="POURCENTAGE_MAGE applied to every carrier")
+    parser.add_argument("--option", action="append", default=[], type=parser_option, metavar="KEY=VALUE", help="calculator option, e.g. --option MODE_DPD=\"deux_phases\"")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stderr)
+    logging.getLogger("utils.utils").setLevel(logging.ERROR)
+    logging.getLogger("models.transporteurs").setLevel(logging.ERROR)
+    options = dict(args.option)
+    options["POURCENTAGE_MAGE"] = args.marge
+    fenetre = args.fenetre or 4*args.workers
+    statistiques = {"commandes": 0, "calculees": 0, "dedupliquees": 0, "erreurs": 0}
+
+    debut = time.perf_counter()
+    flux = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        sortie = SortieCsv(flux) if args.output and args.output.lower().endswith(".csv") else SortieJsonl(flux)
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=initialiser_worker, initargs=(options,)) as executor:
+            for commande, resultats in quoter(lire_commandes(args.entree), executor, fenetre, args.cache, statistiques):
+                sortie.ecrire(resumer(commande, resultats))
+                statistiques["commandes"] += 1
+    finally:
+        if flux is not sys.stdout:
+            flux.close()
+    duree = time.perf_counter() - debut
+    statistiques["duree_s"] = round(duree, 3)
+    statistiques["commandes_par_s"] = round(statistiques["commandes"]/duree, 1) if duree > 0 else None
+    logger.info("Batch done : %s", json.dumps(statistiques))
+    return 1 if statistiques["erreurs"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Performance benchmark of the partition optimizers and of the carriers.
+
+Run from the src directory :
+    python benchmark.py                                  # JSON report on stdout
+    python benchmark.py --save-baseline ../benchmarks/baseline.json
+    python benchmark.py --baseline ../benchmarks/baseline.json --tolerance 0.25
+
+Two suites are measured :
+    - engines : python utils.find_best_config versus the C engine (bin.c) on carts of 1..N articles,
+      reports partitions/sec, latency percentiles and peak memory
+    - carriers : Transporteur.calculer_tarif for dpd, schenker_palette and schenker_messagerie
+      on realistic carts drawn from data/items.csv
+With --baseline the p50 latencies are compared to the stored report, the exit code is 1
+when a case is slower than baseline * (1 + tolerance).
+"""
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from utils.utils import read_csv_file_with_headers, partitions_count, masse_en_grammes
+
+logger = logging.getLogger(__name__)
+
+PATH_ARTICLES_LIST = "../data/items.csv"
+# Latencies below this are dominated by noise and never reported as regressions
+SEUIL_BRUIT_MS = 0.05
+
+
+def percentiles(durees):
+    """ p50/p95/p99 (nearest rank) and mean of a list of durations in seconds, in ms """
+    triees = sorted(durees)
+    def rang(p):
+        return triees[max(0, math.ceil(p/100*len(triees))-1)]*1000
+    return {
+        "p50_ms": rang(50),
+        "p95_ms": rang(95),
+        "p99_ms": rang(99),
+        "mean_ms": sum(triees)/len(triees)*1000,
+    }
+
+
+def mesurer(fonction, repetitions, avant=None):
+    """ Latency percentiles of fonction() over repetitions, and its peak python memory (tracemalloc) """
+    durees = []
+    for _ in range(repetitions):
+        if avant is not None:
+            avant()
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    # Separate run : tracemalloc slows down allocations and would bias the latencies
+    if avant is not None:
+        avant()
+    tracemalloc.start()
+    try:
+        fonction()
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    resultat = percentiles(durees)
+    resultat["peak_memory_kb"] = pic/1024
+    resultat["repetitions"] = repetitions
+    return resultat
+
+
+def masses_aleatoires(n, generateur):
+    """ n article masses (g) between 0.5 and 15 kg, rounded to 100 g like user inputs """
+    return [masse_en_grammes(round(generateur.uniform(0.5, 15), 1)) for _ in range(n)]
+
+
+def charger_articles():
+    """ (nom, masse) of the articles of data/items.csv """
+    header, columns_labels, csv = read_csv_file_with_headers(PATH_ARTICLES_LIST)
+    colonne_masse = [label for label in columns_labels if "masse" in label][0]
+    return [(nom, float(masse)) for nom, masse in zip(csv[columns_labels[1]], csv[colonne_masse])]
+
+
+def panier_realiste(articles, n, generateur):
+    """ Cart of n articles drawn from the catalogue, with quantities as entered in the UI """
+    panier = []
+    unites = 0
+    while unites < n:
+        nom, masse = generateur.choice(articles)
+        quantite = min(generateur.randint(1, 4), n - unites)
+        unites += quantite
+        panier.append({"nom": nom, "poids": masse, "quantite": quantite})
+    return panier
+
+
+def bench_moteurs(calculateur, tailles, repetitions, graine, moteurs):
+    """ utils.find_best_config (python) versus bin.c.find_best_config on carts of each size """
+    from functools import partial
+    from utils import utils
+    transporteur = calculateur.transporteurs["dpd"]
+    poids_max = masse_en_grammes(calculateur.options["POIDS_MAX_COLIS_DPD"])
+    weights = [masse_en_grammes(poids) for poids in transporteur.csv[transporteur.columns_labels[0]]]
+    prices = list(transporteur.csv[transporteur.columns_labels[1]])
+    # Own price function : its memo is cleared before each measure without touching the carrier one
+    tarif = utils.fonction_tarif(weights, prices, poids_max)
+
+    disponibles = {}
+    if "python" in moteurs:
+        disponibles["python"] = (partial(utils.find_best_config, tarif=tarif), tarif.cache_clear)
+    if "c" in moteurs:
+        try:
+            from bin import c
+            c.get_lib()
+            disponibles["c"] = (partial(c.find_best_config, tarif=tarif), None)
+        except Exception as e:
+            logger.warning("C engine not available, skipped : %s", e)
+
+    generateur = random.Random(graine)
+    resultats = {}
+    for n in tailles:
+        elements = masses_aleatoires(n, generateur)
+        partitions = partitions_count(n)
+        for moteur, (find_best_config, avant) in disponibles.items():
+            mesure = mesurer(lambda: find_best_config(list(elements)), repetitions, avant)
+            mesure["engine"] = moteur
+            mesure["articles"] = n
+            mesure["partitions"] = partitions
+            mesure["partitions_per_sec"] = partitions/(mesure["p50_ms"]/1000) if mesure["p50_ms"] > 0 else None
+            resultats[f"{moteur}/n={n}"] = mesure
+            logger.info("engine %-6s n=%2s : p50 %.3f ms, %.3g partitions/s", moteur, n, mesure["p50_ms"], mesure["partitions_per_sec"] or 0)
+    return resultats
+
+
+def bench_transporteurs(calculateur, tailles, repetitions, graine):
+    """ calculer_tarif of each carrier on realistic carts (compacted like the UI does) """
+    articles = charger_articles()
+    generateur = random.Random(graine)
+    departements = [d for d in calculateur.lister_departements() if d.isdigit()]
+    # Lazy grids and price surfaces are built once here, not inside the first measured call
+    for transporteur in calculateur.transporteurs.values():
+        transporteur.prechauffer()
+    resultats = {}
+    for n in tailles:
+        panier = calculateur.compact_shopping_cart(panier_realiste(articles, n, generateur))
+        options = {"departement": generateur.choice(departements), "country": "france"}
+        for nom, transporteur in calculateur.transporteurs.items():
+            mesure = mesurer(lambda: transporteur.calculer_tarif(panier, options), repetitions)
+            mesure["articles"] = n
+            mesure["articles_compactes"] = len(panier)
+            mesure["departement"] = options["departement"]
+            resultats[f"{nom}/n={n}"] = mesure
+            logger.info("carrier %-20s n=%3s : p50 %.3f ms", nom, n, mesure["p50_ms"])
+    return resultats
+
+
+def comparer(rapport, reference, tolerance):
+    """ Cases whose p50 latency exceeds the baseline by more than tolerance """
+    regressions = []
+    for suite in ("engines", "carriers"):
+        for cas, mesure in rapport.get(suite, {}).items():
+            base = reference.get(suite, {}).get(cas)
+            if base is None or base["p50_ms"] < SEUIL_BRUIT_MS:
+                continue
+            ratio = mesure["p50_ms"]/base["p50_ms"]
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    "case": f"{suite}/{cas}",
+                    "baseline_p50_ms": base["p50_ms"],
+                    "p50_ms": mesure["p50_ms"],
+                    "ratio": ratio,
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the partition optimizers and of the carriers")
+    parser.add_argument("--max-articles", type=int, default=9, help="engines are measured on carts of 1..N articles")
+    parser.add_argument("--tailles-paniers", type=int, nargs="+", default=[1, 5, 10, 20, 50], help="realistic cart sizes for the carriers")
+    parser.add_argument("--moteurs", nargs="+", default=["python", "c"], choices=["python", "c"])
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--graine", type=int, default=2025, help="random seed of the generated carts")
+    parser.add_argument("--output", help="JSON report file, stdout when omitted")
+    parser.add_argument("--baseline", help="fail when a p50 latency regresses beyond this stored report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown versus the baseline (0.25 = +25%%)")
+    parser.add_argument("--save-baseline", help="also write the report as the new baseline")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stderr)
+    # Partitions with a colis over the max weight are expected by the enumeration, not worth a warning each
+    logging.getLogger("utils.utils").setLevel(logging.ERROR)
+    logging.getLogger("models.transporteurs").setLevel(logging.WARNING)
+    from calculateur import CalculateurFraisLivraison
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0})
+
+    rapport = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "engines": bench_moteurs(calculateur, range(1, args.max_articles+1), args.repetitions, args.graine, args.moteurs),
+        "carriers": bench_transporteurs(calculateur, args.tailles_paniers, args.repetitions, args.graine),
+    }
+    # Calibrated at the carriers warm up, the report can be given back as CALIBRATION_COUT_PATH
+    rapport["cost_model"] = calculateur.transporteurs["dpd"].get_modele_cout().to_dict()
+
+    code_retour = 0
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                reference = json.load(f)
+            rapport["regressions"] = comparer(rapport, reference, args.tolerance)
+            for regression in rapport["regressions"]:
+                logger.error("Regression %s : %.3f ms -> %.3f ms (x%.2f)", regression["case"],
+                             regression["baseline_p50_ms"], regression["p50_ms"], regression["ratio"])
+            code_retour = 1 if rapport["regressions"] else 0
+        except FileNotFoundError:
+            logger.warning("Baseline %s not found, no comparison", args.baseline)
+
+    texte = json.dumps(rapport, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(texte)
+    else:
+        print(texte)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(texte)
+    return code_retour
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,25 +9,37 @@ The optimizer finds the optimal way to partition a set of elements into subsets
 based on predefined weights and prices, typically used for optimizing shipping
 or packaging configurations.
 
+Masses are integer grams (int32 on the C side), prices are euros.
+
 Example:
-    >>> weights = [1.0, 2.0, 3.0, 4.0, 5.0]
+    >>> weights = [1000, 2000, 3000, 4000, 5000]
     >>> prices = [10.0, 15.0, 20.0, 25.0, 30.0]
-    >>> set_new_tarif(weights, prices, max_weight=10.0)
-    >>> elements = [1.5, 2.5, 3.5]
+    >>> set_new_tarif(weights, prices, max_weight=10000)
+    >>> elements = [1500, 2500, 3500]
     >>> result = find_best_config(elements)
     >>> print(f"Best price: {result['price']}")
     >>> print(f"Configuration: {result['config']}")
 """
 
 import ctypes
-import numpy as np
+import hashlib
+import logging
 from pathlib import Path
 import sys 
 import os
+import threading
+from utils.timing import DEMARRAGE
+from utils.progression import EtatProgression
+
+logger = logging.getLogger(__name__)
 
 # Compile the C code into a shared library
 import subprocess
 
+# Optimized build, the cached library is keyed on the source and on these flags
+COMPILER = 'gcc'
+COMPILER_FLAGS = ['-O3', '-fPIC', '-shared']
+
 def get_base_path():
     # Check if running as PyInstaller executable
     if getattr(sys, 'frozen', False):
@@ -38,36 +50,76 @@ def get_base_path():
         # When running as standard Python script
         return os.path.dirname(os.path.abspath(__file__))
 
+def get_cache_path():
+    """
+    Directory where compiled libraries are cached between runs.
+    Can be overridden with the MAGE_CACHE_DIR environment variable.
+    """
+    if os.environ.get('MAGE_CACHE_DIR'):
+        return os.environ['MAGE_CACHE_DIR']
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        root = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'calculateur-transport-mage', 'bin')
+
+def get_library_key(source_file):
+    """ Hash of the C source, the compiler and its flags """
+    key = hashlib.sha256()
+    with open(source_file, 'rb') as f:
+        key.update(f.read())
+    key.update(" ".join([COMPILER] + COMPILER_FLAGS).encode())
+    return key.hexdigest()[:16]
+
 def compile_c_library():
+    """
+    Returns (success, path) of the compiled partition optimizer.
+    The library is only compiled when no cached build matches the current source and flags,
+    later imports load the cached artifact directly.
+    """
     base_path = get_base_path()
     
     source_file = os.path.join(base_path, 'partition_optimizer.c')
-    output_file = os.path.join(base_path, 'libpartition_optimizer.so')
-    
+    precompiled_file = os.path.join(base_path, 'libpartition_optimizer.so')
+    if not Path(source_file).is_file():
+        if Path(precompiled_file).is_file():
+            return True, precompiled_file
+        raise FileNotFoundError(f"[ERROR] No C source {source_file} and no precompiled library found")
+
+    cache_path = get_cache_path()
+    output_file = os.path.join(cache_path, f'libpartition_optimizer-{get_library_key(source_file)}.so')
+    if Path(output_file).is_file():
+        return True, output_file
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+    except OSError as e:
+        logger.warning("Cannot create cache directory %s (%s), compiling next to the sources", cache_path, e)
+        output_file = precompiled_file
+
+    # Build under a temporary name then rename : concurrent processes never load a partial file
+    build_file = f"{output_file}.{os.getpid()}.tmp"
     try:
         result = subprocess.run(
-            ['gcc', '-fPIC', '-shared', '-o', output_file, source_file],
+            [COMPILER] + COMPILER_FLAGS + ['-o', build_file, source_file],
             capture_output=True,
             text=True,
             check=True  # This will raise CalledProcessError if gcc fails
         )
+        os.replace(build_file, output_file)
         return True, output_file
     except subprocess.CalledProcessError as e:
-        print(f"GCC compilation failed with error:\n{e.stderr}")
+        logger.error("GCC compilation failed with error:\n%s", e.stderr)
+        if Path(precompiled_file).is_file():
+            logger.warning("Continuing with already compiled library %s", precompiled_file)
+            return True, precompiled_file
         return False,None
     except FileNotFoundError:
-        print("[WARNING] GCC compiler not found. Please ensure GCC is installed and in PATH")
-        if Path(output_file).is_file():
-            print(f"[WARNING] Continuing with already compiled library {output_file}")
-            return True, output_file
+        logger.warning("GCC compiler not found. Please ensure GCC is installed and in PATH")
+        if Path(precompiled_file).is_file():
+            logger.warning("Continuing with already compiled library %s", precompiled_file)
+            return True, precompiled_file
         else:
             raise FileNotFoundError("[ERROR] GCC not found and not precompiled library found")
-# Load the compiled library from the bin directory
-#Std exec 
-
-result,lib = compile_c_library()
-lib = ctypes.CDLL(str(lib))
-
 
 class OptimizationResult(ctypes.Structure):
     """
@@ -78,28 +130,81 @@ class OptimizationResult(ctypes.Structure):
         num_subsets (int): Number of subsets in the optimal partition
         subsets (pointer): Pointer to array of arrays containing the elements
         subset_sizes (pointer): Pointer to array containing size of each subset
+        partitions_evaluated (int): Number of partitions priced during the search
     """
     _fields_ = [
         ("price", ctypes.c_double),
         ("num_subsets", ctypes.c_int),
-        ("subsets", ctypes.POINTER(ctypes.POINTER(ctypes.c_double))),
-        ("subset_sizes", ctypes.POINTER(ctypes.c_int))
+        ("subsets", ctypes.POINTER(ctypes.POINTER(ctypes.c_int))),
+        ("subset_sizes", ctypes.POINTER(ctypes.c_int)),
+        ("partitions_evaluated", ctypes.c_longlong)
     ]
 
-# Define C function signatures for type checking
-lib.set_new_tarif.argtypes = [
-    np.ctypeslib.ndpointer(dtype=np.float64),  # weights array
-    np.ctypeslib.ndpointer(dtype=np.float64),  # prices array
-    ctypes.c_int  # array length
-]
+# The library is compiled (when not cached) and loaded on first use, not at import
+lib = None
+_lib_lock = threading.Lock()
+
+def get_lib():
+    """
+    Load the compiled library from the cache directory, building it if needed.
+    
+    Returns:
+        ctypes.CDLL: the partition optimizer library with its function signatures set
+    """
+    global lib
+    if lib is None:
+        with _lib_lock:
+            if lib is None:
+                with DEMARRAGE.mesurer("bin.c : load C library"):
+                    lib = _load_library()
+    return lib
+
+def _load_library():
+    import numpy as np
+    result, library_file = compile_c_library()
+    if not result:
+        raise RuntimeError("[ERROR] Partition optimizer library could not be built")
+    c_lib = ctypes.CDLL(str(library_file))
 
-lib.find_best_config.argtypes = [
-    np.ctypeslib.ndpointer(dtype=np.float64),  # elements array
-    ctypes.c_int  # array length
-]
-lib.find_best_config.restype = ctypes.POINTER(OptimizationResult)
+    # Define C function signatures for type checking
+    c_lib.set_new_tarif.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.int32),  # weights array (g)
+        np.ctypeslib.ndpointer(dtype=np.float64),  # prices array
+        ctypes.c_int  # array length
+    ]
 
-lib.cleanup_result.argtypes = [ctypes.POINTER(OptimizationResult)]
+    c_lib.find_best_config.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.int32),  # elements array (g)
+        ctypes.c_int  # array length
+    ]
+    c_lib.find_best_config.restype = ctypes.POINTER(OptimizationResult)
+
+    c_lib.find_best_config_tarif.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.int32),  # elements array (g)
+        ctypes.c_int,  # array length
+        np.ctypeslib.ndpointer(dtype=np.int32),  # weights array (g)
+        np.ctypeslib.ndpointer(dtype=np.float64),  # prices array
+        ctypes.c_int,  # grid length
+        ctypes.POINTER(ctypes.c_int),  # cancellation flag, NULL when not cancellable
+        ctypes.POINTER(EtatProgression)  # progress counters, NULL when not followed
+    ]
+    c_lib.find_best_config_tarif.restype = ctypes.POINTER(OptimizationResult)
+
+    c_lib.find_best_configs_tarifs.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.int32),  # elements array (g)
+        ctypes.c_int,  # array length
+        ctypes.c_int,  # number of grids
+        np.ctypeslib.ndpointer(dtype=np.int32),  # weights of every grid, one after the other (g)
+        np.ctypeslib.ndpointer(dtype=np.float64),  # prices of every grid
+        np.ctypeslib.ndpointer(dtype=np.int32),  # start of each grid, number of grids + 1 entries
+        ctypes.POINTER(ctypes.c_int),  # cancellation flag, NULL when not cancellable
+        ctypes.POINTER(EtatProgression)  # progress counters (first grid), NULL when not followed
+    ]
+    c_lib.find_best_configs_tarifs.restype = ctypes.POINTER(ctypes.POINTER(OptimizationResult))
+
+    c_lib.cleanup_result.argtypes = [ctypes.POINTER(OptimizationResult)]
+    c_lib.cleanup_results.argtypes = [ctypes.POINTER(ctypes.POINTER(OptimizationResult)), ctypes.c_int]
+    return c_lib
 
 def convert_result_to_python(c_result):
     """
@@ -112,6 +217,7 @@ def convert_result_to_python(c_result):
         dict: Dictionary containing:
             - 'price': float, total price of the configuration
             - 'config': list of lists, each sublist represents a subset of elements
+            - 'partitions': int, number of partitions evaluated
             
     Returns None if c_result is NULL.
     """
@@ -120,7 +226,8 @@ def convert_result_to_python(c_result):
     
     result = {
         'price': c_result.contents.price,
-        'config': []
+        'config': [],
+        'partitions': c_result.contents.partitions_evaluated
     }
     
     # Convert C arrays of subsets to Python lists
@@ -137,9 +244,9 @@ def set_new_tarif(new_weights, new_prices, max_weight):
     Set new weight-price combinations for the optimization algorithm.
     
     Args:
-        new_weights (list[float]): List of weights for different configurations
+        new_weights (list[int]): List of weights (g) for different configurations
         new_prices (list[float]): List of prices corresponding to the weights
-        max_weight (float): Maximum allowed weight per subset
+        max_weight (int): Maximum allowed weight per subset (g)
         
     Notes:
         - Lists must be of equal length
@@ -149,26 +256,31 @@ def set_new_tarif(new_weights, new_prices, max_weight):
     Raises:
         ValueError: If input lists have different lengths
     """
+    import numpy as np
     if len(new_weights) != len(new_prices):
         raise ValueError("Weights and prices lists must have the same length")
     
-    # Set price to infinity for configurations exceeding max weight
-    for i in range(len(new_weights)):
-        if new_weights[i] > max_weight:
-            new_prices[i] = float('inf')
+    # Set price to infinity for configurations exceeding max weight (on a copy, new_prices is left as is)
+    new_prices = [float('inf') if poids > max_weight else prix for poids, prix in zip(new_weights, new_prices)]
     
-    lib.set_new_tarif(
-        np.array(new_weights, dtype=np.float64),
+    get_lib().set_new_tarif(
+        np.array(new_weights, dtype=np.int32),
         np.array(new_prices, dtype=np.float64),
         len(new_weights)
     )
 
-def find_best_config(elements):
+def find_best_config(elements, tarif=None, annulation=None, progression=None):
     """
     Find the optimal partition configuration for a given set of elements.
     
     Args:
-        elements (list[float]): List of element weights to be partitioned
+        elements (list[int]): List of element weights (g) to be partitioned
+        tarif: price function of utils.utils.fonction_tarif, its grid (weights, prices) is given
+            to the C search : no shared state, concurrent calls are safe. Default the grid of set_new_tarif
+        annulation (utils.annulation.Annulation): polled by the C loop (with tarif only), the search
+            stops and frees its memory within milliseconds of annuler()
+        progression (utils.progression.Progression): partitions explored and best price so far,
+            written by the C loop every 1024 partitions (with tarif only)
         
     Returns:
         dict: Dictionary containing:
@@ -176,32 +288,95 @@ def find_best_config(elements):
             - 'config': list of lists, each sublist contains the elements in one subset
             
     Raises:
+        CalculationCancelled: If annulation was cancelled during the search
         RuntimeError: If the optimization fails
         ValueError: If elements list is empty
     """
+    import numpy as np
     if not elements:
         raise ValueError("Elements list cannot be empty")
     
-    elements_arr = np.array(elements, dtype=np.float64)
-    c_result = lib.find_best_config(elements_arr, len(elements))
+    c_lib = get_lib()
+    elements_arr = np.array(elements, dtype=np.int32)
+    if tarif is None:
+        c_result = c_lib.find_best_config(elements_arr, len(elements))
+    else:
+        c_result = c_lib.find_best_config_tarif(
+            elements_arr,
+            len(elements),
+            np.array(tarif.weights, dtype=np.int32),
+            np.array(tarif.prices, dtype=np.float64),
+            len(tarif.weights),
+            ctypes.byref(annulation.drapeau) if annulation is not None else None,
+            ctypes.byref(progression.etat) if progression is not None else None
+        )
     
     if not c_result:
+        if annulation is not None:
+            annulation.verifier()
         raise RuntimeError("Optimization failed")
     
     # Convert C result to Python format
     result = convert_result_to_python(c_result)
     
     # Clean up C memory
-    lib.cleanup_result(c_result)
+    c_lib.cleanup_result(c_result)
     
     return result
 
+def find_best_configs(elements, tarifs, annulation=None, progression=None):
+    """
+    Optimal partition of elements for each of several tariffs, in a single enumeration :
+    every partition is priced with all the grids (what-if quotes for about the cost of one).
+
+    Args:
+        elements (list[int]): List of element weights (g) to be partitioned
+        tarifs (list): price functions of utils.utils.fonction_tarif, their grids are given to the C search
+        annulation (utils.annulation.Annulation): polled by the C loop
+        progression (utils.progression.Progression): partitions explored, best price of the first tariff
+
+    Returns:
+        list[dict]: one result per tariff, like find_best_config
+
+    Raises:
+        CalculationCancelled: If annulation was cancelled during the search
+        RuntimeError: If the optimization fails
+        ValueError: If elements or tarifs is empty
+    """
+    import numpy as np
+    if not elements:
+        raise ValueError("Elements list cannot be empty")
+    if not tarifs:
+        raise ValueError("Tarifs list cannot be empty")
+
+    c_lib = get_lib()
+    offsets = np.cumsum([0] + [len(tarif.weights) for tarif in tarifs], dtype=np.int32)
+    c_results = c_lib.find_best_configs_tarifs(
+        np.array(elements, dtype=np.int32),
+        len(elements),
+        len(tarifs),
+        np.array([poids for tarif in tarifs for poids in tarif.weights], dtype=np.int32),
+        np.array([prix for tarif in tarifs for prix in tarif.prices], dtype=np.float64),
+        offsets,
+        ctypes.byref(annulation.drapeau) if annulation is not None else None,
+        ctypes.byref(progression.etat) if progression is not None else None
+    )
+
+    if not c_results:
+        if annulation is not None:
+            annulation.verifier()
+        raise RuntimeError("Optimization failed")
+
+    results = [convert_result_to_python(c_results[rang]) for rang in range(len(tarifs))]
+    c_lib.cleanup_results(c_results, len(tarifs))
+    return results
+
 # Example usage (commented out)
-# weights = [1.0, 2.0, 3.0, 4.0, 5.0]
+# weights = [1000, 2000, 3000, 4000, 5000]
 # prices = [10.0, 15.0, 20.0, 25.0, 30.0]
-# set_new_tarif(weights, prices, max_weight=10.0)
+# set_new_tarif(weights, prices, max_weight=10000)
 # 
-# elements = [1.5, 2.5, 3.5]
+# elements = [1500, 2500, 3500]
 # result = find_best_config(elements)
 # print(f"Best price: {result['price']}")
 # print(f"Configuration: {result['config']}")
\ No newline at end of file
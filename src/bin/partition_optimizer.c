@@ -3,25 +3,19 @@
 #include <float.h>
 #include <string.h>
 
-// Global variables
-double* weights = NULL;
+// Grid of set_new_tarif / find_best_config : masses are integer grams, prices euros.
+// find_best_config_tarif takes its grid as arguments and can run in several threads at once.
+int* weights = NULL;
 double* prices = NULL;
 int weights_length = 0;
 
-// Structure to store partition
-typedef struct Partition {
-    double** subsets;
-    int* subset_sizes;
-    int num_subsets;
-    struct Partition* next;  // For linked list implementation
-} Partition;
-
 // Structure to store the result
 typedef struct {
     double price;
     int num_subsets;
-    double** subsets;
+    int** subsets;
     int* subset_sizes;
+    long long partitions_evaluated;
 } OptimizationResult;
 
 // Function to free allocated memory
@@ -33,11 +27,11 @@ void cleanup() {
 }
 
 // Function to set new tariffs
-void set_new_tarif(double* new_weights, double* new_prices, int length) {
+void set_new_tarif(int* new_weights, double* new_prices, int length) {
     cleanup();
     
     weights_length = length;
-    weights = (double*)malloc(length * sizeof(double));
+    weights = (int*)malloc(length * sizeof(int));
     prices = (double*)malloc(length * sizeof(double));
     
     if (weights == NULL || prices == NULL) {
@@ -45,18 +39,18 @@ void set_new_tarif(double* new_weights, double* new_prices, int length) {
         exit(1);
     }
     
-    memcpy(weights, new_weights, length * sizeof(double));
+    memcpy(weights, new_weights, length * sizeof(int));
     memcpy(prices, new_prices, length * sizeof(double));
 }
 
 // Binary search implementation
-int binary_search_right(double value) {
+int binary_search_right(const int* grid_weights, int length, long long value) {
     int left = 0;
-    int right = weights_length;
+    int right = length;
     
     while (left < right) {
         int mid = (left + right) / 2;
-        if (weights[mid] <= value)
+        if (grid_weights[mid] <= value)
             left = mid + 1;
         else
             right = mid;
@@ -65,166 +59,121 @@ int binary_search_right(double value) {
 }
 
 // Tarif par masse implementation
-double tarif_par_masse(double masse) {
-    if (masse <= weights[weights_length - 1]) {
-        return prices[binary_search_right(masse)];
-    } else {
-        return prices[weights_length];
+double tarif_par_masse(const int* grid_weights, const double* grid_prices, int length, long long masse) {
+    // Masses at or above the last weight use the last price (never read past the array)
+    int index = binary_search_right(grid_weights, length, masse);
+    if (index >= length) {
+        index = length - 1;
     }
+    return grid_prices[index];
 }
 
-// Helper function to calculate sum of a subset
-double sum_subset(double* subset, int size) {
-    double sum = 0;
-    for (int i = 0; i < size; i++) {
-        sum += subset[i];
-    }
-    return sum;
+// Cancellation flag set by the caller from another thread, NULL when the search cannot be cancelled
+int is_cancelled(volatile const int* cancelled) {
+    return cancelled != NULL && *cancelled;
 }
 
-// Function to create a deep copy of a partition
-Partition* copy_partition(Partition* orig) {
-    if (!orig) return NULL;
-    
-    Partition* copy = (Partition*)malloc(sizeof(Partition));
-    copy->num_subsets = orig->num_subsets;
-    copy->subsets = (double**)malloc(orig->num_subsets * sizeof(double*));
-    copy->subset_sizes = (int*)malloc(orig->num_subsets * sizeof(int));
-    copy->next = NULL;
-    
-    for (int i = 0; i < orig->num_subsets; i++) {
-        copy->subset_sizes[i] = orig->subset_sizes[i];
-        copy->subsets[i] = (double*)malloc(copy->subset_sizes[i] * sizeof(double));
-        memcpy(copy->subsets[i], orig->subsets[i], copy->subset_sizes[i] * sizeof(double));
-    }
-    
-    return copy;
-}
+// Progress published to the caller, read from another thread without lock (one poll behind at most).
+// NULL when nobody follows the search.
+typedef struct {
+    long long partitions_evaluated;
+    double best_price;
+} SearchProgress;
 
-// Function to free a partition
-void free_partition(Partition* p) {
-    if (!p) return;
-    
-    for (int i = 0; i < p->num_subsets; i++) {
-        free(p->subsets[i]);
-    }
-    free(p->subsets);
-    free(p->subset_sizes);
-    free(p);
-}
+// State of one search : the partition being built, its price with each grid and, for each grid,
+// the best partition so far. O(n x grids) memory
+typedef struct {
+    const int* elements;
+    int size;
+    int num_grids;
+    const int* grid_weights;    // the grids one after the other
+    const double* grid_prices;
+    const int* grid_offsets;    // grid g : entries grid_offsets[g] to grid_offsets[g + 1] - 1
+    volatile const int* cancelled;
+    volatile SearchProgress* progress;
+    int* assignment;            // element -> subset of the current partition
+    long long* sums;            // subset -> mass of the current partition
+    double* subset_prices;      // grid g : subset_prices[g * size + subset], price of each subset
+    double* totals;             // grid g : price of the current partition
+    double* saved;              // element -> (subset price, total) of each grid before it was placed
+    double* tables;             // grid g : tables[g * table_length + mass], price of every mass in grams
+    long long table_length;     // heavier masses have the price of the last entry
+    int* best_assignments;      // grid g : best_assignments[g * size ...]
+    int* best_num_subsets;
+    double* best_prices;
+    long long partitions_evaluated;
+    int stopped;
+} Search;
 
-// Function to add element to existing subset
-Partition* add_to_subset(Partition* orig, int subset_idx, double element) {
-    Partition* new_part = copy_partition(orig);
-    if (!new_part) return NULL;
-    
-    // Reallocate the target subset
-    double* new_subset = (double*)malloc((new_part->subset_sizes[subset_idx] + 1) * sizeof(double));
-    memcpy(new_subset, new_part->subsets[subset_idx], new_part->subset_sizes[subset_idx] * sizeof(double));
-    new_subset[new_part->subset_sizes[subset_idx]] = element;
-    
-    free(new_part->subsets[subset_idx]);
-    new_part->subsets[subset_idx] = new_subset;
-    new_part->subset_sizes[subset_idx]++;
-    
-    return new_part;
+// Prices subset i again with every grid after element index was added to it
+static inline void price_subset(Search* s, int index, int i) {
+    double* saved = s->saved + 2 * index * s->num_grids;
+    for (int g = 0; g < s->num_grids; g++) {
+        double* subset_price = s->subset_prices + g * s->size + i;
+        long long masse = s->sums[i] < s->table_length ? s->sums[i] : s->table_length - 1;
+        double price = s->tables[g * s->table_length + masse];
+        saved[2 * g] = *subset_price;
+        saved[2 * g + 1] = s->totals[g];
+        s->totals[g] += price - *subset_price;
+        *subset_price = price;
+    }
 }
 
-// Function to add new subset with single element
-Partition* add_new_subset(Partition* orig, double element) {
-    Partition* new_part = (Partition*)malloc(sizeof(Partition));
-    if (!orig) {
-        // Create first partition
-        new_part->num_subsets = 1;
-        new_part->subsets = (double**)malloc(sizeof(double*));
-        new_part->subset_sizes = (int*)malloc(sizeof(int));
-        new_part->subsets[0] = (double*)malloc(sizeof(double));
-        new_part->subsets[0][0] = element;
-        new_part->subset_sizes[0] = 1;
-        new_part->next = NULL;
-        return new_part;
+// Exact prices before element index was added to subset i (no rounding drift along the search)
+static inline void unprice_subset(Search* s, int index, int i) {
+    const double* saved = s->saved + 2 * index * s->num_grids;
+    for (int g = 0; g < s->num_grids; g++) {
+        s->subset_prices[g * s->size + i] = saved[2 * g];
+        s->totals[g] = saved[2 * g + 1];
     }
-    
-    new_part->num_subsets = orig->num_subsets + 1;
-    new_part->subsets = (double**)malloc(new_part->num_subsets * sizeof(double*));
-    new_part->subset_sizes = (int*)malloc(new_part->num_subsets * sizeof(int));
-    
-    // Copy existing subsets
-    for (int i = 0; i < orig->num_subsets; i++) {
-        new_part->subset_sizes[i] = orig->subset_sizes[i];
-        new_part->subsets[i] = (double*)malloc(orig->subset_sizes[i] * sizeof(double));
-        memcpy(new_part->subsets[i], orig->subsets[i], orig->subset_sizes[i] * sizeof(double));
-    }
-    
-    // Add new subset with the element
-    new_part->subsets[new_part->num_subsets - 1] = (double*)malloc(sizeof(double));
-    new_part->subsets[new_part->num_subsets - 1][0] = element;
-    new_part->subset_sizes[new_part->num_subsets - 1] = 1;
-    new_part->next = NULL;
-    
-    return new_part;
 }
 
-// Recursive function to generate all partitions
-Partition* generate_partitions(double* elements, int size, int start_idx) {
-    if (start_idx >= size) {
-        return NULL;
-    }
-    
-    if (start_idx == size - 1) {
-        // Base case: single element partition
-        return add_new_subset(NULL, elements[start_idx]);
+// Enumerates every partition once, without storing them : the elements are placed from the last one
+// to the first, each into every existing subset then into a new one (the order of the former
+// list based generation, so ties keep resolving to the same partition).
+// The price of the partition is kept up to date for every grid as the elements are placed :
+// a partition costs one comparison per grid, K tariffs for about the cost of one enumeration.
+void search_partitions(Search* s, int index, int num_subsets) {
+    if (s->stopped) {
+        return;
     }
-    
-    // Get partitions of remaining elements
-    Partition* rest_parts = generate_partitions(elements, size, start_idx + 1);
-    if (!rest_parts) {
-        return add_new_subset(NULL, elements[start_idx]);
-    }
-    
-    Partition* head = NULL;
-    Partition* current = NULL;
-    
-    // For each existing partition
-    Partition* rest_current = rest_parts;
-    while (rest_current) {
-        // Add to each existing subset
-        for (int i = 0; i < rest_current->num_subsets; i++) {
-            Partition* new_part = add_to_subset(rest_current, i, elements[start_idx]);
-            if (new_part) {
-                if (!head) {
-                    head = new_part;
-                    current = head;
-                } else {
-                    current->next = new_part;
-                    current = new_part;
-                }
+    if (index < 0) {
+        // Polled every 1024 partitions : a cancelled search stops within microseconds
+        if ((s->partitions_evaluated & 1023) == 0) {
+            if (is_cancelled(s->cancelled)) {
+                s->stopped = 1;
+                return;
+            }
+            if (s->progress != NULL) {
+                s->progress->partitions_evaluated = s->partitions_evaluated;
+                s->progress->best_price = s->best_prices[0];
             }
         }
-        
-        // Add as new subset
-        Partition* new_part = add_new_subset(rest_current, elements[start_idx]);
-        if (new_part) {
-            if (!head) {
-                head = new_part;
-                current = head;
-            } else {
-                current->next = new_part;
-                current = new_part;
+        s->partitions_evaluated++;
+        for (int g = 0; g < s->num_grids; g++) {
+            if (s->totals[g] < s->best_prices[g]) {
+                s->best_prices[g] = s->totals[g];
+                s->best_num_subsets[g] = num_subsets;
+                memcpy(s->best_assignments + g * s->size, s->assignment, s->size * sizeof(int));
             }
         }
-        
-        rest_current = rest_current->next;
+        return;
     }
-    
-    // Free the rest_parts
-    while (rest_parts) {
-        Partition* temp = rest_parts;
-        rest_parts = rest_parts->next;
-        free_partition(temp);
+    int element = s->elements[index];
+    for (int i = 0; i < num_subsets; i++) {
+        s->assignment[index] = i;
+        s->sums[i] += element;
+        price_subset(s, index, i);
+        search_partitions(s, index - 1, num_subsets);
+        unprice_subset(s, index, i);
+        s->sums[i] -= element;
     }
-    
-    return head;
+    s->assignment[index] = num_subsets;
+    s->sums[num_subsets] = element;
+    price_subset(s, index, num_subsets);
+    search_partitions(s, index - 1, num_subsets + 1);
+    unprice_subset(s, index, num_subsets);
+    s->sums[num_subsets] = 0;
 }
 
 // Function to cleanup the result
@@ -239,66 +188,158 @@ void cleanup_result(OptimizationResult* result) {
     }
 }
 
-// Main optimization function
-OptimizationResult* find_best_config(double* elements, int elements_size) {
-    if (elements_size == 0) {
-        OptimizationResult* empty_result = (OptimizationResult*)malloc(sizeof(OptimizationResult));
-        empty_result->price = 0;
-        empty_result->num_subsets = 0;
-        empty_result->subsets = NULL;
-        empty_result->subset_sizes = NULL;
-        return empty_result;
+// Results of find_best_configs_tarifs
+void cleanup_results(OptimizationResult** results, int num_grids) {
+    if (results) {
+        for (int g = 0; g < num_grids; g++) {
+            cleanup_result(results[g]);
+        }
+        free(results);
     }
-    
+}
+
+// Best partition of grid g as a result
+OptimizationResult* build_result(const Search* s, int g) {
     OptimizationResult* result = (OptimizationResult*)malloc(sizeof(OptimizationResult));
-    result->price = DBL_MAX;
+    result->price = s->size == 0 ? 0 : DBL_MAX;
     result->num_subsets = 0;
     result->subsets = NULL;
     result->subset_sizes = NULL;
-    
-    // Generate all possible partitions
-    Partition* all_partitions = generate_partitions(elements, elements_size, 0);
-    
-    // Find the best partition
-    Partition* current = all_partitions;
-    while (current) {
-        double current_price = 0;
-        for (int i = 0; i < current->num_subsets; i++) {
-            current_price += tarif_par_masse(sum_subset(current->subsets[i], current->subset_sizes[i]));
+    result->partitions_evaluated = s->partitions_evaluated;
+    int num_subsets = s->best_num_subsets[g];
+    if (num_subsets > 0) {
+        // Subsets in creation order, elements in the order they were added (last element first)
+        const int* best_assignment = s->best_assignments + g * s->size;
+        result->num_subsets = num_subsets;
+        result->subsets = (int**)malloc(num_subsets * sizeof(int*));
+        result->subset_sizes = (int*)calloc(num_subsets, sizeof(int));
+        for (int i = 0; i < s->size; i++) {
+            result->subset_sizes[best_assignment[i]]++;
         }
-        
-        if (current_price < result->price) {
-            // Free previous best result
-            if (result->subsets) {
-                for (int i = 0; i < result->num_subsets; i++) {
-                    free(result->subsets[i]);
-                }
-                free(result->subsets);
-                free(result->subset_sizes);
-            }
-            
-            // Copy current partition to result
-            result->price = current_price;
-            result->num_subsets = current->num_subsets;
-            result->subsets = (double**)malloc(current->num_subsets * sizeof(double*));
-            result->subset_sizes = (int*)malloc(current->num_subsets * sizeof(int));
-            
-            for (int i = 0; i < current->num_subsets; i++) {
-                result->subset_sizes[i] = current->subset_sizes[i];
-                result->subsets[i] = (double*)malloc(current->subset_sizes[i] * sizeof(double));
-                memcpy(result->subsets[i], current->subsets[i], current->subset_sizes[i] * sizeof(double));
+        for (int k = 0; k < num_subsets; k++) {
+            result->subsets[k] = (int*)malloc(result->subset_sizes[k] * sizeof(int));
+            result->subset_sizes[k] = 0;
+        }
+        long long* sums = (long long*)calloc(num_subsets, sizeof(long long));
+        for (int i = s->size - 1; i >= 0; i--) {
+            int k = best_assignment[i];
+            result->subsets[k][result->subset_sizes[k]++] = s->elements[i];
+            sums[k] += s->elements[i];
+        }
+        // Summed colis by colis like the other engines, not the running total of the search
+        int offset = s->grid_offsets[g];
+        result->price = 0;
+        for (int k = 0; k < num_subsets; k++) {
+            result->price += tarif_par_masse(s->grid_weights + offset, s->grid_prices + offset, s->grid_offsets[g + 1] - offset, sums[k]);
+        }
+        free(sums);
+    }
+    return result;
+}
+
+// Best partition for each of num_grids grids (read only, see Search) in a single enumeration.
+// Returns num_grids results (free with cleanup_results), NULL when *cancelled becomes non zero
+// during the search, all memory freed.
+// *progress (when not NULL) follows the first grid, updated every 1024 partitions and at the end.
+OptimizationResult** find_best_configs_tarifs(int* elements, int elements_size, int num_grids, const int* grid_weights, const double* grid_prices, const int* grid_offsets, volatile const int* cancelled, volatile SearchProgress* progress) {
+    Search s;
+    s.elements = elements;
+    s.size = elements_size;
+    s.num_grids = num_grids;
+    s.grid_weights = grid_weights;
+    s.grid_prices = grid_prices;
+    s.grid_offsets = grid_offsets;
+    s.cancelled = cancelled;
+    s.progress = progress;
+    s.assignment = (int*)malloc((elements_size + 1) * sizeof(int));
+    s.sums = (long long*)calloc(elements_size + 1, sizeof(long long));
+    s.best_assignments = (int*)malloc((num_grids * elements_size + 1) * sizeof(int));
+    s.best_num_subsets = (int*)calloc(num_grids, sizeof(int));
+    s.best_prices = (double*)malloc(num_grids * sizeof(double));
+    s.subset_prices = (double*)calloc(num_grids * elements_size + 1, sizeof(double));
+    s.totals = (double*)calloc(num_grids + 1, sizeof(double));
+    s.saved = (double*)malloc((2 * num_grids * elements_size + 1) * sizeof(double));
+    for (int g = 0; g < num_grids; g++) {
+        s.best_prices[g] = DBL_MAX;
+    }
+    // Dense price tables : one lookup per placed element. Masses from the last grid weight (or the
+    // whole cart) on all have the same price, the tables stop there
+    long long table_length = 0;
+    for (int i = 0; i < elements_size; i++) {
+        table_length += elements[i];
+    }
+    int last_weight = 0;
+    for (int g = 0; g < num_grids; g++) {
+        int length = grid_offsets[g + 1] - grid_offsets[g];
+        if (length > 0 && grid_weights[grid_offsets[g] + length - 1] > last_weight) {
+            last_weight = grid_weights[grid_offsets[g] + length - 1];
+        }
+    }
+    if (table_length > last_weight) {
+        table_length = last_weight;
+    }
+    s.table_length = table_length + 1;
+    s.tables = (double*)malloc(num_grids * s.table_length * sizeof(double));
+    for (int g = 0; g < num_grids; g++) {
+        const int* weights_g = grid_weights + grid_offsets[g];
+        const double* prices_g = grid_prices + grid_offsets[g];
+        int length = grid_offsets[g + 1] - grid_offsets[g];
+        double* table = s.tables + g * s.table_length;
+        // Bracket by bracket, same prices as tarif_par_masse
+        int bracket = 0;
+        for (long long masse = 0; masse < s.table_length; masse++) {
+            while (bracket < length && weights_g[bracket] <= masse) {
+                bracket++;
             }
+            table[masse] = prices_g[bracket < length ? bracket : length - 1];
         }
-        
-        current = current->next;
     }
-    
-    // Free all partitions
-    while (all_partitions) {
-        Partition* temp = all_partitions;
-        all_partitions = all_partitions->next;
-        free_partition(temp);
+    s.partitions_evaluated = 0;
+    s.stopped = 0;
+
+    if (elements_size > 0) {
+        search_partitions(&s, elements_size - 1, 0);
     }
-    
+
+    OptimizationResult** results = NULL;
+    if (!s.stopped) {
+        results = (OptimizationResult**)malloc(num_grids * sizeof(OptimizationResult*));
+        for (int g = 0; g < num_grids; g++) {
+            results[g] = build_result(&s, g);
+        }
+    }
+    if (progress != NULL) {
+        progress->partitions_evaluated = s.partitions_evaluated;
+        progress->best_price = num_grids > 0 ? s.best_prices[0] : DBL_MAX;
+    }
+
+    free(s.assignment);
+    free(s.sums);
+    free(s.best_assignments);
+    free(s.best_num_subsets);
+    free(s.best_prices);
+    free(s.subset_prices);
+    free(s.totals);
+    free(s.saved);
+    free(s.tables);
+    return results;
+}
+
+// Main optimization function, priced with the given grid (read only).
+// Returns NULL when *cancelled becomes non zero during the search, all memory freed.
+// *progress (when not NULL) is updated every 1024 partitions and at the end.
+OptimizationResult* find_best_config_tarif(int* elements, int elements_size, const int* grid_weights, const double* grid_prices, int length, volatile const int* cancelled, volatile SearchProgress* progress) {
+    int grid_offsets[2] = {0, length};
+    OptimizationResult** results = find_best_configs_tarifs(elements, elements_size, 1, grid_weights, grid_prices, grid_offsets, cancelled, progress);
+    if (results == NULL) {
+        return NULL;
+    }
+    OptimizationResult* result = results[0];
+    free(results);
     return result;
-}
\ No newline at end of file
+}
+
+// Optimization priced with the grid of set_new_tarif
+OptimizationResult* find_best_config(int* elements, int elements_size) {
+    return find_best_config_tarif(elements, elements_size, weights, prices, weights_length, NULL, NULL);
+}
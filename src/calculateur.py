@@ -1,9 +1,23 @@
-from collections import Counter
+import copy
+import logging
+import threading
+import time
+from types import MappingProxyType
 from models.transporteurs import Transporteur
+from utils.annulation import verifier
+from utils.cache import CacheTTL
+from utils.progression import Progression
+from utils.timing import Chronometre, compter
+
+logger = logging.getLogger(__name__)
 
 class CalculateurFraisLivraison:
+    """
+    Quotes of every carrier. One instance can serve several threads : options are a frozen snapshot,
+    replaced as a whole by set_options, and each calculation reads a single snapshot.
+    """
     def __init__(self):
-        self.options = {
+        self.options = MappingProxyType({
             "SEUIL_COMPACTAGE" : 2, #kg seuil des groupements d'articles legers 
             "SEUIL_ARTICLE_LEGER" : 1,#kg en dessosus on considere l'article comme leger
             "MAX_POIDS_MESSAGERIE_SCHENKER" : 1000, # kg
@@ -20,9 +34,19 @@ class CalculateurFraisLivraison:
             "SEUIL_PALETTE_SCHENKER_MESSAGERIE" : 200, # kg
             # SEUIL_PALETTE_SCHENKER_MESSAGERIE = 200, # kg
             "SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER" : 100, # kg
-            "SEUIL_WARNING_ITERATIONS" : 10000,
-        }
+            "BUDGET_LATENCE_MS" : 100, # ms, latency target of the DPD optimizer (see models/cost_model.py)
+            "MODE_DPD" : "compactage", # "deux_phases" : exact optimization of the articles above SEUIL_ARTICLE_LEGER, light ones packed afterwards
+            "CALIBRATION_COUT_PATH" : None, # benchmark.py report to calibrate the cost model from, measured at first use when None
+            "PAS_SURFACE_PRIX" : 0.1, # kg resolution of the precomputed palette/messagerie price surfaces
+            "CACHE_DEVIS_TAILLE" : 1024, # quotes kept by calculer, 0 disables the cache
+            "CACHE_DEVIS_TTL_S" : 300, # s, a cached quote older than this is computed again
+            "POOL_WORKERS" : 2, # optimizer worker processes started by demarrer_pool (Qt application)
+            "POOL_SEUIL_MS" : 20, # ms, DPD searches estimated longer than this run in the pool once started
+        })
+        self.cache_devis = CacheTTL(self.options["CACHE_DEVIS_TAILLE"], self.options["CACHE_DEVIS_TTL_S"])
 
+        self.pool = None
+        self._demarrage_pool = None
         self.transporteurs = {
             'dpd': Transporteur(self.options["DPD"], self.options["DPD_PATH"],self.options),
             'schenker_palette': Transporteur(self.options["SCHENKER_PALETTE"], self.options["SCHENKER_PALETTE_PATH"],self.options),
@@ -31,125 +55,230 @@ class CalculateurFraisLivraison:
 
 
     def set_options(self,options):
-        for key,value in options.items():
-            self.options[key] = value
+        # Copy on write : calculations running with the previous snapshot are not affected
+        reglages = dict(self.options)
+        reglages.update(options)
+        self.options = MappingProxyType(reglages)
         for key,trans in self.transporteurs.items():
             trans.set_options(self.options)
+        self.cache_devis.taille = self.options["CACHE_DEVIS_TAILLE"]
+        self.cache_devis.ttl = self.options["CACHE_DEVIS_TTL_S"]
         return 0
 
-    def calculer(self, panier, options):
-        resultats = {}
-        for nom, transporteur in self.transporteurs.items():
-            results_transporteur = transporteur.calculer_tarif(panier, options)
-            resultats[nom] = results_transporteur
+    def demarrer_pool(self, workers=None, attendre=False):
+        """
+        Starts the persistent optimizer pool (models.pool_optimiseurs) of workers (default POOL_WORKERS)
+        processes. The workers are prewarmed in the background : quotes run in process until the pool is ready.
+        """
+        workers = self.options["POOL_WORKERS"] if workers is None else workers
+        if workers <= 0 or self._demarrage_pool is not None:
+            return
+
+        def demarrer():
+            from models.pool_optimiseurs import PoolOptimiseurs
+            dpd = self.transporteurs["dpd"]
+            try:
+                pool = PoolOptimiseurs(workers, [dpd.get_tarif_dpd()])
+            except Exception as e:
+                logger.error("Optimizer pool could not be started, quotes run in process : %s", e)
+                return
+            self.pool = pool
+            for transporteur in self.transporteurs.values():
+                transporteur.pool = pool
+            logger.info("Optimizer pool ready : %s workers", workers)
+
+        self._demarrage_pool = threading.Thread(target=demarrer, name="demarrage-pool", daemon=True)
+        self._demarrage_pool.start()
+        if attendre:
+            self._demarrage_pool.join()
+
+    def arreter_pool(self):
+        """ Stops the optimizer pool, the next quotes run in process """
+        if self._demarrage_pool is not None:
+            self._demarrage_pool.join()
+            self._demarrage_pool = None
+        pool, self.pool = self.pool, None
+        for transporteur in self.transporteurs.values():
+            transporteur.pool = None
+        if pool is not None:
+            pool.arreter()
+
+    def recharger_tarifs(self):
+        """ Reloads the tariff files of every carrier, cached quotes are dropped """
+        for transporteur in self.transporteurs.values():
+            transporteur.recharger_tarifs()
+        self.cache_devis.vider()
+
+    def cle_devis(self, panier, options, reglages=None):
+        """
+        Cache key of a raw quote : canonical cart lines, destination and every calculation option
+        (of the snapshot reglages, default self.options) except the post-hoc ones (margin),
+        applied to the cached raw results.
+        """
+        if reglages is None:
+            reglages = self.options
+        reglages = tuple(sorted(
+            (cle, valeur) for cle, valeur in reglages.items()
+            if not cle.startswith("CACHE_DEVIS") and cle not in Transporteur.OPTIONS_POST_HOC
+        ))
+        return (
+            panier.empreinte(),
+            str(options.get("country", "")).strip().lower(),
+            Transporteur.normaliser_departement(options.get("departement", "")),
+            reglages,
+        )
+
+    def set_verbose(self, verbose, nom=None):
+        """ Enables the trace points of one carrier (nom) or of all of them """
+        for key,trans in self.transporteurs.items():
+            if nom is None or key == nom:
+                trans.set_verbose(verbose)
+
+    def calculer(self, panier, options, chrono=None, annulation=None, progression=None):
+        """
+        :param panier: models.cart.Cart, a list of article dicts is converted once for all the carriers
+        :param chrono: optional utils.timing.Chronometre. When given, each carrier is timed
+                       and the result gets a 'timings' section :
+                       {"etapes_ms", "compteurs", "transporteurs": {nom: {"etapes_ms", "compteurs"}}}
+        :param annulation: optional utils.annulation.Annulation : once cancelled, the running optimizer
+                           stops and models.calculation_errors.CalculationCancelled is raised (nothing cached)
+        :param progression: optional utils.progression.Progression, follows the DPD search from another thread
+        """
+        from models.cart import Cart
+        # Options snapshot of this calculation, every carrier reads the same one
+        reglages = self.options
+        panier = Cart.convertir(panier)
+        cle = self.cle_devis(panier, options, reglages)
+        bruts = self.cache_devis.obtenir(cle)
+        chronos = {}
+        if bruts is not None:
+            compter(chrono, "cache devis hit")
+        else:
+            # Raw results, margin excluded : a margin change is re-priced from the cache
+            bruts = {}
+            for nom, transporteur in self.transporteurs.items():
+                verifier(annulation)
+                if chrono is None:
+                    bruts[nom] = transporteur.calculer_tarif_brut(panier, options, reglages=reglages, annulation=annulation, progression=progression)
+                else:
+                    chronos[nom] = Chronometre()
+                    with chrono.mesurer(f"calculer : {nom}"):
+                        bruts[nom] = transporteur.calculer_tarif_brut(panier, options, chronos[nom], reglages, annulation, progression)
+            self.cache_devis.enregistrer(cle, bruts)
+        # Copy : callers may annotate the result, the cached raw quote stays untouched
+        marge = reglages.get("POURCENTAGE_MAGE", 0)
+        resultats = {nom: self.transporteurs[nom].appliquer_marge(copy.deepcopy(brut), marge) for nom, brut in bruts.items()}
+        if chrono is not None:
+            resultats["timings"] = chrono.resume()
+            resultats["timings"]["transporteurs"] = {nom: c.resume() for nom, c in chronos.items()}
         return resultats
 
+    def prechauffer(self):
+        """ Loads the grids, price surfaces and optimizer calibration of every carrier right away """
+        for transporteur in self.transporteurs.values():
+            transporteur.prechauffer()
+
+    def lister_departements(self):
+        """ Departements known by at least one carrier grid """
+        departements = set()
+        for transporteur in self.transporteurs.values():
+            departements.update(transporteur.index_departements)
+        return sorted(departements)
+
+    def calculer_matrice(self, panier, options):
+        """
+        Prices the cart for every departement in one call.
+        DPD does not depend on the departement : the colis packing is optimized once and
+        copied on every line, palette and messagerie are priced with the vectorized grids.
+
+        :return: dict with 'departements' (lines), 'transporteurs' (columns),
+                 'prix' (numpy array departements x transporteurs, nan when not available)
+                 and 'dpd' (the detailed DPD result with the colis arrangement)
+        """
+        import numpy as np
+        from models.cart import Cart
+        reglages = self.options
+        panier = Cart.convertir(panier)
+        departements = self.lister_departements()
+        masses = np.full(len(departements), panier.masse_totale())
+        noms = list(self.transporteurs)
+        prix = np.full((len(departements), len(noms)), np.nan)
+        resultat_dpd = None
+        for colonne, (nom, transporteur) in enumerate(self.transporteurs.items()):
+            if not transporteur.is_country_available(options["country"]):
+                continue
+            if nom == reglages["DPD"]:
+                options_dpd = dict(options)
+                options_dpd.setdefault('departement', None)
+                resultat_dpd = transporteur.appliquer_marge(transporteur.calculer_tarif_brut(panier, options_dpd, reglages=reglages), reglages.get("POURCENTAGE_MAGE", 0))
+                if resultat_dpd is not None and 'prix' in resultat_dpd:
+                    prix[:, colonne] = resultat_dpd['prix']
+            else:
+                prix[:, colonne] = transporteur.calculer_tarifs_bulk(masses, departements, reglages=reglages)
+        return {
+            "departements": departements,
+            "transporteurs": noms,
+            "prix": prix,
+            "dpd": resultat_dpd,
+        }
+
     def compact_shopping_cart(self,panier):
         """ Tweaking method to reduce calculation time : regroup small articles """
-        light_articles = []
-        panier_sorted = []
-        for article in panier :
-            mass = float(article['poids'])
-            if mass < self.options["SEUIL_ARTICLE_LEGER"]:
-                light_articles.append(article)
-            else :
-                panier_sorted.append(article)
-        current_group = []
-        current_mass = 0
-        light_groups = []
-        for article in light_articles:
-            current_group.append(article['nom'])
-            current_mass += float(article['poids'])
-            if current_mass > self.options["SEUIL_COMPACTAGE"] :
-                counts = Counter(current_group)
-                label = " + ".join([f"{count}x {key}" for key, count in counts.items()])
-                light_groups.append({"nom":label, 'poids':current_mass})
-                current_mass=0
-                current_group=[]
-        if current_mass>0:
-            counts = Counter(current_group)
-            label = " + ".join([f"{count}x {key}" for key, count in counts.items()])
-            light_groups.append({"nom":label, 'poids':current_mass})
-        
-
-        panier = panier_sorted + light_groups
-        print(f'[INFO] Panier compacted : \n {panier}')
+        from models.cart import Cart
+        panier = Cart.convertir(panier)
+        reglages = self.options
+        if reglages.get("MODE_DPD") == "deux_phases":
+            # Light articles are packed by the DPD second phase, merging them beforehand would lose optimality
+            return panier
+        panier = panier.compacter(reglages["SEUIL_ARTICLE_LEGER"], reglages["SEUIL_COMPACTAGE"])
+        logger.debug('Panier compacted : \n %s', panier)
         return panier
-    
-
-
-
-                    
-                    
-# if __name__ == "__main__":
-#     calculateur = CalculateurFraisLivraison()
-#     config = 3
-#     if config==1 :
-#         panier = []
-#         execution_times = []
-#         for i in range(13):
-#             print(f"Number of article : {i}")
-#             panier.append({"nom": f"Article {i}", "poids": i})
-#             execution_time = timeit.timeit(lambda: calculateur.calculer(panier, "75"), number=1)
-#             execution_time = execution_time / 3
-#             execution_times.append(execution_time)
-#         length = np.array(range(9,13))
-#         execution_times = np.array(execution_times[9:])
-#         iterations_count = np.array([partitions_count(i) for i in length])
-#         time_per_iter = execution_times/iterations_count
-#         # Régression
-#         # params = regression_exponentielle(length, execution_times)
-#         # a, b = params
-#         # a = 6.0042e-08
-#         # b= 1.6403e+00
-#         # a =  1.4113e-11
-#         # b = 2.4184e+00
-#         plt.plot(length,time_per_iter,label="measure")
-#         length = np.linspace(length[0],length[-1])
-#         # plt.plot(length, a * np.exp(b * length), 'r-', label=f'Régression: {a:.2f}*exp({b:.2f}x)')
-#         plt.xlabel("taille panier")
-#         plt.ylabel("Exec time par iter")
-#         plt.legend()
-#         # print(f"Équation trouvée: y = {a:.4e} * exp({b:.4e} * x)")
-#         plt.show()
-#         # panier = [
-#         #     {"nom": "Article 1", "poids": 5},
-#         #     {"nom": "Article 2", "poids": 7},
-#         #     {"nom": "Article 3", "poids": 15},
-#         #     {"nom": "Article 4", "poids": 6},
-#         #     {"nom": "Article 5", "poids": 7},
-#         #     {"nom": "Article 6", "poids": 4},
-#         #     {"nom": "Article 7", "poids": 3},
-#         #     {"nom": "Article 8", "poids": 6},
-#         #     {"nom": "Article 9", "poids": 12},
-#         #     {"nom": "Article 10", "poids": 2},
-#         #     {"nom": "Article 11", "poids": 9},
-#         #     # {"nom": "Article 12", "poids": 9},
-#         #     ]
-#         print(f"Execution time: {execution_time:.2f} seconds")
-    
-#     elif config==2:
-#         panier = [
-#             {"nom": "Article 1", "poids": 5},
-#             {"nom": "Article 2", "poids": 10},
-#             {"nom": "Article 3", "poids": 15},
-#             {"nom": "Article 3", "poids": 20},
-#         ]
-#         calculateur.calculer(panier, "75")
-
-#     elif config==3:
-#         panier = [
-#             {"nom": "Article 1", "poids": 5},
-#             {"nom": "Article 2", "poids": 10},
-#             {"nom": "Article 3", "poids": 15},
-#             {"nom": "Article 4", "poids": 20},
-#             {"nom": "Article 5", "poids": 20},
-#             {"nom": "Article 6", "poids": 20},
-#             {"nom": "Article 7", "poids": 20},
-#             {"nom": "Article 8", "poids": 20},
-#             {"nom": "Article 9", "poids": 20},
-#             {"nom": "Article 10", "poids": 20},
-#             {"nom": "Article 11", "poids": 20},
-#             {"nom": "Article 12", "poids": 20},
-#         ]
-#         calculateur.calculer(panier, "75")
\ No newline at end of file
+
+
+# Calculator of the current process when it is a process pool worker (batch.py)
+_calculateur_worker = None
+_progression_worker = None
+# (debut, articles) of the quote running in this worker process, None between quotes
+_devis_worker = None
+# A quote running longer than this (s) has its optimizer progress logged, again at each interval
+INTERVALLE_PROGRESSION_WORKER_S = 5
+
+
+def initialiser_worker(options=None):
+    """ Process pool initializer : one prewarmed calculator per worker process """
+    global _calculateur_worker, _progression_worker
+    _calculateur_worker = CalculateurFraisLivraison()
+    if options:
+        _calculateur_worker.set_options(options)
+    _calculateur_worker.prechauffer()
+    _progression_worker = Progression()
+    threading.Thread(target=_surveiller_progression, name="progression", daemon=True).start()
+
+
+def _surveiller_progression():
+    """ Logs the progress of long quotes (batch, service), the worker itself never waits on it """
+    while True:
+        time.sleep(INTERVALLE_PROGRESSION_WORKER_S)
+        devis = _devis_worker
+        if devis is None or time.perf_counter() - devis[0] < INTERVALLE_PROGRESSION_WORKER_S:
+            continue
+        etat = _progression_worker.instantane()
+        if etat is not None:
+            logger.info("Quote of %s articles running for %.0f s : %s %s/%s %s, best price %s, ETA %s s",
+                        devis[1], time.perf_counter() - devis[0], etat["moteur"], etat["explorees"], etat["total"],
+                        etat["unite"], None if etat["meilleur_prix"] is None else round(etat["meilleur_prix"], 2),
+                        None if etat["eta_s"] is None else round(etat["eta_s"]))
+
+
+def calculer_worker(lignes, options):
+    """ calculer of the worker calculator for the cart of (nom, masse_g, quantite) lines """
+    global _devis_worker
+    from models.cart import Cart
+    if _calculateur_worker is None:
+        initialiser_worker()
+    panier = Cart.depuis_lignes(lignes)
+    _devis_worker = (time.perf_counter(), len(panier))
+    try:
+        return _calculateur_worker.calculer(panier, options, progression=_progression_worker)
+    finally:
+        _devis_worker = None
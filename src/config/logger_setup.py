@@ -1,60 +1,72 @@
+"""
+Logging configuration of the application.
+
+Modules log through their own logger (logging.getLogger(__name__)) with lazy
+%-style arguments : a message below the configured level is never formatted.
+Records are pushed on a queue by the calling thread and written to the log
+file (and the console) by a background thread, so calculations never wait on
+file I/O.
+"""
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 from datetime import datetime
-import os
 
-class PrintToLogger:
-    def __init__(self):
-        self._stdout = sys.stdout
-        self._stderr = sys.stderr
-        
-    def write(self, text):
-        # Skip empty writes
-        if text.strip() == '':
-            # Handle newline writes
-            if '\n' in text:
-                self._stdout.write(text)
-            return
-            
-        # Parse the log level and message for the file logger
-        message = text.strip()
-        if '[ERROR]' in text:
-            logging.error(message[message.index(']')+1:].strip())
-        elif '[WARNING]' in text:
-            logging.warning(message[message.index(']')+1:].strip())
-        elif '[INFO]' in text:
-            logging.info(message[message.index(']')+1:].strip())
-        else:
-            # Default to INFO for prints without level
-            logging.info(message)
-            
-        # Write original text to console exactly as it was
-        self._stdout.write(text)
-        # if not text.endswith('\n'):
-        #     self._stdout.write('\n')
-        
-    def flush(self):
-        self._stdout.flush()
-
-def setup_logging():
+_listener = None
+
+
+def setup_logging(level=None, logs_dir="../logs", console=True):
+    """
+    Call this once at app startup.
+
+    :param level: logging level name or value, defaults to $MAGE_LOG_LEVEL or INFO
+    :param logs_dir: directory of the timestamped log files
+    :param console: also write the records to stdout
+    :return: the QueueListener writing the records
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    if level is None:
+        level = os.environ.get("MAGE_LOG_LEVEL", "INFO")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+
     # Create logs directory if needed
-    logs_dir = "../logs"
     if not os.path.exists(logs_dir):
         os.makedirs(logs_dir)
     
     timestamp = datetime.now().strftime('%Y-%m-%dT_%H-%M-%S')  # Changed this line
     log_file = os.path.join(logs_dir, f"app_{timestamp}.log")
     
-    # Create a logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    
-    # File handler with dates - only file handler gets the formatter
+    # File handler with dates
     file_handler = logging.FileHandler(log_file)
-    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', 
+    file_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s : %(message)s', 
                                      datefmt='%Y-%m-%dT%H:%M:%S')
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
-    
-    # Redirect stdout to our custom logger
-    sys.stdout = PrintToLogger()
\ No newline at end of file
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+        handlers.append(console_handler)
+
+    # The root logger only enqueues, the listener thread does the writing
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """ Flushes the pending records and stops the writer thread """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -2,3 +2,15 @@ class CalculationError(Exception):
     def __init__(self, messsage = "[ERROR] Unknown error happened during calculation"):
         self.message = messsage
         super().__init__(self.message)        
+
+
+class CalculationCancelled(CalculationError):
+    """ Raised by a calculation whose utils.annulation.Annulation was cancelled """
+    def __init__(self, messsage = "[INFO] Calculation cancelled"):
+        super().__init__(messsage)
+
+
+class InvalidQuoteInput(CalculationError, ValueError):
+    """ Raised when the quote input itself is wrong (unknown departement...) : a client error, not a failure """
+    def __init__(self, messsage = "[ERROR] Invalid quote input"):
+        super().__init__(messsage)
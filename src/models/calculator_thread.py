@@ -1,43 +1,110 @@
-from PyQt5.QtCore import QThread, pyqtSignal
-from typing import Dict, List, Any
+import logging
+from concurrent.futures import CancelledError, Future, TimeoutError
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from typing import Dict, Any
+from models.calculation_errors import CalculationCancelled
+from models.cart import Cart
+from utils.annulation import Annulation
+from utils.progression import Progression
+
+logger = logging.getLogger(__name__)
+
+# Seconds a warning waits for the user, then the default answer (No) is taken
+DELAI_REPONSE_WARNING_S = 300
 
 
 class CalculatorThread(QThread):
     finished = pyqtSignal(dict)
     error = pyqtSignal(str)
-    warning = pyqtSignal(str, name='warning')
+    # (message, Future) : the GUI thread answers with future.set_result(bool), the worker is unblocked at once
+    warning = pyqtSignal(str, object, name='warning')
+    # The pending warning timed out, its dialog can be closed
+    warning_expire = pyqtSignal()
+    cancelled = pyqtSignal()
+    # Snapshot of utils.progression.Progression (explorees, total, meilleur_prix, eta_s...)
+    avancement = pyqtSignal(dict)
+    # Emitted last by run, whatever the outcome
+    termine = pyqtSignal()
    
-    def __init__(self, calculator, panier: List[Dict], options: Dict[str, Any]):
+    def __init__(self, calculator, panier: Cart, options: Dict[str, Any], chrono=None, delai_reponse=DELAI_REPONSE_WARNING_S):
         super().__init__()
         self.calculator = calculator
         self.panier = panier
         self.options = options
-        self.should_continue = True
+        self.chrono = chrono
+        # Polled by the optimizers (C loop included), set by annuler
+        self.annulation = Annulation()
+        # Future of the warning waiting for an answer, cancelled by annuler
+        self.question = None
+        self.delai_reponse = delai_reponse
+        # Written by the optimizers without lock, read by the timer below in the GUI thread
+        self.progression = Progression()
+        self.derniere_progression = None
+        self.minuteur = QTimer(self)
+        self.minuteur.setInterval(100)
+        self.minuteur.timeout.connect(self.publier_progression)
+        self.started.connect(self.minuteur.start)
+        self.termine.connect(self.minuteur.stop)
        
         def warning_handler(message):
-            print("Warning handler called with message:", message)
-            self.warning.emit(message)
-            while not hasattr(self, 'warning_response'):
-                self.msleep(100)
-            print("Got warning response:", self.warning_response)
-            response = self.warning_response
-            delattr(self, 'warning_response')
+            logger.info("Warning handler called with message: %s", message)
+            question = Future()
+            self.question = question
+            if self.annulation.annulee:
+                question.cancel()
+            self.warning.emit(message, question)
+            try:
+                response = question.result(timeout=self.delai_reponse)
+            except CancelledError:
+                raise CalculationCancelled()
+            except TimeoutError:
+                if question.cancel():
+                    logger.warning("No answer to warning within %s s, default answer No", self.delai_reponse)
+                    self.warning_expire.emit()
+                    response = False
+                else:
+                    # Answered right at the deadline
+                    response = question.result()
+            finally:
+                self.question = None
+            logger.info("Got warning response: %s", response)
             return response
        
         transporteurs = list(self.calculator.transporteurs.values())
         for transporteur in transporteurs:
             transporteur.set_warning_callback(warning_handler)
    
+    def annuler(self):
+        """ Stops the calculation within milliseconds (from any thread), cancelled is emitted instead of finished """
+        self.annulation.annuler()
+        question = self.question
+        if question is not None:
+            question.cancel()
+
+    def publier_progression(self):
+        """ Emits avancement when the search moved since the last poll """
+        etat = self.progression.instantane()
+        if etat is None:
+            return
+        cle = (etat["moteur"], etat["explorees"])
+        if cle != self.derniere_progression:
+            self.derniere_progression = cle
+            self.avancement.emit(etat)
+
     def run(self):
         try:
-            print("Starting calculation...")
-            results = self.calculator.calculer(self.panier, self.options)
-            print("Calculation finished, results:", results)
+            logger.info("Starting calculation...")
+            results = self.calculator.calculer(self.panier, self.options, self.chrono, self.annulation, self.progression)
+            logger.debug("Calculation finished, results: %s", results)
             if results:  
-                print("Emitting finished signal")
+                logger.debug("Emitting finished signal")
                 self.finished.emit(results)
-                print("Finished signal emitted")
+                logger.debug("Finished signal emitted")
+        except CalculationCancelled:
+            logger.info("Calculation cancelled")
+            self.cancelled.emit()
         except Exception as e:
-            print("Error in calculation:", str(e))
-            print(e.__traceback__())
+            logger.exception("Error in calculation: %s", e)
             self.error.emit(str(e))
+        finally:
+            self.termine.emit()
@@ -0,0 +1,150 @@
+"""
+Shopping cart model shared by the UI, the calculator and the carriers.
+
+A cart holds one line per distinct article (label, mass) with its quantity, instead of
+one dict per unit : 40 units of the same article are a single line. Masses are integer grams.
+
+Example:
+    >>> panier = Cart.depuis_articles([{"nom": "vis", "poids": 0.2}, {"nom": "vis", "poids": 0.2}])
+    >>> len(panier), panier.nombre_lignes, panier.masse_totale()
+    (2, 1, 0.4)
+"""
+import sys
+from collections import Counter
+
+import numpy as np
+
+from utils.utils import GRAMMES_PAR_KG, masse_article_g, masse_en_grammes, masse_en_kg
+
+
+class Cart:
+    """
+    Articles of a cart, array backed :
+        ids        : line -> index of the article label in labels (int32)
+        masses_g   : line -> unit mass in grams (int64)
+        quantites  : line -> number of units (int64)
+        labels     : article names, interned
+    A cart is never modified in place, filtering and compaction return new carts.
+    """
+    __slots__ = ("ids", "masses_g", "quantites", "labels")
+
+    def __init__(self, ids, masses_g, quantites, labels):
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.masses_g = np.asarray(masses_g, dtype=np.int64)
+        self.quantites = np.asarray(quantites, dtype=np.int64)
+        self.labels = labels
+
+    @classmethod
+    def depuis_lignes(cls, lignes):
+        """ Cart from (nom, masse_g, quantite) lines, equal (nom, masse) lines are merged """
+        index_lignes = {}
+        index_labels = {}
+        labels = []
+        ids, masses, quantites = [], [], []
+        for nom, masse_g, quantite in lignes:
+            if quantite <= 0:
+                continue
+            cle = (nom, masse_g)
+            if cle in index_lignes:
+                quantites[index_lignes[cle]] += quantite
+                continue
+            if nom not in index_labels:
+                index_labels[nom] = len(labels)
+                labels.append(sys.intern(str(nom)))
+            index_lignes[cle] = len(ids)
+            ids.append(index_labels[nom])
+            masses.append(masse_g)
+            quantites.append(quantite)
+        return cls(ids, masses, quantites, labels)
+
+    @classmethod
+    def depuis_articles(cls, articles):
+        """ Cart from the legacy list of {'nom', 'poids' (kg)[, 'poids_g', 'quantite']} dicts """
+        return cls.depuis_lignes((article['nom'], masse_article_g(article), article.get('quantite', 1)) for article in articles)
+
+    @classmethod
+    def convertir(cls, panier):
+        """ panier itself when it already is a Cart, else the Cart of a list of article dicts """
+        if isinstance(panier, cls):
+            return panier
+        return cls.depuis_articles(panier)
+
+    def __len__(self):
+        """ Number of units, like the length of the legacy list """
+        return int(self.quantites.sum())
+
+    def __bool__(self):
+        return bool(len(self.ids))
+
+    def __repr__(self):
+        return "Cart(" + ", ".join(f"{quantite}x {nom} {masse} kg" for nom, masse, quantite in self.lignes()) + ")"
+
+    @property
+    def nombre_lignes(self):
+        return len(self.ids)
+
+    def lignes_g(self):
+        """ (nom, unit mass in grams, quantite) of each line """
+        for id_label, masse_g, quantite in zip(self.ids.tolist(), self.masses_g.tolist(), self.quantites.tolist()):
+            yield self.labels[id_label], masse_g, quantite
+
+    def lignes(self):
+        """ (nom, unit mass in kg, quantite) of each line, for display """
+        for nom, masse_g, quantite in self.lignes_g():
+            yield nom, masse_en_kg(masse_g), quantite
+
+    def empreinte(self):
+        """ Canonical (nom, masse_g, quantite) lines : equal for the same articles in any order """
+        return tuple(sorted(self.lignes_g()))
+
+    def masse_totale_g(self):
+        return int(np.dot(self.masses_g, self.quantites))
+
+    def masse_totale(self):
+        """ Total mass in kg """
+        return masse_en_kg(self.masse_totale_g())
+
+    def masse_max_g(self):
+        return int(self.masses_g.max()) if len(self.masses_g) else 0
+
+    def unites(self):
+        """ (masses_g, labels) with one entry per unit, by increasing mass : the optimizers input """
+        ordre = np.argsort(self.masses_g, kind="stable")
+        quantites = self.quantites[ordre]
+        masses = np.repeat(self.masses_g[ordre], quantites).tolist()
+        labels = [self.labels[id_label] for id_label in np.repeat(self.ids[ordre], quantites).tolist()]
+        return masses, labels
+
+    def filtrer(self, masque):
+        """ Cart of the lines where masque (boolean array over the lines) is True """
+        return Cart(self.ids[masque], self.masses_g[masque], self.quantites[masque], self.labels)
+
+    def compacter(self, seuil_leger, seuil_compactage):
+        """
+        Cart where the articles lighter than seuil_leger (kg) are merged into groups, a group
+        closing once heavier than seuil_compactage (kg). Heavy lines are kept as they are.
+        Groups are labelled "2x vis + 1x ecrou", like compact_shopping_cart always did.
+        """
+        legers = self.masses_g < masse_en_grammes(seuil_leger)
+        if not legers.any():
+            return self
+        seuil = seuil_compactage*GRAMMES_PAR_KG
+        groupes = []
+        contenu = Counter()
+        masse_groupe = 0
+        for nom, masse_g, quantite in self.filtrer(legers).lignes_g():
+            while quantite > 0:
+                # Units of this line needed for the group to exceed the threshold, all of them at once
+                besoin = int((seuil - masse_groupe)//masse_g) + 1 if masse_g > 0 else quantite
+                pris = min(max(besoin, 1), quantite)
+                contenu[nom] += pris
+                masse_groupe += pris*masse_g
+                quantite -= pris
+                if masse_groupe > seuil:
+                    groupes.append((contenu, masse_groupe))
+                    contenu, masse_groupe = Counter(), 0
+        if masse_groupe > 0:
+            groupes.append((contenu, masse_groupe))
+        lignes = list(self.filtrer(~legers).lignes_g())
+        lignes += [(" + ".join(f"{count}x {nom}" for nom, count in contenu.items()), masse_g, 1) for contenu, masse_g in groupes]
+        return Cart.depuis_lignes(lignes)
@@ -0,0 +1,212 @@
+"""
+Runtime cost model of the DPD optimizer engines.
+
+Each engine estimates its runtime from the cart size :
+    exact engines  : cout_fixe + cout_unitaire * B(n)   (every partition is priced)
+    heuristique    : cout_fixe + cout_unitaire * n^2
+The per-partition costs are calibrated on this machine the first time a quote needs them
+(a few ms), or loaded from a benchmark report (python benchmark.py --output rapport.json,
+option CALIBRATION_COUT_PATH).
+
+Example:
+    >>> modele = ModeleCout()
+    >>> moteur = modele.choisir(9, budget=0.2)      # fastest exact engine under 200 ms, or None
+    >>> moteur.executer(items, tarif)    # masses in grams, tarif from utils.utils.fonction_tarif
+"""
+import json
+import logging
+import threading
+import time
+
+from utils.utils import partitions_count
+
+logger = logging.getLogger(__name__)
+
+
+class Moteur:
+    """ An optimizer engine and its calibrated cost """
+    def __init__(self, nom, exact, max_articles, cout_fixe, cout_unitaire, charger, n_calibration=None):
+        """
+        :param exact: exact engines enumerate every partition, their cost grows with B(n)
+        :param max_articles: above this size the engine is never used (partitions held in memory, or beyond any budget)
+        :param cout_fixe, cout_unitaire: seconds per call, seconds per partition (or per n^2)
+        :param charger: returns the find function (elements, tarif=..., annulation=..., progression=...) of the engine, imported on first use
+        :param n_calibration: cart size measured to calibrate cout_unitaire
+        """
+        self.nom = nom
+        self.exact = exact
+        self.max_articles = max_articles
+        self.cout_fixe = cout_fixe
+        self.cout_unitaire = cout_unitaire
+        self.charger = charger
+        self.n_calibration = n_calibration
+        self.fonction = None
+        self.disponible = True
+
+    def operations(self, n):
+        return partitions_count(n) if self.exact else n*n
+
+    def estimer(self, n):
+        """ Estimated runtime in seconds for a cart of n items, inf when the engine cannot take it """
+        if not self.disponible or n > self.max_articles:
+            return float('inf')
+        return self.cout_fixe + self.cout_unitaire*self.operations(n)
+
+    def get_fonction(self):
+        if self.fonction is None:
+            try:
+                self.fonction = self.charger()
+            except Exception as e:
+                logger.warning("Optimizer engine %s not available : %s", self.nom, e)
+                self.disponible = False
+                raise
+        return self.fonction
+
+    def executer(self, items, tarif, annulation=None, progression=None):
+        """
+        {"price", "config", "partitions"} of the engine for items, priced with tarif
+        (utils.utils.fonction_tarif). Nothing global is set : concurrent calls are safe.
+        annulation (utils.annulation.Annulation) is polled by the engine, CalculationCancelled when cancelled.
+        progression (utils.progression.Progression) is restarted with the size of the search :
+        B(n) partitions for the exact engines, n articles for the approximate ones.
+        """
+        self.suivre(progression, len(items))
+        return self.get_fonction()(list(items), tarif=tarif, annulation=annulation, progression=progression)
+
+    def suivre(self, progression, n):
+        """ Restarts progression for a search of n items with this engine """
+        if progression is None:
+            return
+        if self.exact:
+            progression.demarrer(self.nom, partitions_count(n), "partitions")
+        else:
+            progression.demarrer(self.nom, n, "articles")
+
+    def to_dict(self):
+        return {
+            "exact": self.exact,
+            "disponible": self.disponible,
+            "max_articles": self.max_articles,
+            "cout_fixe_s": self.cout_fixe,
+            "cout_unitaire_s": self.cout_unitaire,
+        }
+
+
+def _charger_python():
+    from utils.utils import find_best_config
+    return find_best_config
+
+
+def _charger_c():
+    from bin.c import find_best_config
+    return find_best_config
+
+
+def _charger_heuristique():
+    from utils.utils import find_config_heuristique
+    return find_config_heuristique
+
+
+def moteurs_par_defaut():
+    """
+    Registry of the engines, in order of preference at equal estimate.
+    The default costs are rough orders of magnitude, replaced by the calibration.
+    exact_python keeps every partition in memory : B(11) = 678570 partitions is its practical limit.
+    exact_c streams the partitions in O(n) memory : its cap, B(18) ~ 6.8e11 partitions (hours),
+    only spares estimating B(n) for large carts, the calibrated cost decides below it.
+    """
+    return {
+        "exact_c": Moteur("exact_c", True, 18, 1e-5, 1e-6, _charger_c, n_calibration=8),
+        "exact_python": Moteur("exact_python", True, 10, 1e-5, 5e-6, _charger_python, n_calibration=7),
+        "heuristique": Moteur("heuristique", False, 10**6, 1e-5, 2e-6, _charger_heuristique, n_calibration=40),
+    }
+
+
+class ModeleCout:
+    """ Picks the fastest engine meeting a latency budget for a cart of n items """
+    def __init__(self, moteurs=None):
+        self.moteurs = moteurs if moteurs is not None else moteurs_par_defaut()
+        self.calibre = False
+        self._lock = threading.Lock()
+
+    def estimations(self, n):
+        """ {engine: estimated seconds} for a cart of n items """
+        return {nom: moteur.estimer(n) for nom, moteur in self.moteurs.items()}
+
+    def choisir(self, n, budget):
+        """
+        Fastest exact engine whose estimate for n items is within budget (seconds).
+        None when no exact engine fits : the cart has to be compacted, or solved with heuristique().
+        """
+        exacts = [moteur for moteur in self.moteurs.values() if moteur.exact and moteur.estimer(n) <= budget]
+        if not exacts:
+            return None
+        return min(exacts, key=lambda moteur: moteur.estimer(n))
+
+    def heuristique(self):
+        return self.moteurs["heuristique"]
+
+    def max_articles_exacts(self, budget):
+        """ Largest cart size an exact engine solves within budget (seconds) """
+        n = 0
+        while self.choisir(n+1, budget) is not None:
+            n += 1
+        return n
+
+    def assurer_calibration(self, tarif, fichier=None):
+        """ Calibrates once, from the benchmark report fichier when given, else by measuring the engines """
+        if self.calibre:
+            return
+        with self._lock:
+            if self.calibre:
+                return
+            if not (fichier and self.charger_benchmark(fichier)):
+                self.calibrer(tarif)
+            self.calibre = True
+
+    def calibrer(self, tarif, repetitions=3):
+        """ Measures the fixed cost (1 item) and the per-operation cost (n_calibration items) of each engine """
+        for moteur in self.moteurs.values():
+            if not moteur.n_calibration or not moteur.disponible:
+                continue
+            try:
+                moteur.get_fonction()
+            except Exception:
+                continue
+            # Light articles : every colis stays within the grid, like a regular quote
+            items = [500 + (i % 5)*500 for i in range(moteur.n_calibration)]
+            fixe = min(self._mesurer(moteur, items[:1], tarif) for _ in range(repetitions))
+            total = min(self._mesurer(moteur, items, tarif) for _ in range(repetitions))
+            moteur.cout_fixe = fixe
+            moteur.cout_unitaire = max(total - fixe, 0)/moteur.operations(len(items))
+            logger.debug("Cost model %s : %.3g s + %.3g s/operation", moteur.nom, moteur.cout_fixe, moteur.cout_unitaire)
+
+    @staticmethod
+    def _mesurer(moteur, items, tarif):
+        debut = time.perf_counter()
+        moteur.executer(items, tarif)
+        return time.perf_counter() - debut
+
+    def charger_benchmark(self, fichier):
+        """
+        Per-partition costs from a benchmark.py report : the largest cart measured for each engine.
+        Returns False when the file cannot be used (the engines are then measured).
+        """
+        correspondance = {"python": "exact_python", "c": "exact_c"}
+        try:
+            with open(fichier) as f:
+                rapport = json.load(f)
+            retenues = {}
+            for mesure in rapport["engines"].values():
+                nom = correspondance.get(mesure.get("engine"))
+                if nom in self.moteurs and mesure["articles"] >= retenues.get(nom, {"articles": 0})["articles"]:
+                    retenues[nom] = mesure
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Cannot calibrate the cost model from %s : %s", fichier, e)
+            return False
+        for nom, mesure in retenues.items():
+            self.moteurs[nom].cout_unitaire = mesure["p50_ms"]/1000/mesure["partitions"]
+        return bool(retenues)
+
+    def to_dict(self):
+        return {nom: moteur.to_dict() for nom, moteur in self.moteurs.items()}
@@ -0,0 +1,263 @@
+"""
+Persistent pool of DPD optimizer worker processes.
+
+The workers are started once (application launch) with numpy imported, the C library loaded and
+the DPD tariffs installed : a search sent to the pool pays no startup cost, and runs outside the
+GIL of the caller. Jobs and results travel as compact int32 arrays (masses in grams, colis sizes).
+
+Each job gets a slot of shared memory holding its cancellation flag and its progress counters :
+utils.annulation and utils.progression work across the process boundary, the C loop of the
+worker polls the flag set by the caller.
+
+A worker that dies breaks the executor : the pool is started again (workers prewarmed again) and
+the job retried once. verifier_sante pings the workers, every intervalle_sante seconds in the background.
+
+Example:
+    >>> pool = PoolOptimiseurs(workers=2, tarifs=[transporteur.get_tarif_dpd()])
+    >>> pool.executer(moteur, items, tarif, annulation=annulation, progression=progression)
+    {'price': 48.2, 'config': [[...], [...]], 'partitions': 115975}
+    >>> pool.verifier_sante()
+    {'ok': True, 'workers': 2, 'pids': [4101, 4102], 'relances': 0}
+    >>> pool.arreter()
+"""
+import ctypes
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from functools import lru_cache
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.progression import EtatProgression
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two polls of a running job (cancellation, progress), the result itself is not delayed
+INTERVALLE_SUIVI_S = 0.05
+
+# Price functions kept per worker : the installed grids and the latest what-if ones
+TARIFS_WORKER_MAX = 32
+
+# Worker process state, set by _initialiser_worker
+_drapeaux = None
+_etats = None
+_moteurs = None
+
+
+def _grille(tarif):
+    """ Picklable key of a utils.utils.fonction_tarif : the worker builds the same function once """
+    return tarif.weights, tarif.prices, tarif.max_weight
+
+
+def _initialiser_worker(drapeaux, etats, grilles):
+    """ Pool initializer : shared slots, C library, engines and tariffs ready before the first job """
+    global _drapeaux, _etats
+    _drapeaux = drapeaux
+    _etats = etats
+    for moteur in _registre().values():
+        # One article per tariff : C library loaded, price memo started
+        for grille in grilles:
+            try:
+                moteur.executer([grille[0][0]], _tarif(grille))
+            except Exception as e:
+                # The parent cost model never picks an engine it cannot load either
+                logger.warning("Optimizer engine %s not prewarmed : %s", moteur.nom, e)
+
+
+@lru_cache(maxsize=TARIFS_WORKER_MAX)
+def _tarif(grille):
+    from utils.utils import fonction_tarif
+    return fonction_tarif(*grille)
+
+
+def _registre():
+    global _moteurs
+    if _moteurs is None:
+        from models.cost_model import moteurs_par_defaut
+        _moteurs = moteurs_par_defaut()
+    return _moteurs
+
+
+def _optimiser(nom_moteur, masses, grille, slot):
+    """ Job of a worker : (price, partitions, colis masses, colis sizes), arrays as int32 bytes """
+    import numpy as np
+    from utils.annulation import Annulation
+    from utils.progression import Progression
+    annulation = Annulation(ctypes.c_int.from_buffer(_drapeaux, slot*ctypes.sizeof(ctypes.c_int)))
+    progression = Progression(EtatProgression.from_buffer(_etats, slot*ctypes.sizeof(EtatProgression)))
+    items = np.frombuffer(masses, dtype=np.int32).tolist()
+    result = _registre()[nom_moteur].executer(items, _tarif(grille), annulation, progression)
+    colis = result["config"]
+    return (
+        result["price"],
+        result.get("partitions"),
+        np.array([masse for masses in colis for masse in masses], dtype=np.int32).tobytes(),
+        np.array([len(masses) for masses in colis], dtype=np.int32).tobytes(),
+    )
+
+
+class PoolOptimiseurs:
+    """ Long lived worker processes running Moteur.executer, thread safe """
+    def __init__(self, workers=2, tarifs=(), slots_par_worker=2, intervalle_sante=10, contexte="spawn"):
+        """
+        :param tarifs: utils.utils.fonction_tarif installed in the workers at start
+        :param slots_par_worker: jobs in flight per worker, executer blocks beyond
+        :param intervalle_sante: seconds between background health checks, None to disable
+        :param contexte: multiprocessing start method, spawn : forking the threads of a Qt application is unsafe
+        """
+        self.workers = workers
+        self.grilles = [_grille(tarif) for tarif in tarifs]
+        self.contexte = multiprocessing.get_context(contexte)
+        nombre_slots = workers*slots_par_worker
+        # Shared without lock : one slot per job in flight, written by one side at a time
+        self.drapeaux = self.contexte.RawArray(ctypes.c_int, nombre_slots)
+        self.etats = self.contexte.RawArray(EtatProgression, nombre_slots)
+        self.slots = queue.Queue()
+        for slot in range(nombre_slots):
+            self.slots.put(slot)
+        self._lock = threading.Lock()
+        self.executor = None
+        self.relances = 0
+        self.jobs = 0
+        self.arrete = threading.Event()
+        self.demarrer()
+        self.surveillance = None
+        if intervalle_sante:
+            self.surveillance = threading.Thread(target=self._surveiller, args=(intervalle_sante,), name="pool-optimiseurs", daemon=True)
+            self.surveillance.start()
+
+    def demarrer(self):
+        """ (Re)starts the executor and waits until every worker is prewarmed """
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self.contexte,
+            initializer=_initialiser_worker,
+            initargs=(self.drapeaux, self.etats, self.grilles),
+        )
+        # ProcessPoolExecutor starts its processes on demand : one ping per worker starts them all
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self.executor = executor
+
+    def relancer(self, executor):
+        """ Replaces executor when it is still the current one (several threads may see it broken) """
+        with self._lock:
+            if self.executor is not executor or self.arrete.is_set():
+                return
+            logger.warning("Optimizer pool broken, starting %s workers again", self.workers)
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.relances += 1
+            self.demarrer()
+
+    def executer(self, moteur, items, tarif, annulation=None, progression=None):
+        """
+        Moteur.executer(items, tarif, annulation, progression) run by a worker :
+        {"price", "config", "partitions"}. CalculationCancelled once annulation is cancelled.
+        """
+        import numpy as np
+        from models.calculation_errors import CalculationCancelled
+        moteur.suivre(progression, len(items))
+        masses = np.array(items, dtype=np.int32).tobytes()
+        slot = self._reserver_slot(annulation)
+        try:
+            for _ in range(2):
+                self.drapeaux[slot] = 0
+                self.etats[slot].explorees = 0
+                self.etats[slot].meilleur_prix = float("inf")
+                executor = self.executor
+                try:
+                    future = executor.submit(_optimiser, moteur.nom, masses, _grille(tarif), slot)
+                    prix, partitions, masses_colis, tailles = self._attendre(future, slot, annulation, progression)
+                    break
+                except BrokenProcessPool:
+                    # A worker died (crash, killed) : prewarmed workers again, then one more try
+                    self.relancer(executor)
+                except (CancelledError, RuntimeError):
+                    # Executor replaced by another thread meanwhile : tried again on the new one
+                    if executor is self.executor:
+                        raise
+                if annulation is not None and annulation.annulee:
+                    raise CalculationCancelled()
+            else:
+                raise RuntimeError("Optimizer pool workers keep dying")
+        finally:
+            self.drapeaux[slot] = 0
+            self.slots.put(slot)
+        with self._lock:
+            self.jobs += 1
+        masses_colis = np.frombuffer(masses_colis, dtype=np.int32).tolist()
+        config, debut = [], 0
+        for taille in np.frombuffer(tailles, dtype=np.int32).tolist():
+            config.append(masses_colis[debut:debut + taille])
+            debut += taille
+        return {"price": prix, "config": config, "partitions": partitions}
+
+    def _reserver_slot(self, annulation):
+        """ A free slot, waited for while every one is in flight. CalculationCancelled once annulation is cancelled """
+        from models.calculation_errors import CalculationCancelled
+        while True:
+            if annulation is not None and annulation.annulee:
+                raise CalculationCancelled()
+            try:
+                return self.slots.get(timeout=INTERVALLE_SUIVI_S)
+            except queue.Empty:
+                pass
+
+    def _attendre(self, future, slot, annulation, progression):
+        """ Result of future, forwarding the cancellation to the worker and its progress to the caller """
+        while True:
+            try:
+                result = future.result(timeout=INTERVALLE_SUIVI_S)
+            except TimeoutError:
+                if annulation is not None and annulation.annulee:
+                    # Polled by the engine of the worker, which raises CalculationCancelled back
+                    self.drapeaux[slot] = 1
+                self._transmettre(slot, progression)
+                continue
+            # Final counters of the search : jobs shorter than a poll interval report too
+            self._transmettre(slot, progression)
+            return result
+
+    def _transmettre(self, slot, progression):
+        if progression is not None:
+            etat = self.etats[slot]
+            progression.avancer(etat.explorees, etat.meilleur_prix)
+
+    def verifier_sante(self, timeout=5):
+        """
+        Pings the workers (pids : the ones that answered), a broken pool is started again.
+        Busy workers are not an error.
+        """
+        executor = self.executor
+        try:
+            futures = [executor.submit(os.getpid) for _ in range(self.workers)]
+            pids = sorted({future.result(timeout=timeout) for future in futures})
+            ok = True
+        except BrokenProcessPool:
+            self.relancer(executor)
+            pids, ok = [], False
+        except TimeoutError:
+            pids, ok = [], True
+            logger.info("Optimizer pool busy, health check skipped")
+        return {"ok": ok, "workers": self.workers, "pids": pids, "relances": self.relances}
+
+    def _surveiller(self, intervalle):
+        while not self.arrete.wait(intervalle):
+            try:
+                self.verifier_sante()
+            except Exception as e:
+                logger.error("Optimizer pool health check failed : %s", e)
+
+    def statistiques(self):
+        return {"workers": self.workers, "jobs": self.jobs, "relances": self.relances, "slots_libres": self.slots.qsize()}
+
+    def arreter(self):
+        """ Stops the workers, running jobs are cancelled """
+        self.arrete.set()
+        for slot in range(len(self.drapeaux)):
+            self.drapeaux[slot] = 1
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
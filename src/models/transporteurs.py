@@ -1,80 +1,144 @@
-print("Loading numpy : ...")
-import numpy as np
-print("Loading numpy : DONE")
-print("Loading utils : ...")
-from utils.utils import partitions_count, tarif_par_masse,set_new_tarif, find_best_config
-print("Loading utils : DONE")
-print("Loading C : ...")
-from bin.c import find_best_config as c_find_best_config
-from bin.c import set_new_tarif as c_set_new_tarif
-print("Loading C : DONE")
-from utils.utils import read_csv_file_with_headers
-from collections import Counter
+# numpy and the optimizer engines are imported on first use to keep startup fast
+import logging
+import os
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+from utils.utils import read_csv_file_with_headers, masse_en_grammes, masse_en_kg
+from utils.timing import mesurer, compter
+from models.calculation_errors import InvalidQuoteInput
+from sys import float_info
 
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=32)
+def _lire_grille_dpd(fichier, date_modification):
+    """ (weights in grams, prices) of a DPD grid csv, parsed once per version of the file """
+    header, columns_labels, csv = read_csv_file_with_headers(fichier, col_types=[int,float])
+    return tuple(masse_en_grammes(poids) for poids in csv[columns_labels[0]]), tuple(csv[columns_labels[1]])
+
+
+@lru_cache(maxsize=32)
+def _tarif_grille(weights, prices, max_weight):
+    """ One price function (and price memo) per grid, keyed like models.pool_optimiseurs._grille """
+    from utils.utils import fonction_tarif
+    return fonction_tarif(weights, prices, max_weight)
 
 
 class Transporteur:
+    """
+    Tariffs and quotes of one carrier. Safe to share between threads : the options are a frozen
+    snapshot replaced as a whole by set_options, every quote reads a single snapshot (reglages),
+    tariffs are read only and the lazily built grids are created under a lock.
+    """
+    # Options the precomputed price surface depends on
+    OPTIONS_SURFACE_PRIX = ["PAS_SURFACE_PRIX", "MAX_POIDS_MESSAGERIE_SCHENKER", "SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"]
+    # Options applied to the final price only : changing them never needs a new calculation
+    OPTIONS_POST_HOC = ["POURCENTAGE_MAGE"]
+
     def __init__(self, nom, fichier_tarifs,options):
-        self.VERBOSE = True
+        # Trace points are only formatted when the carrier is verbose, see set_verbose
+        self.logger = logging.getLogger(f"{__name__}.{nom}")
+        self.set_verbose(self.trace_demandee(nom))
         self.warning_callback = None  # Add this to your class
         if self.VERBOSE:
-            print(f"[INFO] Initializing {nom} : ...")
+            self.logger.debug("Initializing %s : ...", nom)
         self.nom = nom
         self.fichier_tarifs = fichier_tarifs
-        self.options = dict(options)
+        self.options = MappingProxyType(dict(options))
+        self._lock = threading.RLock()
         self.header, self.columns_labels, self.csv = self.charger_tarifs()
+        self.preparer_index_departements()
+        # numpy grids and price surfaces are built on first use
+        self.grille_masses = None
+        self.grille_prix = None
+        self.grilles_pretes = False
+        self.surface = None
+        self.modele_cout = None
+        self.tarifs_dpd = {}
+        # models.pool_optimiseurs.PoolOptimiseurs running the long DPD searches, see CalculateurFraisLivraison.demarrer_pool
+        self.pool = None
         self.available_countries = None
         self.charger_liste_pays_disponible()
         if self.VERBOSE:
-            print(f"[INFO] Initializing {nom} : DONE")
-            print(f"----------------------------------")
-
-
-    def compact_shopping_cart(self, panier : list):
-        """ Tweaking method to reduce calculation time : regroup small articles """
-        panier_returned = panier.copy()
-        light_articles = []
-        panier_sorted = []
-        for article in panier_returned :
-            mass = float(article['poids'])
-            if mass < self.options["SEUIL_ARTICLE_LEGER"]:
-                light_articles.append(article)
-            else :
-                panier_sorted.append(article)
-        current_group = []
-        current_mass = 0
-        light_groups = []
-        for article in light_articles:
-            current_group.append(article['nom'])
-            current_mass += float(article['poids'])
-            if current_mass > self.options["SEUIL_COMPACTAGE"] :
-                counts = Counter(current_group)
-                label = " + ".join([f"{count}x {key}" for key, count in counts.items()])
-                light_groups.append({"nom":label, 'poids':current_mass})
-                current_mass=0
-                current_group=[]
-        if current_mass>0:
-            counts = Counter(current_group)
-            label = " + ".join([f"{count}x {key}" for key, count in counts.items()])
-            light_groups.append({"nom":label, 'poids':current_mass})
-        
+            self.logger.debug("Initializing %s : DONE", nom)
+
 
-        panier_returned = panier_sorted + light_groups
-        print(f'[INFO] Panier compacted : \n {panier_returned}')
+    def compact_shopping_cart(self, panier, options=None):
+        """ Tweaking method to reduce calculation time : regroup small articles (thresholds of options, default self.options) """
+        from models.cart import Cart
+        if options is None:
+            options = self.options
+        panier_returned = Cart.convertir(panier).compacter(options["SEUIL_ARTICLE_LEGER"], options["SEUIL_COMPACTAGE"])
+        if self.VERBOSE:
+            self.logger.debug('Panier compacted : \n %s', panier_returned)
         return panier_returned
+
+    def calculer_seuils_compactage(self, masses, cible, reglages=None):
+        """
+        (SEUIL_ARTICLE_LEGER, SEUIL_COMPACTAGE) in kg bringing the cart of masses (g) down to at most cible items
+        in a single compact_shopping_cart, merging as few articles as possible. None when no thresholds fit.
+        The k lightest articles are merged into cible - (n - k) groups : a group closes once heavier than
+        total/groups, so it never needs more groups, and stays under a colis when total/groups + lightest < max.
+        """
+        if reglages is None:
+            reglages = self.options
+        masses = sorted(masses)
+        n = len(masses)
+        poids_max = masse_en_grammes(reglages["POIDS_MAX_COLIS_DPD"])
+        total = 0
+        for k in range(1, n+1):
+            total += masses[k-1]
+            if k < n and masses[k] == masses[k-1]:
+                # A threshold cannot separate two articles of the same mass
+                continue
+            groupes = cible - (n - k)
+            if groupes < 1:
+                continue
+            seuil_compactage = total/groupes
+            if seuil_compactage + masses[k-1] < poids_max:
+                seuil_leger = masses[k] if k < n else masses[-1] + 1
+                return masse_en_kg(seuil_leger), masse_en_kg(seuil_compactage)
+        return None
     
 
 
 
+    @staticmethod
+    def trace_demandee(nom):
+        """ MAGE_TRACE=dpd,schenker_palette (or MAGE_TRACE=all) enables the trace points from startup """
+        transporteurs = [t.strip().lower() for t in os.environ.get("MAGE_TRACE", "").split(",")]
+        return nom in transporteurs or "all" in transporteurs
+
+    def set_verbose(self, verbose):
+        """ Enables or disables the trace points of this carrier at runtime """
+        self.VERBOSE = bool(verbose)
+        self.logger.setLevel(logging.DEBUG if self.VERBOSE else logging.NOTSET)
+
     def set_warning_callback(self, callback):
         self.warning_callback = callback
     
+    def recharger_tarifs(self):
+        """
+        Reads the tariff files again (rate change) and drops everything derived from them.
+        Quotes already running keep the tariff functions they started with.
+        """
+        with self._lock:
+            self.header, self.columns_labels, self.csv = self.charger_tarifs()
+            self.preparer_index_departements()
+            self.grilles_pretes = False
+            self.surface = None
+            self.tarifs_dpd = {}
+            self.charger_liste_pays_disponible()
+
     def set_options(self,options):
-        self.options = dict(options)
+        # New frozen snapshot : quotes running with the previous one are not affected
+        self.options = MappingProxyType(dict(options))
 
     def charger_tarifs(self):
         if self.VERBOSE:
-            print(f"\t[INFO] Loading tarifs {self.nom} : ...")
+            self.logger.debug("Loading tarifs %s : ...", self.nom)
         if self.fichier_tarifs not in [self.options["DPD_PATH"], self.options["SCHENKER_PALETTE_PATH"], self.options["SCHENKER_MESSAGERIE_PATH"]]:
             raise ValueError("Fichier tarifs invalide")
         header, columns_labels, csv = {},[],{}
@@ -127,17 +191,286 @@ class Transporteur:
                 header, columns_labels, csv = read_csv_file_with_headers(self.fichier_tarifs,col_types=[int,float,float,float,float],list_in_header=True)
 
         except FileNotFoundError as e :
-            print(f"Erreur lors de l'initiallisation des tarifs...\n{e}")
-            print("Appuyer sur entree pour terminer le programme...")
-            _ = input()
+            # Raised, not waited on : batch and service processes have no console to answer.
+            # The Qt application reports it and pauses in __main__
+            logger.error("Erreur lors de l'initiallisation des tarifs...\n%s", e)
+            raise
         if self.VERBOSE:
-            print(f"\t[INFO] Loading tarifs {self.nom} : DONE\n")
+            self.logger.debug("Loading tarifs %s : DONE", self.nom)
         return header, columns_labels, csv
 
+    def prechauffer(self):
+        """ Builds everything loaded lazily right away (long running services, workers) """
+        self.assurer_grilles()
+        self.get_surface_prix()
+        if self.nom == self.options["DPD"] and self.columns_labels:
+            self.get_modele_cout().assurer_calibration(self.get_tarif_dpd(), self.options.get("CALIBRATION_COUT_PATH"))
+
+    def get_modele_cout(self):
+        """ Cost model of the DPD optimizer engines, calibrated on first use """
+        if self.modele_cout is None:
+            with self._lock:
+                if self.modele_cout is None:
+                    from models.cost_model import ModeleCout
+                    self.modele_cout = ModeleCout()
+        return self.modele_cout
+
+    def get_tarif_dpd(self, reglages=None):
+        """
+        Price function (utils.utils.fonction_tarif) of the DPD grid with the POIDS_MAX_COLIS_DPD of
+        reglages (default self.options), masses in grams. Built once per max weight, read only.
+        """
+        from utils.utils import fonction_tarif
+        if reglages is None:
+            reglages = self.options
+        max_weight = masse_en_grammes(reglages["POIDS_MAX_COLIS_DPD"])
+        # Local reference : recharger_tarifs replaces the dict, never empties it under a running quote
+        tarifs = self.tarifs_dpd
+        tarif = tarifs.get(max_weight)
+        if tarif is None:
+            weights = [masse_en_grammes(poids) for poids in self.csv[self.columns_labels[0]]]
+            tarif = tarifs.setdefault(max_weight, fonction_tarif(weights, self.csv[self.columns_labels[1]], max_weight))
+        return tarif
+
+    def preparer_index_departements(self):
+        """ Departement -> line (palette) or zone (messagerie) index in the numpy grids """
+        self.index_departements = {}
+        if not self.columns_labels:
+            return
+        if self.nom == self.options["SCHENKER_PALETTE"]:
+            self.index_departements = {departement: index for index, departement in enumerate(self.csv[self.columns_labels[0]])}
+        elif self.nom == self.options["SCHENKER_MESSAGERIE"]:
+            for zone_index, zone in enumerate(self.columns_labels[1:]):
+                departements_zone = self.header.get(zone, [])
+                if type(departements_zone) != list:
+                    continue
+                for departement in departements_zone:
+                    self.index_departements[departement.strip()] = zone_index
+
+    def assurer_grilles(self):
+        if not self.grilles_pretes:
+            with self._lock:
+                if not self.grilles_pretes:
+                    self.preparer_grilles()
+
+    def preparer_grilles(self):
+        """ Converts the loaded csv columns into read only numpy grids used by the bulk pricing methods """
+        import numpy as np
+        grille_masses, grille_prix = None, None
+        if not self.columns_labels:
+            pass
+        elif self.nom == self.options["DPD"]:
+            grille_masses = np.array(self.csv[self.columns_labels[0]], dtype=np.float64)
+            grille_prix = np.array(self.csv[self.columns_labels[1]], dtype=np.float64)
+        elif self.nom == self.options["SCHENKER_PALETTE"]:
+            # One line per departement, one column per number of palettes
+            grille_prix = np.array([self.csv[col_label] for col_label in self.columns_labels[1:]], dtype=np.float64).T
+        elif self.nom == self.options["SCHENKER_MESSAGERIE"]:
+            # One line per mass bracket, one column per zone
+            grille_masses = np.array(self.csv[self.columns_labels[0]], dtype=np.float64)
+            grille_prix = np.array([self.csv[col_label] for col_label in self.columns_labels[1:]], dtype=np.float64).T
+        for grille in (grille_masses, grille_prix):
+            if grille is not None:
+                grille.flags.writeable = False
+        self.grille_masses, self.grille_prix = grille_masses, grille_prix
+        # Set last : another thread only reads the grids once they are complete
+        self.grilles_pretes = True
+
+    @staticmethod
+    def normaliser_departement(departement):
+        departement = str(departement).strip()
+        if len(departement) == 1:
+            departement = "0" + departement
+        elif len(departement) == 2 and departement[-1] == "_":
+            departement = "0" + departement
+        return departement
+
+    def indexer_departements(self, departements, masses, index=None):
+        """ Maps departements to their line (palette) or zone (messagerie) index, -1 when unknown """
+        import numpy as np
+        if index is None:
+            index = self.index_departements
+        departements = np.asarray(departements, dtype=str)
+        shape = np.broadcast_shapes(np.shape(masses), departements.shape)
+        # Lookup only the distinct departements, then broadcast against the masses
+        uniques, inverse = np.unique(departements, return_inverse=True)
+        lookup = np.array([index.get(self.normaliser_departement(d), -1) for d in uniques], dtype=np.int64)
+        return np.broadcast_to(lookup[inverse].reshape(departements.shape), shape)
+
+    def calculer_tarifs_bulk(self, masses, departements=None, marge=True, reglages=None):
+        """
+        Vectorized pricing of many single shipments at once.
+
+        :param masses: array of total masses (kg), one per shipment
+        :param departements: array of departements (or a single departement) matching masses, unused by DPD
+        :param marge: apply POURCENTAGE_MAGE on top of the carrier price
+        :param reglages: options snapshot of the calculation, default self.options
+        :return: numpy array of prices, nan where the shipment cannot be priced
+        """
+        import numpy as np
+        if reglages is None:
+            reglages = self.options
+        self.assurer_grilles()
+        masses = np.asarray(masses, dtype=np.float64)
+        if self.nom == reglages["DPD"]:
+            prix = self.calculer_tarifs_bulk_dpd(masses, reglages)
+        elif self.nom == reglages["SCHENKER_PALETTE"]:
+            prix = self.calculer_tarifs_bulk_schenker_palette(masses, departements)
+        elif self.nom == reglages["SCHENKER_MESSAGERIE"]:
+            prix = self.calculer_tarifs_bulk_schenker_messagerie(masses, departements, reglages)
+        else:
+            raise ValueError(f"[ERROR] Unknown transporteur {self.nom}")
+        if marge:
+            prix = prix * (1 + reglages.get("POURCENTAGE_MAGE", 0)/100)
+        return prix
+
+    def calculer_tarifs_bulk_dpd(self, masses, reglages=None):
+        """ Price of single DPD colis, same brackets as tarif_par_masse (colis over POIDS_MAX_COLIS_DPD cost inf) """
+        import numpy as np
+        if reglages is None:
+            reglages = self.options
+        prix = np.where(self.grille_masses > reglages["POIDS_MAX_COLIS_DPD"], np.inf, self.grille_prix)
+        index = np.searchsorted(self.grille_masses, masses, side="right")
+        # Over the last bracket the last price applies
+        index = np.minimum(index, len(self.grille_masses) - 1)
+        return prix[index]
+
+    def calculer_tarifs_bulk_schenker_palette(self, masses, departements, nbre_palette=1):
+        import numpy as np
+        index_dpt = self.indexer_departements(departements, masses)
+        prix = self.grille_prix[np.maximum(index_dpt, 0), nbre_palette-1]
+        return np.where(index_dpt < 0, np.nan, prix)
+
+    def calculer_tarifs_bulk_schenker_messagerie(self, masses, departements, reglages=None):
+        import numpy as np
+        if reglages is None:
+            reglages = self.options
+        zones = self.indexer_departements(departements, masses)
+        # First bracket whose upper bound is >= mass
+        index = np.searchsorted(self.grille_masses, masses, side="left")
+        hors_grille = index >= len(self.grille_masses)
+        tarifs = self.grille_prix[np.minimum(index, len(self.grille_masses) - 1), np.maximum(zones, 0)]
+        # Over SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER the bracket price applies per whole 100 kg
+        prix = np.where(
+            masses < reglages["SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"],
+            tarifs,
+            tarifs * np.floor_divide(masses, 100),
+        )
+        invalide = (zones < 0) | hors_grille | (masses > reglages["MAX_POIDS_MESSAGERIE_SCHENKER"])
+        return np.where(invalide, np.nan, prix)
+
+    def preparer_surface_prix(self, reglages=None):
+        """
+        Precomputes palette and messagerie prices (margin excluded) for every departement
+        on a mass grid of PAS_SURFACE_PRIX kg up to MAX_POIDS_MESSAGERIE_SCHENKER.
+        Stored as read only float32 (departements x masses), nan where the shipment cannot be priced.
+
+        :return: (surface_prix, departements (lines), {departement: line}), surface_prix None for DPD
+        """
+        import numpy as np
+        if reglages is None:
+            reglages = self.options
+        if self.nom not in [reglages["SCHENKER_PALETTE"], reglages["SCHENKER_MESSAGERIE"]] or not self.index_departements:
+            return None, [], {}
+        pas = reglages["PAS_SURFACE_PRIX"]
+        masses = np.arange(int(round(reglages["MAX_POIDS_MESSAGERIE_SCHENKER"]/pas)) + 1) * pas
+        departements = sorted(self.index_departements)
+        index_departements = {departement: index for index, departement in enumerate(departements)}
+        surface_prix = self.calculer_tarifs_bulk(
+            masses[np.newaxis, :], np.array(departements)[:, np.newaxis], marge=False, reglages=reglages
+        ).astype(np.float32)
+        surface_prix.flags.writeable = False
+        if self.VERBOSE:
+            self.logger.debug("Price surface %s : %s (%.1f MB)", self.nom, surface_prix.shape, surface_prix.nbytes/1e6)
+        return surface_prix, departements, index_departements
+
+    def get_surface(self, reglages=None):
+        """
+        (surface_prix, departements, index) for the OPTIONS_SURFACE_PRIX of reglages (default self.options),
+        computed on first use and again when these options change.
+        """
+        if reglages is None:
+            reglages = self.options
+        cle = tuple(reglages.get(key) for key in self.OPTIONS_SURFACE_PRIX)
+        # Replaced as a whole : a reader never sees the prices of one surface with the index of another
+        surface = self.surface
+        if surface is None or surface[0] != cle:
+            with self._lock:
+                surface = self.surface
+                if surface is None or surface[0] != cle:
+                    surface = (cle,) + self.preparer_surface_prix(reglages)
+                    self.surface = surface
+        return surface[1:]
+
+    def get_surface_prix(self, reglages=None):
+        """ Price surface, computed on first use and after a change of the options it depends on """
+        return self.get_surface(reglages)[0]
+
+    def lire_surface_prix(self, masses, departements, marge=True, reglages=None):
+        """
+        Reads prices from the precomputed surface. Masses falling between two grid points
+        (or outside of the grid) are priced with calculer_tarifs_bulk instead.
+        """
+        import numpy as np
+        if reglages is None:
+            reglages = self.options
+        surface_prix, _, surface_index_departements = self.get_surface(reglages)
+        masses = np.asarray(masses, dtype=np.float64)
+        pas = reglages["PAS_SURFACE_PRIX"]
+        lignes = self.indexer_departements(departements, masses, index=surface_index_departements)
+        colonnes = np.rint(masses/pas).astype(np.int64)
+        colonnes = np.broadcast_to(colonnes, lignes.shape)
+        sur_grille = (np.abs(colonnes*pas - masses) < 1e-6) & (colonnes >= 0) & (colonnes < surface_prix.shape[1]) & (lignes >= 0)
+        # float32 storage : tariffs are in cents so rounding gives back the exact price
+        prix = np.array(np.round(surface_prix[np.where(sur_grille, lignes, 0), np.where(sur_grille, colonnes, 0)].astype(np.float64), 2))
+        if not sur_grille.all():
+            hors_grille = ~sur_grille
+            masses_hors_grille = np.broadcast_to(masses, lignes.shape)[hors_grille]
+            departements_hors_grille = np.broadcast_to(np.asarray(departements, dtype=str), lignes.shape)[hors_grille]
+            prix[hors_grille] = self.calculer_tarifs_bulk(masses_hors_grille, departements_hors_grille, marge=False, reglages=reglages)
+        if marge:
+            prix = prix * (1 + reglages.get("POURCENTAGE_MAGE", 0)/100)
+        return prix
+
+    def exporter_surface_prix(self, fichier):
+        """
+        Exports the price surface (margin excluded) so it can be embedded elsewhere.
+        .npz keeps the float32 array, .json writes nested lists (null when not priceable).
+        """
+        import numpy as np
+        reglages = self.options
+        surface_prix, surface_departements, _ = self.get_surface(reglages)
+        if surface_prix is None:
+            raise ValueError(f"[ERROR] No price surface for {self.nom}")
+        pas = reglages["PAS_SURFACE_PRIX"]
+        if str(fichier).endswith(".npz"):
+            np.savez_compressed(
+                fichier,
+                transporteur=self.nom,
+                pas_kg=pas,
+                departements=np.array(surface_departements),
+                prix=surface_prix,
+            )
+        elif str(fichier).endswith(".json"):
+            import json
+            prix = np.round(surface_prix.astype(np.float64), 2)
+            with open(fichier, "w") as f:
+                json.dump({
+                    "transporteur": self.nom,
+                    "pas_kg": pas,
+                    "masse_max_kg": reglages["MAX_POIDS_MESSAGERIE_SCHENKER"],
+                    "marge_incluse": False,
+                    "departements": surface_departements,
+                    "prix": [[None if np.isnan(p) else p for p in ligne] for ligne in prix.tolist()],
+                }, f)
+        else:
+            raise ValueError(f"[ERROR] Unsupported export format {fichier}, use .npz or .json")
+        return fichier
+
     def charger_liste_pays_disponible(self):
         try :
             if self.VERBOSE:
-                print('\t[INFO] Loading country list : ...')
+                self.logger.debug('Loading country list : ...')
 
             # with open(self.options["COUNTRY_AVAILABLE_PATH"]) as f: 
             #     lines = f.readlines()
@@ -154,10 +487,10 @@ class Transporteur:
             header, col_label, csv = read_csv_file_with_headers(self.options["COUNTRY_AVAILABLE_PATH"])
             self.available_countries = csv[col_label[col_label.index(self.nom)]]
             if self.VERBOSE:
-                print('\t[INFO] Loading country list : DONE')   
-                print(f'\t[INFO] Country List : {self.available_countries}')   
+                self.logger.debug('Loading country list : DONE')
+                self.logger.debug('Country List : %s', self.available_countries)
         except Exception as e:
-            print(f"[ERROR] Unhandled error during loading of country list : {e}")
+            logger.error("Unhandled error during loading of country list : %s", e)
             return -1     
         return 0
     
@@ -168,206 +501,378 @@ class Transporteur:
             else :
                 return False
         except Exception as e:
-            print(f"[ERROR] Unhandled error during checking of available country : {e}")
+            logger.error("Unhandled error during checking of available country : %s", e)
             return -1
         
 
-    def calculer_tarif(self, panier, options):
+    def calculer_tarif(self, panier, options, chrono=None, annulation=None, progression=None):
+        """
+        Quote with the margin : calculer_tarif_brut then appliquer_marge.
+        :param panier: models.cart.Cart (a list of article dicts is converted)
+        :param chrono: optional utils.timing.Chronometre receiving the stage durations and counters
+        :param annulation: optional utils.annulation.Annulation, CalculationCancelled is raised once cancelled
+        :param progression: optional utils.progression.Progression of the DPD optimizer
+        """
+        # One options snapshot for the whole quote, even when set_options runs meanwhile
+        reglages = self.options
+        return self.appliquer_marge(self.calculer_tarif_brut(panier, options, chrono, reglages, annulation, progression), reglages.get("POURCENTAGE_MAGE", 0))
 
+    def appliquer_marge(self, resultat, pourcentage=None):
+        """
+        Presentation of a raw result : new dict with 'prix' = 'prix_brut' plus POURCENTAGE_MAGE
+        (or pourcentage). Results without price (errors) are returned as they are.
+        """
+        if resultat is None or "prix_brut" not in resultat:
+            return resultat
+        if pourcentage is None:
+            pourcentage = self.options.get("POURCENTAGE_MAGE", 0)
+        resultat = dict(resultat)
+        resultat["prix"] = resultat["prix_brut"]*(1 + pourcentage/100)
+        return resultat
+
+    def calculer_tarif_brut(self, panier, options, chrono=None, reglages=None, annulation=None, progression=None):
+        """
+        Quote without margin ('prix_brut'), depends only on the cart, the destination and the packing options.
+        :param reglages: options snapshot the whole calculation reads, default self.options at the call
+        :param annulation: optional utils.annulation.Annulation polled by the DPD optimizer
+        :param progression: optional utils.progression.Progression updated by the DPD optimizer
+        """
+        from models.cart import Cart
+        if reglages is None:
+            reglages = self.options
+        panier = Cart.convertir(panier)
+        compter(chrono, "articles", len(panier))
         if self.is_country_available(options["country"]):
-            if self.nom == self.options["DPD"]:
-                ret =  self.calculer_tarif_dpd(panier, options)
-            elif self.nom == self.options["SCHENKER_PALETTE"]:
-                ret = self.calculer_tarif_schenker_palette(panier, options)
-            elif self.nom == self.options["SCHENKER_MESSAGERIE"]:
-                ret = self.calculer_tarif_schenker_messagerie(panier, options)
+            if self.nom == reglages["DPD"]:
+                ret =  self.calculer_tarif_dpd(panier, options, chrono, reglages, annulation, progression)
+            elif self.nom == reglages["SCHENKER_PALETTE"]:
+                with mesurer(chrono, "surface"):
+                    ret = self.calculer_tarif_surface(panier, options, reglages)
+                if ret is None:
+                    with mesurer(chrono, "detail"):
+                        ret = self.calculer_tarif_schenker_palette(panier, options, reglages=reglages)
+            elif self.nom == reglages["SCHENKER_MESSAGERIE"]:
+                with mesurer(chrono, "surface"):
+                    ret = self.calculer_tarif_surface(panier, options, reglages)
+                if ret is None:
+                    with mesurer(chrono, "detail"):
+                        ret = self.calculer_tarif_schenker_messagerie(panier, options, reglages)
             else:
                 ret = {'error': "Unknown name"}
             if ret is not None :
                 return ret 
             else : 
-                ret = {"error" : "cannot calculate"}
+                return {"error" : "cannot calculate"}
         else :
             return {'error' : "Country not available"}
     
-    def calculer_tarif_dpd(self, panier, options):
+    def calculer_tarif_surface(self, panier, options, reglages=None):
+        """ Single shipment quote read from the price surface, None when the detailed calculation is needed """
+        import numpy as np
+        if self.get_surface_prix(reglages) is None:
+            return None
+        prix = self.lire_surface_prix(panier.masse_totale(), options['departement'], marge=False, reglages=reglages)
+        if np.isnan(prix):
+            # Errors (unknown departement, excessive mass...) are reported by the detailed calculation
+            return None
+        return {"prix_brut": float(prix)}
+
+    def calculer_tarif_dpd(self, panier, options, chrono=None, reglages=None, annulation=None, progression=None, tarif=None):
+        """ DPD does not depend on the departement. tarif : price function replacing the loaded grid (what-if scenarios) """
+        from utils.utils import partitions_count, ranger_articles_legers
+        if reglages is None:
+            reglages = self.options
         if self.VERBOSE:
-            print("[INFO] Calculating tarif for DPD : ...")
-        departement = options['departement']
+            self.logger.debug("Calculating tarif for DPD : ...")
+        # Read only price function of this calculation (grid in grams, inf over the max weight)
+        if tarif is None:
+            tarif = self.get_tarif_dpd(reglages)
+        max_weight = tarif.max_weight
         # Check if the weight of an article is greater than the maximum weight of the colis
-        for element in panier:
-            if float(element['poids']) >= self.options["POIDS_MAX_COLIS_DPD"]:
-                if self.VERBOSE:
-                    print(f"\t[ERROR] Poids de l'article {element['nom']} superieur au poids maximum du colis")
-                    print(f"\t[ERROR] Poids de l'article {element['nom']} : {float(element['poids'])} kg")
-                    print("\t[WARNING] Calculating tarif for DPD : ERROR")
-                    return {'error' : 'excessive mass'}
-        
-        def sort_and_permute(list1, list2):
-            # Combine both lists into a list of tuples
-            combined = list(zip(list1, list2))
-            
-            # Sort the combined list based on the first list
-            combined_sorted = sorted(combined, key=lambda x: x[0])
-            
-            # Unzip the combined sorted list back into two lists
-            sorted_list1, permuted_list2 = zip(*combined_sorted)
-            
-            # Convert the result back to lists (since zip returns tuples)
-            return list(sorted_list1), list(permuted_list2)
+        if panier.masse_max_g() >= max_weight:
+            for nom, masse, _ in panier.lignes():
+                if masse_en_grammes(masse) >= max_weight:
+                    logger.warning("Poids de l'article %s (%s kg) superieur au poids maximum du colis", nom, masse)
+            return {'error' : 'excessive mass'}
         
-        def optimiser_colis(panier, max_weight, columns_labels, csv):
-            initial_panier = panier[:]
-            items = [float(article['poids']) for article in panier]
-            items_label = [article["nom"] for article in panier]
-            items,items_label = sort_and_permute(items,items_label)
+        def optimiser_colis(panier):
+            # One mass per unit, sorted by increasing mass, with the matching labels
+            items, items_label = panier.unites()
+            items_initiaux, labels_initiaux = items, items_label
             n = len(items)
             number_of_partitions = partitions_count(n)
-            print(f"[INFO] Compacting shopping cart while calculation is too expensive: Cart = {panier}")
+            # Engine chosen by the calibrated cost model : the fastest exact one within the latency budget
+            modele = self.get_modele_cout()
+            budget = reglages["BUDGET_LATENCE_MS"]/1000
+            with mesurer(chrono, "calibration"):
+                modele.assurer_calibration(tarif, reglages.get("CALIBRATION_COUT_PATH"))
+            moteur = modele.choisir(n, budget)
+            if self.VERBOSE:
+                self.logger.debug("Compacting shopping cart while calculation is too expensive: Cart = %s", panier)
+
+            def executer(moteur, items):
+                # Long searches go to the persistent worker pool when one is started
+                pool = self.pool
+                if pool is not None and moteur.estimer(len(items)) >= reglages.get("POOL_SEUIL_MS", 20)/1000:
+                    return pool.executer(moteur, items, tarif, annulation, progression)
+                return moteur.executer(items, tarif, annulation, progression)
     
+            compter(chrono, "articles avant compactage", n)
             compacting_count = 0
-            while number_of_partitions > self.options["SEUIL_WARNING_ITERATIONS"]:
-                compacting_count+=1
-                self.options['SEUIL_COMPACTAGE']+=1
-                self.options['SEUIL_ARTICLE_LEGER']+=1
-                panier_compact = self.compact_shopping_cart(panier)
-                items = [float(article['poids']) for article in panier_compact]
-                items_label = [article["nom"] for article in panier_compact]
-                items,items_label = sort_and_permute(items,items_label)
-                n = len(items)
-                print(f"[INFO] cart len {n}")
-                number_of_partitions = partitions_count(n)
-                if self.options['SEUIL_COMPACTAGE']>=self.options["POIDS_MAX_COLIS_DPD"] or self.options['SEUIL_ARTICLE_LEGER']>=self.options["POIDS_MAX_COLIS_DPD"]:
-                    return {'error':'Cannot compact cart enough'}
-
-            print(f"[INFO] Cart have been compacted {compacting_count} times.")
+            if moteur is None:
+                with mesurer(chrono, "compactage"):
+                    # Thresholds computed for this call only : the options snapshot is never modified
+                    seuils = self.calculer_seuils_compactage(items, modele.max_articles_exacts(budget), reglages)
+                    if seuils is not None:
+                        compacting_count = 1
+                        options_calcul = dict(reglages)
+                        options_calcul['SEUIL_ARTICLE_LEGER'], options_calcul['SEUIL_COMPACTAGE'] = seuils
+                        items, items_label = self.compact_shopping_cart(panier, options_calcul).unites()
+                        n = len(items)
+                        if self.VERBOSE:
+                            self.logger.debug("Compaction thresholds %s, cart len %s", seuils, n)
+                        number_of_partitions = partitions_count(n)
+                        moteur = modele.choisir(n, budget)
+                    if moteur is None:
+                        # Cannot compact enough for an exact engine : greedy packing of the articles instead of an error
+                        moteur = modele.heuristique()
+                        items, items_label = items_initiaux, labels_initiaux
+                        n = len(items)
+
+            compter(chrono, "compactages", compacting_count)
+            compter(chrono, "articles apres compactage", n)
+            logger.info("Cart have been compacted %s times.", compacting_count)
             # Generates the set of all possible partitions
-            # weights = list(tarif_par_kg[:,0])
-            print(f"{columns_labels=}")
-            weights = csv[columns_labels[0]]
-            prices = csv[columns_labels[1]]
+            if self.VERBOSE:
+                self.logger.debug("Engine %s, estimations : %s", moteur.nom, modele.estimations(n))
             
-            # prices = list(tarif_par_kg[:,1])
-            # Trick to handle max weight : over max : price = inf
-            set_new_tarif(weights,prices, max_weight)
-            set_new_tarif(weights,prices, max_weight)
             try :
-                result = find_best_config(items)
+                with mesurer(chrono, "find_best_config"):
+                    result = executer(moteur, items)
+                    if compacting_count and result['price'] >= float_info.max:
+                        # Compacted groups heavier than a colis : no valid partition, greedy packing of the articles
+                        moteur = modele.heuristique()
+                        items, items_label = items_initiaux, labels_initiaux
+                        result = executer(moteur, items)
             except IndexError as e: 
-                raise IndexError(f'[ERROR] Could not find best config on {items}. \n panier = {panier} \n  Initial panier ={initial_panier} \n items = {items} \n Error = {e}')
+                raise IndexError(f'[ERROR] Could not find best config on {items}. \n panier = {panier} \n items = {items} \n Error = {e}')
+            compter(chrono, "partitions", result.get('partitions', number_of_partitions))
             best_price = result['price']
             best_config = result['config']
             # from best config retrieve corresponding labels 
-            best_config_labels=[]
-            for group in best_config:
-                current_group_labels=[]
-                for article in group:
-                    if article not in items:
-                        raise ValueError("Article not found")
-                    current_group_labels.append(items_label[items.index(article)])
-                best_config_labels.append(current_group_labels)
-                    
-            print(f"\t [INFO] C + python - price : {best_price}\n For config : {best_config}")
+            with mesurer(chrono, "conversion"):
+                best_config_labels = self.etiqueter_colis(best_config, items, items_label)
+
 
             if self.VERBOSE:
-                print(f"\t[INFO] Minimum cost : {best_price}€")
-                print(f"\t[INFO] Best partition : {best_config}")
-                print("[INFO] Calculating tarif for DPD : DONE\n")
+                self.logger.debug("Minimum cost : %s€", best_price)
+                self.logger.debug("Best partition : %s", best_config)
+                self.logger.debug("Calculating tarif for DPD : DONE")
             return {
                 "best_price":best_price,
                 "best_config": best_config,
                 "best_config_labels" : best_config_labels,
                 "compacting_count" : compacting_count,
+                "moteur" : moteur.nom,
             } 
         
-        result = optimiser_colis(panier, self.options["POIDS_MAX_COLIS_DPD"], self.columns_labels, self.csv)
+        if reglages.get("MODE_DPD") == "deux_phases":
+            # Only the heavy articles are optimized exactly, the light ones are packed afterwards
+            seuil_leger = masse_en_grammes(reglages["SEUIL_ARTICLE_LEGER"])
+            masque_legers = panier.masses_g < seuil_leger
+            legers = list(zip(*panier.filtrer(masque_legers).unites()))
+            panier = panier.filtrer(~masque_legers)
+            compter(chrono, "articles legers", len(legers))
+        else:
+            legers = []
+        if panier:
+            result = optimiser_colis(panier)
+        else:
+            result = {"best_price": 0, "best_config": [], "best_config_labels": [], "compacting_count": 0, "moteur": None}
         if 'error' in result:
             return result
-        else : 
-            total_cost = result['best_price'] 
-            colis = (result['best_config'], result['best_config_labels'])
-            compacting_count = result['compacting_count']
+        if legers:
+            with mesurer(chrono, "rangement legers"):
+                rangement = ranger_articles_legers(result['best_config'], result['best_config_labels'], legers, tarif)
+            result['best_price'] = rangement['price']
+            result['best_config'] = rangement['config']
+            result['best_config_labels'] = rangement['config_labels']
+        return self.presenter_tarif_dpd(result, tarif, chrono)
+
+    @staticmethod
+    def etiqueter_colis(config, items, items_label):
+        """ Labels of the colis of config (masses in grams), items and items_label : the optimized units """
+        config_labels = []
+        for group in config:
+            current_group_labels = []
+            for article in group:
+                if article not in items:
+                    raise ValueError("Article not found")
+                current_group_labels.append(items_label[items.index(article)])
+            config_labels.append(current_group_labels)
+        return config_labels
+
+    def presenter_tarif_dpd(self, result, tarif, chrono=None):
+        """ Raw DPD quote of a packing {best_price, best_config, best_config_labels, compacting_count, moteur} """
+        total_cost = result['best_price'] 
+        colis = (result['best_config'], result['best_config_labels'])
+        compacting_count = result['compacting_count']
+        moteur = result['moteur']
         if colis is not None:
             colis_masses, colis_labels = colis
-            prix_colis = [ tarif_par_masse(sum(colis)) for colis in colis_masses ]
-            total_masses_colis = [ sum(colis) for colis in colis_masses ]
+            with mesurer(chrono, "conversion"):
+                prix_colis = [ tarif(sum(colis)) for colis in colis_masses ]
+                # Grams inside the optimizers, kg in the quote
+                total_masses_colis = [ masse_en_kg(sum(colis)) for colis in colis_masses ]
+                colis_masses = [ [masse_en_kg(masse) for masse in colis] for colis in colis_masses ]
             if self.VERBOSE:
-                print(f"\t[INFO] Total cost for DPD: {total_cost}€")
-                print(f"\t[INFO] Colis distribution: {colis_masses}")
-                print(f"\t[INFO] Colis distribution: {colis_labels}")
+                self.logger.debug("Total cost for DPD: %s€", total_cost)
+                self.logger.debug("Colis distribution: %s", colis_masses)
+                self.logger.debug("Colis distribution: %s", colis_labels)
             
-            return {"prix": total_cost*(1+self.options["POURCENTAGE_MAGE"]/100),
+            return {"prix_brut": total_cost,
                     "arrangement (masses)":colis_masses,
                     "arrangement (labels)": colis_labels,
                     "prix_colis":prix_colis,
                     "masses colis":total_masses_colis,
                     'compacting_count':compacting_count,
+                    'moteur':moteur,
                     }
         else :
             if self.VERBOSE:
-                print(f"\t[INFO] Total cost for DPD: NOT CALCULATED")
-                print(f"\t[INFO] Colis distribution: NOT CALCULATED")
-                print(f"\t[INFO] Colis distribution: NOT CALCULATED")     
-            return {'error': 'colis is None'}        
-    
-    def calculer_tarif_schenker_palette(self, panier, options, nbre_palette = 1, verbose=False):
-        poids_total = 0
+                self.logger.debug("Total cost for DPD: NOT CALCULATED")
+                self.logger.debug("Colis distribution: NOT CALCULATED")
+                self.logger.debug("Colis distribution: NOT CALCULATED")
+            return {'error': 'colis is None'}
+
+    def get_tarif_fichier(self, fichier, reglages=None):
+        """
+        Price function of another DPD grid csv (what-if scenarios) with the POIDS_MAX_COLIS_DPD of
+        reglages (default self.options). The file is parsed once per version, the function shared.
+        """
+        if reglages is None:
+            reglages = self.options
+        weights, prices = _lire_grille_dpd(fichier, os.path.getmtime(fichier))
+        return _tarif_grille(weights, prices, masse_en_grammes(reglages["POIDS_MAX_COLIS_DPD"]))
+
+    def calculer_tarif_dpd_scenarios(self, panier, scenarios, chrono=None, annulation=None, progression=None):
+        """
+        What-if DPD quotes of one cart under K tariff grids and/or colis max weights.
+        When the cost model picks the C exact engine for the cart, the scenarios the cart fits in are
+        priced in a single enumeration (bin.c.find_best_configs) : K results for about the cost of one.
+        Otherwise (compaction, MODE_DPD="deux_phases", no C engine) each scenario goes through
+        calculer_tarif_dpd. Either way the price of a scenario is the one of a quote made with its settings.
+
+        :param scenarios: list of {"nom", "fichier" (DPD grid csv, default the loaded one),
+                          "POIDS_MAX_COLIS_DPD" (kg, default the option)}
+        :param progression: optional utils.progression.Progression, follows the first scenario of the enumeration
+        :return: {nom: DPD result (prix, prix_brut, arrangement, prix_colis...) or {'error'}}
+        """
+        from models.cart import Cart
+        reglages = self.options
+        marge = reglages.get("POURCENTAGE_MAGE", 0)
+        panier = Cart.convertir(panier)
+        compter(chrono, "scenarios", len(scenarios))
+        preparations = []
+        for scenario in scenarios:
+            reglages_scenario = dict(reglages)
+            reglages_scenario["POIDS_MAX_COLIS_DPD"] = scenario.get("POIDS_MAX_COLIS_DPD", reglages["POIDS_MAX_COLIS_DPD"])
+            if scenario.get("fichier"):
+                tarif = self.get_tarif_fichier(scenario["fichier"], reglages_scenario)
+            else:
+                tarif = self.get_tarif_dpd(reglages_scenario)
+            preparations.append((scenario["nom"], reglages_scenario, tarif))
+
+        resultats = {}
+        enumeration = [(nom, tarif) for nom, _, tarif in preparations if panier.masse_max_g() < tarif.max_weight]
+        if enumeration and reglages.get("MODE_DPD") != "deux_phases":
+            items, items_label = panier.unites()
+            modele = self.get_modele_cout()
+            with mesurer(chrono, "calibration"):
+                modele.assurer_calibration(self.get_tarif_dpd(reglages), reglages.get("CALIBRATION_COUT_PATH"))
+            moteur = modele.choisir(len(items), reglages["BUDGET_LATENCE_MS"]/1000)
+            if moteur is not None and moteur.nom == "exact_c":
+                from bin.c import find_best_configs
+                moteur.suivre(progression, len(items))
+                with mesurer(chrono, "find_best_configs"):
+                    configs = find_best_configs(items, [tarif for _, tarif in enumeration], annulation, progression)
+                compter(chrono, "partitions", configs[0]["partitions"])
+                for (nom, tarif), config in zip(enumeration, configs):
+                    with mesurer(chrono, "conversion"):
+                        labels = self.etiqueter_colis(config["config"], items, items_label)
+                    resultat = self.presenter_tarif_dpd({
+                        "best_price": config["price"],
+                        "best_config": config["config"],
+                        "best_config_labels": labels,
+                        "compacting_count": 0,
+                        "moteur": moteur.nom,
+                    }, tarif, chrono)
+                    resultats[nom] = self.appliquer_marge(resultat, marge)
+
+        for nom, reglages_scenario, tarif in preparations:
+            if nom not in resultats:
+                resultat = self.calculer_tarif_dpd(panier, {}, chrono, reglages_scenario, annulation, progression, tarif)
+                resultats[nom] = self.appliquer_marge(resultat, marge)
+        return {nom: resultats[nom] for nom, _, _ in preparations}
+
+    def calculer_tarif_schenker_palette(self, panier, options, nbre_palette = 1, verbose=False, reglages=None):
+        if reglages is None:
+            reglages = self.options
         if self.VERBOSE:
-            print("[INFO] Calculating tarif for Schenker palette : ...")
+            self.logger.debug("Calculating tarif for Schenker palette : ...")
         departement = options['departement']
-        for article in panier:
-            poids_total += article['poids']
+        poids_total = panier.masse_totale()
         if self.VERBOSE:
-            print("\t[INFO] Poids total", poids_total)
-        if poids_total <= self.options["SEUIL_PALETTE_SCHENKER_MESSAGERIE"]:
+            self.logger.debug("Poids total %s", poids_total)
+        if poids_total <= reglages["SEUIL_PALETTE_SCHENKER_MESSAGERIE"]:
             if self.VERBOSE:
-                print("\t[WARNING] Poids total inferieur au seuil de palette")
-                print(f"\t[INFO] Poids total {poids_total} kg.")
+                self.logger.debug("Poids total inferieur au seuil de palette")
+                self.logger.debug("Poids total %s kg.", poids_total)
 
         if len(departement) == 1:
             departement = "0" + departement
         if len(departement)==2 and departement[-1]=="_":
             departement = "0" + departement
         if self.VERBOSE:
-            print("\t[INFO] Departement ", departement)
+            self.logger.debug("Departement %s", departement)
         # indentifying tarifs corresponding to departement
         dpt_list = self.csv[self.columns_labels[0]]
         # print(f"\t[INFO]{dpt_list}")
         try:
             index_dpt = dpt_list.index(departement)
         except:
-            print(f"[ERROR] Departement {departement} not on list {dpt_list}")
-            raise ValueError(f"[ERROR] Departement {departement} not on list {dpt_list}")
-        print(f"\t[INFO]{index_dpt=}")
+            logger.error("Departement %s not on list %s", departement, dpt_list)
+            raise InvalidQuoteInput(f"[ERROR] Departement {departement} not on list {dpt_list}")
+        if self.VERBOSE:
+            self.logger.debug("index_dpt=%r", index_dpt)
         tarifs_dpt = [ self.csv[col_label][index_dpt] for col_label in self.columns_labels[1:]]
-        print(f"\t[INFO]{tarifs_dpt=}")
         if self.VERBOSE:
-            print("\t[INFO] Tarifs du departement ", tarifs_dpt)
+            self.logger.debug("Tarifs du departement %s", tarifs_dpt)
         # identifying tarif for the matching nbre_palette
         try :
             tarif = tarifs_dpt[nbre_palette-1]
             if self.VERBOSE:
-                print(f"\t[INFO] Tarif pour {nbre_palette} palettes : {tarif}€")
-                print(f"[INFO] Calculating tarif for Schenker palette : DONE\n")
-            return {"prix" : tarif*(1+self.options["POURCENTAGE_MAGE"]/100)}
+                self.logger.debug("Tarif pour %s palettes : %s€", nbre_palette, tarif)
+                self.logger.debug("Calculating tarif for Schenker palette : DONE")
+            return {"prix_brut" : tarif}
         except IndexError:
-            print("[ERROR] Nombre de palettes invalide\n")
+            logger.error("Nombre de palettes invalide")
             return {'error':"[ERROR] Nombre de palettes invalide"}
             
-    def calculer_tarif_schenker_messagerie(self, panier, options):
+    def calculer_tarif_schenker_messagerie(self, panier, options, reglages=None):
+        if reglages is None:
+            reglages = self.options
         if self.VERBOSE:
-            print("[INFO] Calculating tarif for Schenker messagerie : ...")
+            self.logger.debug("Calculating tarif for Schenker messagerie : ...")
         departement = options['departement']
         
         tarif = 0
-        poids_total = 0
-        for article in panier:
-            poids_total += article['poids']
-        if not (poids_total > self.options["POIDS_MAX_COLIS_DPD"]  and poids_total <= self.options["SEUIL_PALETTE_SCHENKER_MESSAGERIE"]):
+        poids_total = panier.masse_totale()
+        if not (poids_total > reglages["POIDS_MAX_COLIS_DPD"]  and poids_total <= reglages["SEUIL_PALETTE_SCHENKER_MESSAGERIE"]):
             if self.VERBOSE:
-                print(f"\t[WARNING] Poids total {poids_total} kg. Poids doit etre compris entre {self.options['POIDS_MAX_COLIS_DPD']} et {self.options['SEUIL_PALETTE_SCHENKER_MESSAGERIE']} kg") 
+                self.logger.debug("Poids total %s kg. Poids doit etre compris entre %s et %s kg", poids_total, reglages['POIDS_MAX_COLIS_DPD'], reglages['SEUIL_PALETTE_SCHENKER_MESSAGERIE'])
         if self.VERBOSE:
-            print("\t[INFO] Poids total :", poids_total)
+            self.logger.debug("Poids total : %s", poids_total)
         # identifying the corresponding zone for the departement
         if len(departement) == 1:
             departement = "0" + departement
@@ -375,8 +880,8 @@ class Transporteur:
             departement = "0" + departement
         if departement[-1] == "_":
             if self.VERBOSE:
-                print("\t[INFO] Departement zone speciale (corse monaco ou station) TO BE DONE :", departement)
-                print("\t[INFO] Calculating tarif for Schenker messagerie : NOT VALID YET")
+                self.logger.debug("Departement zone speciale (corse monaco ou station) TO BE DONE : %s", departement)
+                self.logger.debug("Calculating tarif for Schenker messagerie : NOT VALID YET")
             return {"error":"localite speciale non gerees pour le moment"}
         # if departement in self.csv["zone1"]:
         #     zone = 1
@@ -395,44 +900,41 @@ class Transporteur:
         
 
         if zone is None:
-            if self.VERBOSE:
-                print("\t[INFO] Departement invalide :", departement)
-                print("[INFO] Calculating tarif for Schenker messagerie : ERROR")
-            raise ValueError("Departement invalide")
+            logger.error("Departement invalide : %s", departement)
+            raise InvalidQuoteInput(f"[ERROR] Departement invalide : {departement}")
         
         tarif_zone = self.csv[zone]
         kgs = self.csv[self.columns_labels[0]]
 
         if self.VERBOSE:
-            print("\t[INFO] Zone ", zone)
-            print(f"\t[INFO] Tarif zone {zone} : ", tarif_zone)
-        if poids_total < self.options["SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"]:
+            self.logger.debug("Zone %s", zone)
+            self.logger.debug("Tarif zone %s : %s", zone, tarif_zone)
+        if poids_total < reglages["SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"]:
             # calculating the tarif
             if self.VERBOSE:
-                print(f'\t[INFO] Tarification par tranches (>{self.options["SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"]} kg)')
+                self.logger.debug('Tarification par tranches (>%s kg)', reglages["SEUIL_PRIX_AU_KG_MESSAGERIE_SCHENKER"])
             for i in range(len(kgs)):
                 if poids_total <= kgs[i]:
                     tarif = tarif_zone[i]
                     if self.VERBOSE:
-                        print(f"\t[INFO] Tarif pour {poids_total} kg : {tarif}€")
-                        print(f"[INFO] Calculating tarif for Schenker messagerie : DONE\n")
-                    return {"prix" : tarif*(1+self.options["POURCENTAGE_MAGE"]/100)}
+                        self.logger.debug("Tarif pour %s kg : %s€", poids_total, tarif)
+                        self.logger.debug("Calculating tarif for Schenker messagerie : DONE")
+                    return {"prix_brut" : tarif}
         else :
-            if poids_total>self.options["MAX_POIDS_MESSAGERIE_SCHENKER"]:
+            if poids_total>reglages["MAX_POIDS_MESSAGERIE_SCHENKER"]:
                 if self.VERBOSE:
-                    print(f'\t[ERROR] Poids total {poids_total} kg. Poids doit etre inferieur a {self.options["MAX_POIDS_MESSAGERIE_SCHENKER"]} kg')
-                    print("[ERROR] Calculating tarif for Schenker messagerie : poids total trop eleve\n")
+                    self.logger.debug('Poids total %s kg. Poids doit etre inferieur a %s kg', poids_total, reglages["MAX_POIDS_MESSAGERIE_SCHENKER"])
                 return {"error": "Poids total trop eleve"}
             else:
                 if self.VERBOSE:
-                    print(f"\t[INFO] Tarification par tranche de 100 kg")
+                    self.logger.debug("Tarification par tranche de 100 kg")
                 for i in range(len(kgs)):
                     if poids_total <= kgs[i]:
                         tarif_aux_100kg = tarif_zone[i]
                         if self.VERBOSE:
-                            print(f"\t[INFO] Tarif aux 100 kg : {tarif_aux_100kg}€ pour {poids_total//100} tranches de 100 kg")
+                            self.logger.debug("Tarif aux 100 kg : %s€ pour %s tranches de 100 kg", tarif_aux_100kg, poids_total//100)
                         tarif = tarif_aux_100kg * (poids_total//100)
                         if self.VERBOSE:
-                            print(f"\t[INFO] Tarif pour {poids_total} kg : {tarif}€")
-                            print(f"[INFO] Calculating tarif for Schenker messagerie : DONE\n")
-                        return {"prix" : tarif*(1+self.options["POURCENTAGE_MAGE"]/100)}
\ No newline at end of file
+                            self.logger.debug("Tarif pour %s kg : %s€", poids_total, tarif)
+                            self.logger.debug("Calculating tarif for Schenker messagerie : DONE")
+                        return {"prix_brut" : tarif}
\ No newline at end of file
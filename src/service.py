@@ -0,0 +1,241 @@
+"""
+Local HTTP quote service (e-shop checkout), asyncio and the standard library only.
+
+Run from the src directory :
+    python service.py --port 8080 --workers 4 --marge 10
+
+Endpoints :
+    POST /quote    {"country": "france", "departement": "75", "articles": [{"nom": "vis", "poids": 0.2, "quantite": 3}]}
+                   -> result of CalculateurFraisLivraison.calculer for the cart
+    GET  /metrics  counters and latencies, Prometheus text format
+    GET  /health   {"status": "ok"}
+
+Quotes run in a bounded pool of worker processes, one prewarmed calculator each (tariffs are
+loaded once per worker), the event loop only parses requests and awaits the pool.
+Identical carts quoted at the same time share one computation (coalescing). When more than
+--max-attente carts are waiting for the pool, new quotes are answered 503 with Retry-After
+instead of queueing without bound.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from calculateur import initialiser_worker, calculer_worker
+from models.calculation_errors import InvalidQuoteInput
+
+logger = logging.getLogger(__name__)
+
+TAILLE_MAX_CORPS = 1 << 20
+STATUTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+# Upper bounds (s) of the latency histogram buckets
+BUCKETS_LATENCE = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class RequeteInvalide(Exception):
+    def __init__(self, statut, message):
+        super().__init__(message)
+        self.statut = statut
+
+
+class Metriques:
+    """ Counters exposed on /metrics """
+    def __init__(self):
+        self.compteurs = {
+            "requetes_total": 0,
+            "devis_total": 0,
+            "devis_calcules_total": 0,
+            "devis_coalesces_total": 0,
+            "devis_rejetes_total": 0,
+            "devis_erreurs_total": 0,
+        }
+        self.buckets = [0]*len(BUCKETS_LATENCE)
+        self.somme_latences = 0.0
+        self.nombre_latences = 0
+
+    def incrementer(self, nom, valeur=1):
+        self.compteurs[nom] += valeur
+
+    def observer(self, duree):
+        for index, borne in enumerate(BUCKETS_LATENCE):
+            if duree <= borne:
+                self.buckets[index] += 1
+        self.somme_latences += duree
+        self.nombre_latences += 1
+
+    def exposer(self, jauges):
+        lignes = []
+        for nom, valeur in self.compteurs.items():
+            lignes += [f"# TYPE mage_{nom} counter", f"mage_{nom} {valeur}"]
+        for nom, valeur in jauges.items():
+            lignes += [f"# TYPE mage_{nom} gauge", f"mage_{nom} {valeur}"]
+        lignes.append("# TYPE mage_devis_latence_secondes histogram")
+        for borne, valeur in zip(BUCKETS_LATENCE, self.buckets):
+            lignes.append(f'mage_devis_latence_secondes_bucket{{le="{borne}"}} {valeur}')
+        lignes.append(f'mage_devis_latence_secondes_bucket{{le="+Inf"}} {self.nombre_latences}')
+        lignes.append(f"mage_devis_latence_secondes_sum {self.somme_latences}")
+        lignes.append(f"mage_devis_latence_secondes_count {self.nombre_latences}")
+        return "\n".join(lignes) + "\n"
+
+
+class ServiceDevis:
+    def __init__(self, executor, workers, max_attente, timeout):
+        self.executor = executor
+        self.workers = workers
+        self.max_attente = max_attente
+        self.timeout = timeout
+        self.en_cours = {}
+        self.metriques = Metriques()
+
+    def lire_commande(self, corps):
+        """ (key, cart lines, options) of a /quote body """
+        from models.cart import Cart
+        try:
+            commande = json.loads(corps or b"{}")
+            panier = Cart.depuis_articles(commande["articles"])
+            options = {
+                "country": str(commande.get("country") or "france").strip().lower(),
+                "departement": str(commande["departement"]).strip(),
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            raise RequeteInvalide(400, f"Invalid quote request : {e!r}")
+        if not panier:
+            raise RequeteInvalide(400, "Empty cart")
+        lignes = panier.empreinte()
+        return (options["country"], options["departement"], lignes), lignes, options
+
+    async def devis(self, corps):
+        cle, lignes, options = self.lire_commande(corps)
+        self.metriques.incrementer("devis_total")
+        future = self.en_cours.get(cle)
+        if future is not None:
+            # Same cart already being quoted : wait for that computation
+            self.metriques.incrementer("devis_coalesces_total")
+        else:
+            if len(self.en_cours) >= self.max_attente:
+                self.metriques.incrementer("devis_rejetes_total")
+                raise RequeteInvalide(503, "Quote service saturated, retry later")
+            future = asyncio.get_running_loop().run_in_executor(self.executor, calculer_worker, lignes, options)
+            self.en_cours[cle] = future
+            future.add_done_callback(lambda _: self.en_cours.pop(cle, None))
+            self.metriques.incrementer("devis_calcules_total")
+        debut = time.perf_counter()
+        try:
+            # shield : a client giving up does not cancel the computation shared with the others
+            resultats = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.metriques.incrementer("devis_erreurs_total")
+            raise RequeteInvalide(504, f"Quote not computed within {self.timeout} s")
+        except InvalidQuoteInput as e:
+            # Bad input found by the calculation (unknown departement...) : a client error, like parsing ones
+            raise RequeteInvalide(400, f"Invalid quote request : {e}")
+        except Exception as e:
+            self.metriques.incrementer("devis_erreurs_total")
+            logger.error("Quote failed : %s", e)
+            raise RequeteInvalide(500, f"Quote failed : {e}")
+        self.metriques.observer(time.perf_counter() - debut)
+        return resultats
+
+    async def traiter(self, methode, chemin, corps):
+        """ (status, content type, body) of a request """
+        self.metriques.incrementer("requetes_total")
+        if chemin == "/quote":
+            if methode != "POST":
+                raise RequeteInvalide(405, "POST a cart to /quote")
+            return 200, "application/json", json.dumps(await self.devis(corps), ensure_ascii=False, default=float)
+        if chemin == "/metrics":
+            jauges = {"devis_en_cours": len(self.en_cours), "workers": self.workers, "max_attente": self.max_attente}
+            return 200, "text/plain; version=0.0.4", self.metriques.exposer(jauges)
+        if chemin == "/health":
+            return 200, "application/json", json.dumps({"status": "ok"})
+        raise RequeteInvalide(404, f"Unknown path {chemin}")
+
+    async def connexion(self, reader, writer):
+        """ HTTP/1.1 connection, kept alive until the client closes it """
+        try:
+            while True:
+                ligne = await reader.readline()
+                if not ligne:
+                    break
+                try:
+                    methode, cible, version = ligne.decode("latin-1").split()
+                except ValueError:
+                    break
+                entetes = {}
+                while True:
+                    entete = await reader.readline()
+                    if entete in (b"\r\n", b"\n", b""):
+                        break
+                    nom, _, valeur = entete.decode("latin-1").partition(":")
+                    entetes[nom.strip().lower()] = valeur.strip()
+                garder = entetes.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                entetes_reponse = {}
+                try:
+                    longueur = int(entetes.get("content-length", 0))
+                    if longueur > TAILLE_MAX_CORPS:
+                        garder = False
+                        raise RequeteInvalide(413, "Request body too large")
+                    corps = await reader.readexactly(longueur) if longueur else b""
+                    statut, type_contenu, contenu = await self.traiter(methode, cible.split("?")[0], corps)
+                except RequeteInvalide as e:
+                    statut, type_contenu, contenu = e.statut, "application/json", json.dumps({"error": str(e)})
+                    if e.statut == 503:
+                        entetes_reponse["Retry-After"] = "1"
+                donnees = contenu.encode()
+                entetes_reponse.update({
+                    "Content-Type": type_contenu,
+                    "Content-Length": str(len(donnees)),
+                    "Connection": "keep-alive" if garder else "close",
+                })
+                writer.write(f"HTTP/1.1 {statut} {STATUTS.get(statut, '')}\r\n".encode()
+                             + "".join(f"{nom}: {valeur}\r\n" for nom, valeur in entetes_reponse.items()).encode()
+                             + b"\r\n" + donnees)
+                await writer.drain()
+                if not garder:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def servir(hote, port, service):
+    serveur = await asyncio.start_server(service.connexion, hote, port)
+    logger.info("Quote service listening on http://%s:%s (%s workers)", hote, port, service.workers)
+    async with serveur:
+        await serveur.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP quote service")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes of the quote pool")
+    parser.add_argument("--max-attente", type=int, help="distinct carts waiting for the pool before answering 503 (default 8 per worker)")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a quote is answered 504")
+    parser.add_argument("--marge", type=float, default=0, help="POURCENTAGE_MAGE applied to every carrier")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stderr)
+    logging.getLogger("utils.utils").setLevel(logging.ERROR)
+    logging.getLogger("models.transporteurs").setLevel(logging.ERROR)
+    options = {"POURCENTAGE_MAGE": args.marge}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=initialiser_worker, initargs=(options,)) as executor:
+        # Workers are started (tariffs loaded, optimizer calibrated) before the first checkout
+        for future in [executor.submit(os.getpid) for _ in range(args.workers)]:
+            future.result()
+        service = ServiceDevis(executor, args.workers, args.max_attente or 8*args.workers, args.timeout)
+        try:
+            asyncio.run(servir(args.hote, args.port, service))
+        except KeyboardInterrupt:
+            logger.info("Quote service stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
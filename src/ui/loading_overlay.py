@@ -1,12 +1,15 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel
+    QWidget, QVBoxLayout, QLabel, QPushButton, QProgressBar
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from ui.loading_spinner import LoadingSpinner
 
 
 
 class LoadingOverlay(QWidget):
+    # "Annuler" clicked : the running calculation should be cancelled
+    annulation_demandee = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
@@ -34,7 +37,7 @@ class LoadingOverlay(QWidget):
         # Create container widget with a unique object name for styling
         self.container = QWidget(self)
         self.container.setObjectName("container")
-        self.container.setFixedSize(200, 200)  # Fixed size for the container
+        self.container.setFixedSize(240, 340)  # Fixed size for the container
         
         # Container layout
         container_layout = QVBoxLayout(self.container)
@@ -50,6 +53,40 @@ class LoadingOverlay(QWidget):
         self.label = QLabel("Calcul en cours...")
         self.label.setAlignment(Qt.AlignCenter)
         container_layout.addWidget(self.label, 0, Qt.AlignHCenter)
+        
+        # Progress of the DPD search, shown once the optimizer reports it
+        self.barre = QProgressBar()
+        self.barre.setRange(0, 1000)
+        self.barre.setTextVisible(False)
+        container_layout.addWidget(self.barre)
+        self.detail = QLabel()
+        self.detail.setAlignment(Qt.AlignCenter)
+        self.detail.setStyleSheet("font-size: 11px; font-weight: normal;")
+        container_layout.addWidget(self.detail, 0, Qt.AlignHCenter)
+        self.reinitialiser_progression()
+        
+        # Cancel button, the inputs stay as they are for a new calculation
+        self.bouton_annuler = QPushButton("Annuler")
+        self.bouton_annuler.clicked.connect(self.annulation_demandee.emit)
+        container_layout.addWidget(self.bouton_annuler, 0, Qt.AlignHCenter)
+
+    def reinitialiser_progression(self):
+        self.barre.setValue(0)
+        self.barre.hide()
+        self.detail.clear()
+        self.detail.hide()
+
+    def afficher_progression(self, etat):
+        """ etat : snapshot of utils.progression.Progression (CalculatorThread.avancement) """
+        self.barre.setValue(int(etat["fraction"]*1000))
+        lignes = [f"{etat['explorees']:,} / {etat['total']:,} {etat['unite']}".replace(",", " ")]
+        if etat["meilleur_prix"] is not None:
+            lignes.append(f"Meilleur prix : {etat['meilleur_prix']:.2f} €")
+        if etat["eta_s"] is not None:
+            lignes.append(f"Temps restant : ~{etat['eta_s']:.0f} s")
+        self.detail.setText("\n".join(lignes))
+        self.barre.show()
+        self.detail.show()
 
     def showEvent(self, event):
         super().showEvent(event)
@@ -59,6 +96,7 @@ class LoadingOverlay(QWidget):
     def hideEvent(self, event):
         super().hideEvent(event)
         self.spinner.stop()
+        self.reinitialiser_progression()
     
     def updatePosition(self):
         if self.parent():
@@ -1,7 +1,11 @@
 """
 Shipping Calculator UI - A PyQt5 application for calculating shipping costs.
 """
+import json
+import logging
 import sys
+import time
+from concurrent.futures import InvalidStateError
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from PyQt5.QtWidgets import (
@@ -16,8 +20,12 @@ from ui.styles import StyleConstants
 from ui.loading_overlay import LoadingOverlay
 from models.calculation_errors import CalculationError
 from models.calculator_thread import CalculatorThread
+from models.cart import Cart
 
-from utils.utils import read_csv_file_with_headers
+from utils.utils import read_csv_file_with_headers, masse_en_grammes
+from utils.timing import Chronometre
+
+logger = logging.getLogger(__name__)
 
 
 class ShippingCalculator(QMainWindow):
@@ -34,6 +42,10 @@ class ShippingCalculator(QMainWindow):
         self.articles_headers, self.articles_structure, self.articles_list, = self._load_articles_list()
         self.country_list = self._load_country_list()
         self.entries_layout = None
+        self.calc_thread = None
+        self.msg_box_warning = None
+        # Cancelled calculation threads, kept alive until their run returns
+        self.threads_annules: List[CalculatorThread] = []
         
         self.init_ui()
         self.apply_styles()
@@ -62,11 +74,10 @@ class ShippingCalculator(QMainWindow):
             # return articles_list
             
         except FileNotFoundError as e:
-            print(f"Error: Could not find articles list file: {e}")
+            logger.error("Could not find articles list file: %s", e)
             return []
         except Exception as e:
-            print(f"Error loading articles list: {e}")
-            print(e.__traceback__())
+            logger.exception("Error loading articles list: %s", e)
             return []
         return header, columns_labels, csv
     
@@ -88,10 +99,10 @@ class ShippingCalculator(QMainWindow):
             return csv[columns_labels[0]]
             
         except FileNotFoundError as e:
-            print(f"Error: Could not find country list file: {e}")
+            logger.error("Could not find country list file: %s", e)
             return []
         except Exception as e:
-            print(f"Error loading country list : {e}")
+            logger.error("Error loading country list : %s", e)
             return []
 
     def init_ui(self) -> None:
@@ -377,6 +388,7 @@ class ShippingCalculator(QMainWindow):
     def setup_loading_overlay(self):
         """Initialize the loading overlay"""
         self.loading_overlay = LoadingOverlay(self)
+        self.loading_overlay.annulation_demandee.connect(self.annuler_calcul)
         self.loading_overlay.hide()
     
     def show_loading_overlay(self):
@@ -406,13 +418,13 @@ class ShippingCalculator(QMainWindow):
                     # print(article)
                     articles_list.append(article)
                 
-                print(f"articles list loaded : \n {articles_list}")
+                logger.debug("articles list loaded : \n %s", articles_list)
                 return articles_list
         except FileNotFoundError as e:
-            print(e)
+            logger.error("%s", e)
             return None
         except Exception as e :
-            print(e)
+            logger.error("%s", e)
             return articles_list
 
 
@@ -513,7 +525,7 @@ class ShippingCalculator(QMainWindow):
     def switch_input_format(self,input_format):
         """ Switch input between raw and dropdown """
         #Switch envireonnment variable
-        print(f"[INFO] Switching input format to : {input_format}")
+        logger.info("Switching input format to : %s", input_format)
         self.input_format = input_format
         
         self.clear_all()        
@@ -593,7 +605,7 @@ class ShippingCalculator(QMainWindow):
             if index is not None:
                 # input format found 
                 article_list = [f"{self.articles_list[self.articles_structure[0]][i]}. {self.articles_list[self.articles_structure[index]][i]}" for i in range(len(self.articles_list[self.articles_structure[0]]))]
-                print(f"[INFO] Article list = {article_list}")
+                logger.debug("Article list = %s", article_list)
                 combobox.addItems(article_list)
             else: # Defaulting to index col 0 + 1 (inserted id col) for ref 
                 if self.input_format == 'ref':
@@ -642,7 +654,8 @@ class ShippingCalculator(QMainWindow):
                     if weight_text:
                         panier.append({
                             'nom': f'article{len(panier)+1}',
-                            'poids': float(weight_text)
+                            'poids': float(weight_text),
+                            'poids_g': masse_en_grammes(weight_text)
                         })
                 elif self.input_format == 'designation' or self.input_format =='ref':
                     combobox_text = entry_data['combobox'].currentText().split('.')
@@ -661,16 +674,26 @@ class ShippingCalculator(QMainWindow):
                     matching_weight = self.articles_list[self.articles_structure[mass_col]][article_index]
                     article_qty = int(entry_data['qty_box'].cleanText())
                     if matching_weight is not None:
-                        for _ in range(article_qty):
-                            panier.append({
-                                'nom' : article_name_or_ref,
-                                'poids' : float(matching_weight)
-                            })
+                        panier.append({
+                            'nom' : article_name_or_ref,
+                            'poids' : float(matching_weight),
+                            'poids_g' : masse_en_grammes(matching_weight),
+                            'quantite' : article_qty
+                        })
         except Exception as e :
-            print(f"[ERROR] Could not load the create the cart from inputs : \n {e}")
-        print(f"[INFO] Panier successfully parsed :\n {panier}")
+            logger.error("Could not load the create the cart from inputs : \n %s", e)
+        panier = Cart.depuis_articles(panier)
+        logger.debug("Panier successfully parsed :\n %s", panier)
         return panier
 
+    @staticmethod
+    def _decrire_panier(panier, max_lignes=10):
+        """ Cart lines as displayed in the basket label """
+        lignes = [f"{quantite}x {masse}kg --> {nom}" if quantite > 1 else f"{masse}kg --> {nom}" for nom, masse, quantite in panier.lignes()]
+        if len(lignes) > max_lignes:
+            return "\n".join(lignes[:max_lignes]) + "\n ..."
+        return "\n".join(lignes)
+
     @staticmethod
     def _is_valid_departement(departement : str) -> bool:
         if type(departement) is not str :
@@ -696,12 +719,12 @@ class ShippingCalculator(QMainWindow):
             int(departement)
             pourcentage_mage = float(pourcentage_mage)
         except Exception as e :
-            print("[ERROR] Unable to convert to float : {e}")
+            logger.error("Unable to convert to float : %s", e)
             return None
-        print('[INFO] Input options parsed successfully')
+        logger.info('Input options parsed successfully')
+        # SEUIL_ARTICLE_LEGER stays the calculator option : the margin is applied post-hoc and never changes the packing
         return {
             'POIDS_MAX_COLIS_DPD':max_dpd,
-            'SEUIL_ARTICLE_LEGER':pourcentage_mage,
             "POURCENTAGE_MAGE":pourcentage_mage,
             "country" : country,
             "departement" : departement,
@@ -718,7 +741,7 @@ class ShippingCalculator(QMainWindow):
                         f"Le calcul n'a pas pu etre effectué : \n {e}",
                         QMessageBox.Ok,
                         )
-            print("[INFO] Error handled during calculation")
+            logger.info("Error handled during calculation")
         except Exception as e: 
             parent = QWidget()
             qm_result = QMessageBox.critical(
@@ -727,7 +750,7 @@ class ShippingCalculator(QMainWindow):
                         f"Erreur critique durant le calcul. Le programme va se fermer. \n {e}",
                         QMessageBox.Ok,
                         )
-            print(f"[ERROR] Erreur critique durant le calcul. Le programme va se fermer. \n {e}")
+            logger.error("Erreur critique durant le calcul. Le programme va se fermer. \n %s", e)
             quit()            
 
     # Remove the original calculer_frais_wrapper method
@@ -744,7 +767,7 @@ class ShippingCalculator(QMainWindow):
                 f"Le calcul n'a pas pu etre effectué : \n {e}",
                 QMessageBox.Ok,
             )
-            print("[INFO] Error handled during calculation")
+            logger.info("Error handled during calculation")
         except Exception as e:
             self.hide_loading_overlay()  # Make sure overlay is hidden
             parent = QWidget()
@@ -754,7 +777,7 @@ class ShippingCalculator(QMainWindow):
                 f"Erreur critique durant le calcul. \n {e}",
                 QMessageBox.Ok,
             )
-            print(f"[ERROR] Critical error during calculation: \n {e}")
+            logger.error("Critical error during calculation: \n %s", e)
 
     def calculer_frais(self):
         try:
@@ -763,18 +786,14 @@ class ShippingCalculator(QMainWindow):
             try:
                 self.calculator.set_options(options)
             except Exception as e:
-                print(f"[ERROR] Could not set options : {e}")
+                logger.error("Could not set options : %s", e)
                 raise CalculationError(f"[ERROR] Could not set options : {e}")
-            if panier == []:
-                print('[WARNING] Panier is empty ! ')
+            if not panier:
+                logger.warning('Panier is empty !')
                 raise CalculationError('[WARNING] Panier is empty ! ')
             
             panier = self.calculator.compact_shopping_cart(panier)
-            if len(panier)<10:
-                label_articles = "\n".join([f"{article['poids']}kg --> {article['nom']}" for article in panier])
-            else :
-                label_articles = "\n".join([f"{article['poids']}kg --> {article['nom']}" for article in panier[:10]])
-                label_articles+="\n ..."
+            label_articles = self._decrire_panier(panier)
 
             # Show loading overlay and ensure it's displayed
             # self.loading_overlay.raise_()
@@ -787,7 +806,7 @@ class ShippingCalculator(QMainWindow):
                 QApplication.processEvents()  # Process any pending events
             except Exception as e: 
                 self.hide_loading_overlay()
-                print(f"[ERROR] Error during calculation {e}")
+                logger.error("Error during calculation %s", e)
                 raise CalculationError(f"[ERROR] Error from calculator {e}")
             finally:
                 # Hide loading overlay after calculation (even if there's an error)
@@ -865,19 +884,21 @@ class ShippingCalculator(QMainWindow):
                     
         except SyntaxError as e:
             self.result_labels['basket'].setText(f"Erreur: Departement invalide {e}")
-            print(f"[WARNING] Synthax error in departement : {e}")
+            logger.warning("Synthax error in departement : %s", e)
             raise CalculationError(f"[WARNING] Synthax error in departement : {e}")
 
         except ValueError as e:
             self.result_labels['basket'].setText(f"Erreur: poids invalides {e}")
-            print(f"[WARNING] Value error calculating : {e}")
+            logger.warning("Value error calculating : %s", e)
             raise CalculationError(f"[WARNING] Value error calculating : {e}")
 
     def new_calculer_frais(self):
         """Calculate shipping costs in a separate thread"""
         try:
             # Prepare data for calculation
-            panier = self.create_shopping_cart()
+            self.chrono_calcul = Chronometre()
+            with self.chrono_calcul.mesurer("create_shopping_cart"):
+                panier = self.create_shopping_cart()
             if not panier:
                 raise CalculationError('[WARNING] Panier is empty!')
                 
@@ -889,7 +910,12 @@ class ShippingCalculator(QMainWindow):
             # This will show any warning messages from the calculator
             try:
                 self.calculator.set_options(options)
-                panier = self.calculator.compact_shopping_cart(panier)
+                self.chrono_calcul.compter("articles avant compactage", len(panier))
+                with self.chrono_calcul.mesurer("compact_shopping_cart"):
+                    panier = self.calculator.compact_shopping_cart(panier)
+                self.chrono_calcul.compter("articles apres compactage", len(panier))
+                # Kept for the basket display of the results, the cart is not rebuilt from the inputs
+                self.panier_calcul = panier
                 # If you have a method to check if calculation will be long, call it here
                 if hasattr(self.calculator, 'check_calculation'):
                     should_continue = self.calculator.check_calculation(panier, options)
@@ -898,31 +924,39 @@ class ShippingCalculator(QMainWindow):
             except Exception as e:
                 raise CalculationError(str(e))
 
+            # A calculation still running is cancelled, its results would be for the previous inputs
+            if self.calc_thread is not None and self.calc_thread.isRunning():
+                self._detacher_thread(self.calc_thread)
+
             # Show loading overlay
             self.show_loading_overlay()
             
             # Create and configure calculator thread
-            self.calc_thread = CalculatorThread(self.calculator, panier, options)
+            self.calc_thread = CalculatorThread(self.calculator, panier, options, self.chrono_calcul)
             
             # Connect signals - make sure these are properly connected
-            print("Connecting signals...")
+            logger.debug("Connecting signals...")
             self.calc_thread.finished.connect(self._handle_calculation_results)
             self.calc_thread.error.connect(self._handle_calculation_error)
             self.calc_thread.warning.connect(self._handle_warning)
+            self.calc_thread.warning_expire.connect(self._fermer_warning)
+            self.calc_thread.cancelled.connect(self._handle_calculation_cancelled)
+            self.calc_thread.avancement.connect(self.loading_overlay.afficher_progression)
             self.calc_thread.finished.connect(self.hide_loading_overlay)
             self.calc_thread.error.connect(self.hide_loading_overlay)
             
-            print("Starting calculation thread")
+            logger.info("Starting calculation thread")
             self.calc_thread.start()
             
         except Exception as e:
-            print("Error in calculer_frais:", str(e))
+            logger.error("Error in calculer_frais: %s", e)
             self.hide_loading_overlay()
             raise CalculationError(str(e))
 
     def _handle_calculation_results(self, resultats):
         """Handle the calculation results"""
-        print("Handling calculation results:", resultats)
+        logger.debug("Handling calculation results: %s", resultats)
+        debut_affichage = time.perf_counter()
         try:
             # Update DPD results
             if "error" not in resultats['dpd']:
@@ -974,27 +1008,59 @@ class ShippingCalculator(QMainWindow):
             self._update_price_highlights(min_prix, prix_dpd, prix_schenker_messagerie, prix_schenker_palette)
             
             # Update basket display
-            panier = self.create_shopping_cart()
-            panier = self.calculator.compact_shopping_cart(panier)
-            if len(panier) < 10:
-                label_articles = "\n".join([f"{article['poids']}kg --> {article['nom']}" for article in panier])
-            else:
-                label_articles = "\n".join([f"{article['poids']}kg --> {article['nom']}" for article in panier[:10]])
-                label_articles += "\n ..."
-            self.result_labels['basket'].setText(f"Panier : \n{label_articles}")
+            panier = getattr(self, 'panier_calcul', None)
+            if panier is None:
+                panier = self.calculator.compact_shopping_cart(self.create_shopping_cart())
+            self.result_labels['basket'].setText(f"Panier : \n{self._decrire_panier(panier)}")
             
-            print("Finished handling results")
+            if "timings" in resultats:
+                resultats["timings"]["etapes_ms"]["_handle_calculation_results"] = (time.perf_counter() - debut_affichage)*1000
+                # One JSON line per quote, aggregated by the ops dashboard from the log files
+                logger.info("timings %s", json.dumps(resultats["timings"]))
+            logger.debug("Finished handling results")
         except Exception as e:
-            print("Error handling results:", str(e))
+            logger.error("Error handling results: %s", e)
             self._handle_calculation_error(str(e))
 
+    def annuler_calcul(self):
+        """ Cancels the running calculation, a new one can be started right away """
+        if self.calc_thread is not None and self.calc_thread.isRunning():
+            logger.info("Cancelling calculation")
+            self._detacher_thread(self.calc_thread)
+        self.hide_loading_overlay()
+        self.result_labels['basket'].setText("Calcul annulé")
+
+    def _detacher_thread(self, thread):
+        """ Cancels thread and disconnects it : nothing it emits reaches the window anymore """
+        thread.annuler()
+        for signal in (thread.finished, thread.error, thread.warning, thread.warning_expire, thread.cancelled, thread.avancement):
+            try:
+                signal.disconnect()
+            except TypeError:
+                # Nothing connected
+                pass
+        self.threads_annules.append(thread)
+        thread.termine.connect(lambda: self._liberer_thread(thread))
+
+    def _liberer_thread(self, thread):
+        thread.wait()
+        if thread in self.threads_annules:
+            self.threads_annules.remove(thread)
+
+    def _handle_calculation_cancelled(self):
+        self.hide_loading_overlay()
+        self.result_labels['basket'].setText("Calcul annulé")
+
     def _handle_calculation_error(self, error_msg):
         """Handle calculation errors"""
         self.hide_loading_overlay()
         raise CalculationError(error_msg)
 
-    def _handle_warning(self, message):
-        """Handle warnings from the calculator thread"""
+    def _handle_warning(self, message, question):
+        """Handle warnings from the calculator thread, the answer is set on the question future"""
+        if question.done():
+            # Cancelled or timed out before being shown
+            return
         self.hide_loading_overlay()
         
         # Store the current application stylesheet
@@ -1011,18 +1077,28 @@ class ShippingCalculator(QMainWindow):
         msg_box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
         msg_box.setDefaultButton(QMessageBox.No)
         
-        # Show dialog and get response
+        # Show dialog and get response, closed by _fermer_warning when the thread stops waiting
+        self.msg_box_warning = msg_box
         qm_result = msg_box.exec_()
+        self.msg_box_warning = None
         
         # Restore application stylesheet
         QApplication.instance().setStyleSheet(current_stylesheet)
         
         # Send response back to thread
-        self.calc_thread.warning_response = (qm_result == QMessageBox.Yes)
+        try:
+            question.set_result(qm_result == QMessageBox.Yes)
+        except InvalidStateError:
+            # Timed out or cancelled meanwhile, the thread no longer waits
+            return
         
         if qm_result == QMessageBox.Yes:
             self.show_loading_overlay()
 
+    def _fermer_warning(self):
+        if self.msg_box_warning is not None:
+            self.msg_box_warning.reject()
+
     def _update_price_highlights(self, min_prix, prix_dpd, prix_schenker_messagerie, prix_schenker_palette):
         """Update the highlighting of prices"""
         # Reset colors
@@ -0,0 +1,39 @@
+"""
+Cooperative cancellation of a running calculation.
+
+The token is handed down from the caller (CalculatorThread...) to the optimizers, which poll it :
+the python engines between partitions, the C engine reads the same int through a pointer.
+
+Example:
+    >>> annulation = Annulation()
+    >>> calculateur.calculer(panier, options, annulation=annulation)     # in a worker thread
+    >>> annulation.annuler()        # from any thread : the calculation raises CalculationCancelled
+"""
+import ctypes
+
+from models.calculation_errors import CalculationCancelled
+
+
+class Annulation:
+    """ Cancellation flag, a C int so the C optimizer loop can poll it without the GIL """
+    def __init__(self, drapeau=None):
+        """ drapeau : existing ctypes.c_int to poll (shared memory of models.pool_optimiseurs), default a new one """
+        self.drapeau = drapeau if drapeau is not None else ctypes.c_int(0)
+
+    def annuler(self):
+        self.drapeau.value = 1
+
+    @property
+    def annulee(self):
+        return bool(self.drapeau.value)
+
+    def verifier(self):
+        """ Raises CalculationCancelled once annuler has been called """
+        if self.drapeau.value:
+            raise CalculationCancelled()
+
+
+def verifier(annulation):
+    """ annulation.verifier(), ignored when no token is given """
+    if annulation is not None:
+        annulation.verifier()
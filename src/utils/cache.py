@@ -0,0 +1,71 @@
+"""
+Quote result cache with a time to live and LRU eviction.
+
+Example:
+    >>> cache = CacheTTL(taille=1024, ttl=300)
+    >>> resultat = cache.obtenir(cle)        # None when absent or expired
+    >>> cache.enregistrer(cle, resultat)
+    >>> cache.statistiques()["hit_ratio"]
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """ Thread safe LRU of at most taille entries, each valid for ttl seconds """
+    def __init__(self, taille=1024, ttl=300, horloge=time.monotonic):
+        self.taille = taille
+        self.ttl = ttl
+        self.horloge = horloge
+        self.entrees = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def obtenir(self, cle):
+        """ Value stored for cle, None when missing or older than ttl """
+        with self._lock:
+            entree = self.entrees.get(cle)
+            if entree is not None:
+                expiration, valeur = entree
+                if expiration > self.horloge():
+                    self.entrees.move_to_end(cle)
+                    self.hits += 1
+                    return valeur
+                del self.entrees[cle]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def enregistrer(self, cle, valeur):
+        if self.taille <= 0:
+            return
+        with self._lock:
+            self.entrees[cle] = (self.horloge() + self.ttl, valeur)
+            self.entrees.move_to_end(cle)
+            while len(self.entrees) > self.taille:
+                self.entrees.popitem(last=False)
+                self.evictions += 1
+
+    def vider(self):
+        """ Drops every entry (tariffs reloaded), the counters are kept """
+        with self._lock:
+            self.entrees.clear()
+            self.invalidations += 1
+
+    def statistiques(self):
+        with self._lock:
+            requetes = self.hits + self.misses
+            return {
+                "entrees": len(self.entrees),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits/requetes if requetes else None,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,75 @@
+"""
+Progress of a running DPD search, published by the optimizer and read from any thread.
+
+The optimizer writes its counters into a small ctypes structure (the C engine through a pointer,
+the python engines by attribute), readers take a snapshot without any lock : a value may be
+one poll behind, never blocking the search.
+
+Example:
+    >>> progression = Progression()
+    >>> calculateur.calculer(panier, options, progression=progression)      # in a worker thread
+    >>> progression.instantane()        # from the GUI thread, every 100 ms
+    {'moteur': 'exact_c', 'unite': 'partitions', 'explorees': 524288, 'total': 678570,
+     'fraction': 0.77, 'meilleur_prix': 48.2, 'ecoule_s': 0.31, 'eta_s': 0.09}
+"""
+import ctypes
+import time
+
+
+class EtatProgression(ctypes.Structure):
+    """ Counters shared with the C engine (SearchProgress in partition_optimizer.c) """
+    _fields_ = [
+        ("explorees", ctypes.c_longlong),
+        ("meilleur_prix", ctypes.c_double),
+    ]
+
+
+class Progression:
+    """ Partitions (exact engines) or articles (approximate ones) explored out of an estimated total """
+    def __init__(self, etat=None):
+        """ etat : existing EtatProgression to write (shared memory of models.pool_optimiseurs), default a new one """
+        self.etat = etat if etat is not None else EtatProgression(0, float("inf"))
+        self.moteur = None
+        self.unite = None
+        self.total = 0
+        self.debut = None
+
+    def demarrer(self, moteur, total, unite="partitions"):
+        """ New search of total units (Bell number of the cart for the exact engines) """
+        self.etat.explorees = 0
+        self.etat.meilleur_prix = float("inf")
+        self.moteur = moteur
+        self.unite = unite
+        self.total = total
+        self.debut = time.perf_counter()
+
+    def avancer(self, explorees, meilleur_prix=None):
+        """ Called by the python engines at their poll points """
+        self.etat.explorees = explorees
+        if meilleur_prix is not None:
+            self.etat.meilleur_prix = meilleur_prix
+
+    def instantane(self):
+        """ JSON friendly snapshot, None before the first search """
+        if self.debut is None:
+            return None
+        explorees = self.etat.explorees
+        meilleur_prix = self.etat.meilleur_prix
+        ecoule = time.perf_counter() - self.debut
+        fraction = min(explorees/self.total, 1.0) if self.total else 0.0
+        return {
+            "moteur": self.moteur,
+            "unite": self.unite,
+            "explorees": explorees,
+            "total": self.total,
+            "fraction": fraction,
+            "meilleur_prix": meilleur_prix if meilleur_prix < float("inf") else None,
+            "ecoule_s": ecoule,
+            "eta_s": ecoule*(1 - fraction)/fraction if fraction > 0 else None,
+        }
+
+
+def avancer(progression, explorees, meilleur_prix=None):
+    """ progression.avancer(...), ignored when no progression is followed """
+    if progression is not None:
+        progression.avancer(explorees, meilleur_prix)
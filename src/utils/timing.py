@@ -0,0 +1,62 @@
+"""
+Lightweight timing helpers based on time.perf_counter.
+
+Example:
+    >>> chrono = Chronometre()
+    >>> with chrono.mesurer("import calculateur"):
+    ...     from calculateur import CalculateurFraisLivraison
+    >>> print(chrono.rapport())
+"""
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Chronometre:
+    """ Accumulates named durations (seconds), in the order they were first measured, and counters """
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.etapes = {}
+        self.compteurs = {}
+
+    @contextmanager
+    def mesurer(self, etape):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapes[etape] = self.etapes.get(etape, 0) + time.perf_counter() - debut
+
+    def compter(self, nom, valeur=1):
+        self.compteurs[nom] = self.compteurs.get(nom, 0) + valeur
+
+    def to_dict(self):
+        return dict(self.etapes)
+
+    def resume(self):
+        """ JSON friendly summary : durations in ms and counters """
+        return {
+            "etapes_ms": {etape: duree*1000 for etape, duree in self.etapes.items()},
+            "compteurs": dict(self.compteurs),
+        }
+
+    def rapport(self, titre="Startup timing"):
+        lignes = [f"[INFO] {titre} :"]
+        for etape, duree in self.etapes.items():
+            lignes.append(f"\t{etape:<40} {duree*1000:8.1f} ms")
+        lignes.append(f"\t{'total since start':<40} {(time.perf_counter()-self.debut)*1000:8.1f} ms")
+        return "\n".join(lignes)
+
+
+def mesurer(chrono, etape):
+    """ chrono.mesurer(etape), or a no-op context when no chronometre is given """
+    return nullcontext() if chrono is None else chrono.mesurer(etape)
+
+
+def compter(chrono, nom, valeur=1):
+    """ chrono.compter(nom, valeur), ignored when no chronometre is given """
+    if chrono is not None:
+        chrono.compter(nom, valeur)
+
+
+# Shared by the entry points and the lazy loaders (C library...) to build the startup report
+DEMARRAGE = Chronometre()
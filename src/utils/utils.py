@@ -1,19 +1,66 @@
-print("Loading functools : ...")
-from functools import cache, lru_cache
+import logging
+from bisect import bisect_right
+from functools import lru_cache
+from math import comb
 
-print("Loading functools : DONE")
-print("Loading numpy : ...")
-import numpy as np
+logger = logging.getLogger(__name__)
 
-print("Loading numpy : DONE")
+# Stirling numbers of the second kind STIRLING[n][k] (partitions of n articles into exactly k colis)
+# and Bell numbers BELL[n] (all partitions of n articles), precomputed and extended on demand
+STIRLING = [[1]]
+BELL = [1]
+
+
+def _etendre_tables(n):
+    while len(STIRLING) <= n:
+        precedente = STIRLING[-1] + [0]
+        ligne = [0] + [k * precedente[k] + precedente[k - 1] for k in range(1, len(precedente))]
+        STIRLING.append(ligne)
+        BELL.append(sum(ligne))
+
+
+_etendre_tables(64)
+
+
+def stirling2(n, k):
+    """ Number of partitions of n articles into exactly k colis """
+    if n < 0 or k < 0:
+        raise ValueError(f"n and k must be positive integers, n = {n}, k = {k}")
+    _etendre_tables(n)
+    return STIRLING[n][k] if k <= n else 0
 
 
-@cache
 def partitions_count(n, k=0):
-    # checks if n is integer and n is greater than 0
+    """
+    Number of partitions of n articles added to k existing colis (k=0 : Bell number B(n)).
+    Each article either joins one of the k colis or goes into new colis : sum_i C(n,i) k^(n-i) B(i)
+    """
     if n < 0:
         raise ValueError(f"n must be a positive integer type n = {type(n)}")
-    return int(n < 1) or k * partitions_count(n - 1, k) + partitions_count(n - 1, k + 1)
+    _etendre_tables(n)
+    if k == 0:
+        return BELL[n]
+    return sum(comb(n, i) * k**(n - i) * BELL[i] for i in range(n + 1))
+
+
+# Masses are integer grams inside the optimizers : exact sums and cache keys, kg only for display
+GRAMMES_PAR_KG = 1000
+
+
+def masse_en_grammes(poids):
+    """ Mass in kg (float, int or text as typed by the user) to integer grams """
+    return int(round(float(poids)*GRAMMES_PAR_KG))
+
+
+def masse_en_kg(grammes):
+    return grammes/GRAMMES_PAR_KG
+
+
+def masse_article_g(article):
+    """ Mass of a cart article in grams, 'poids_g' when the cart already carries it """
+    if 'poids_g' in article:
+        return article['poids_g']
+    return masse_en_grammes(article['poids'])
 
 
 weights = []
@@ -21,47 +68,58 @@ prices = []
 
 
 def set_new_tarif(new_weights, new_prices, max_weight):
+    """
+    Module wide grid used by tarif_par_masse : weights and max_weight in grams, prices in euros.
+    The lists given are not modified. Shared by every caller : quotes use fonction_tarif instead.
+    """
     global weights, prices
-    for i in range(len(new_weights)):
-        if new_weights[i] > max_weight:
-            new_prices[i] = float("inf")
-    weights = new_weights
-    prices = new_prices
+    weights = list(new_weights)
+    prices = [float("inf") if poids > max_weight else prix for poids, prix in zip(new_weights, new_prices)]
+    tarif_par_masse.cache_clear()
 
 
 @lru_cache(maxsize=None)
 def tarif_par_masse(masse):
-    print(f'[INFO] weights = {weights}')
-    print(f'[INFO] prices = {prices}')
-    if masse <= weights[-1]:
-        price = prices[np.searchsorted(weights, masse, side="right")] 
-        print(f'[INFO] Calculating tarif for masse {masse} kg, price = {price} euros')
+    """ Price of a colis of masse grams (integer keys : equal carts always hit the cache) """
+    logger.debug('weights = %s', weights)
+    logger.debug('prices = %s', prices)
+    if masse < weights[-1]:
+        price = prices[bisect_right(weights, masse)] 
+        logger.debug('Calculating tarif for masse %s g, price = %s euros', masse, price)
         return price
     else:
         price = prices[-1]
-        print(f'[WARNING] Calculating tarif for masse {masse} kg, price = {price} euros')
+        logger.warning('Calculating tarif for masse %s g, price = %s euros', masse, price)
         return price
 
 
-def find_best_config(elements, i=0, price=0):
+def find_best_config(elements, i=0, price=0, tarif=None, annulation=None, progression=None):
     """
     List all partitions and finds the best partition with corresponding price
 
     :param elements: Masses of articles to send
+    :param tarif: price function (see fonction_tarif), default the grid of set_new_tarif
+    :param annulation: utils.annulation.Annulation polled between partitions
+    :param progression: utils.progression.Progression, partitions priced and best price so far
     :return: price, config
     """
+    tarif_par_masse = tarif or globals()["tarif_par_masse"]
     if elements == []:
         return [[]]  # Cas de base : partition vide pour un ensemble vide
 
     first = elements[0]
     rest = elements[1:]
-    rest_partitions = find_best_config(rest, i + 1)
+    rest_partitions = find_best_config(rest, i + 1, annulation=annulation)
     all_partitions = []
     counter = 0
     if i == 0:
         best_price = float("inf")
         best_config = []
     for partition in rest_partitions:
+        if annulation is not None:
+            annulation.verifier()
+        if i == 0 and progression is not None:
+            progression.avancer(counter, best_price)
         # Ajouter 'first' à chaque sous-ensemble existant
         for j in range(len(partition)):
             new_partition = (
@@ -89,14 +147,144 @@ def find_best_config(elements, i=0, price=0):
                 best_config = new_partition
         all_partitions.append(new_partition)
     if i == 0:
-        print(f"counter={counter}")
+        logger.debug("counter=%s", counter)
+        if progression is not None:
+            progression.avancer(counter, best_price)
         return {
             "price" :best_price,
-            "config" : best_config
+            "config" : best_config,
+            "partitions" : counter,
             }
     return all_partitions
 
 
+def fonction_tarif(grid_weights, grid_prices, max_weight):
+    """
+    Price function of a DPD grid, independent of the global one set by set_new_tarif
+    (same brackets as tarif_par_masse, inf above max_weight), memoized by mass.
+    The lists given are not modified, the grid is kept as tuples : the function can be shared
+    by concurrent quotes. Attributes : weights, prices (inf applied), max_weight, poids_max (last weight).
+    """
+    grid_weights = tuple(grid_weights)
+    grid_prices = tuple(float("inf") if poids > max_weight else prix for poids, prix in zip(grid_weights, grid_prices))
+
+    @lru_cache(maxsize=None)
+    def tarif(masse):
+        if masse < grid_weights[-1]:
+            return grid_prices[bisect_right(grid_weights, masse)]
+        return grid_prices[-1]
+    tarif.weights = grid_weights
+    tarif.prices = grid_prices
+    tarif.max_weight = max_weight
+    tarif.poids_max = grid_weights[-1]
+    return tarif
+
+
+def find_config_heuristique(elements, tarif=None, annulation=None, progression=None):
+    """
+    Greedy partition for carts too large for an exact enumeration (not optimal).
+    Articles are taken by decreasing mass, each one goes into the colis where it adds the least
+    to the price, or into a new colis when that is cheaper.
+
+    :param elements: Masses of articles to send
+    :param tarif: price function (see fonction_tarif), default the grid of set_new_tarif
+    :param annulation: utils.annulation.Annulation polled between articles
+    :param progression: utils.progression.Progression, articles placed
+    :return: {"price", "config", "partitions"} like find_best_config
+    """
+    tarif_par_masse = tarif or globals()["tarif_par_masse"]
+    colis, masses = [], []
+    for rang, element in enumerate(sorted(elements, reverse=True)):
+        if annulation is not None:
+            annulation.verifier()
+        if progression is not None:
+            progression.avancer(rang)
+        meilleur, surcout = None, tarif_par_masse(element)
+        for index, masse in enumerate(masses):
+            cout = tarif_par_masse(masse + element) - tarif_par_masse(masse)
+            if cout < surcout:
+                meilleur, surcout = index, cout
+        if meilleur is None:
+            colis.append([element])
+            masses.append(element)
+        else:
+            colis[meilleur].append(element)
+            masses[meilleur] += element
+    if progression is not None:
+        progression.avancer(len(elements))
+    return {
+        "price": sum(tarif_par_masse(masse) for masse in masses),
+        "config": colis,
+        "partitions": 1,
+    }
+
+
+def _sac_a_dos(poids_g, capacite_g):
+    """ Indices of poids_g with the largest total <= capacite_g (0/1 knapsack on reachable sums) """
+    atteints = {0: ()}
+    for index, poids in enumerate(poids_g):
+        for somme, choix in list(atteints.items()):
+            nouvelle = somme + poids
+            if nouvelle <= capacite_g and nouvelle not in atteints:
+                atteints[nouvelle] = choix + (index,)
+    return atteints[max(atteints)]
+
+
+def ranger_articles_legers(config, config_labels, legers, tarif=None):
+    """
+    Second phase of the two phase DPD mode : light articles are added to the colis of config
+    (exact solution for the heavy articles). Masses in grams.
+    1) each colis is filled, with a 0/1 knapsack on the grams, up to the next step of the grid :
+       these articles do not change the price
+    2) the remaining ones go where they add the least to the price, or into a new colis
+
+    :param config, config_labels: masses and labels of the colis, lists of lists
+    :param legers: (masse, label) of the light articles
+    :param tarif: price function (see fonction_tarif), default the grid of set_new_tarif
+    :return: {"price", "config", "config_labels"}
+    """
+    tarif_par_masse = tarif or globals()["tarif_par_masse"]
+    grille = tarif.weights if tarif is not None else weights
+    colis = [list(masses) for masses in config]
+    labels = [list(noms) for noms in config_labels]
+    totaux = [sum(masses) for masses in colis]
+    restants = sorted(legers, reverse=True)
+    for index in range(len(colis)):
+        if not restants:
+            break
+        etape = bisect_right(grille, totaux[index])
+        if etape >= len(grille):
+            continue
+        # Strictly below the next grid weight : the colis never changes step
+        capacite = grille[etape] - totaux[index] - 1
+        choix = set(_sac_a_dos([masse for masse, _ in restants], capacite))
+        for rang in sorted(choix):
+            masse, label = restants[rang]
+            colis[index].append(masse)
+            labels[index].append(label)
+            totaux[index] += masse
+        restants = [article for rang, article in enumerate(restants) if rang not in choix]
+    for masse, label in restants:
+        meilleur, surcout = None, tarif_par_masse(masse)
+        for index, total in enumerate(totaux):
+            cout = tarif_par_masse(total + masse) - tarif_par_masse(total)
+            if cout < surcout:
+                meilleur, surcout = index, cout
+        if meilleur is None:
+            colis.append([masse])
+            labels.append([label])
+            totaux.append(masse)
+        else:
+            colis[meilleur].append(masse)
+            labels[meilleur].append(label)
+            totaux[meilleur] += masse
+    return {
+        "price": sum(tarif_par_masse(total) for total in totaux),
+        "config": colis,
+        "config_labels": labels,
+    }
+
+
 def read_csv_file_with_headers(
     file_path, sep=",", header_sep=":", comment_symbols=["#", "//"],
     col_types = None, list_in_header = False
@@ -174,14 +362,14 @@ def read_csv_file_with_headers(
                                         csv[columns_labels[col_index]].append(cell)
 
                                 except Exception as e:
-                                    print(
-                                        f"[ERROR] Could not read file {file_path} at line:{line_index+1}, column:{col_index}. inconsistent data"
+                                    logger.error(
+                                        "Could not read file %s at line:%s, column:%s. inconsistent data", file_path, line_index+1, col_index
                                     )
                                     raise SyntaxError(
                                         f"[ERROR] Could not read file {file_path} at line:{line_index+1}, column:{col_index}. inconsistent data"
                                     )
                                 except ValueError as e:
-                                    print(f'[ERROR] Could not convert cell value ({cell}) to {col_types[col_index]} ')
+                                    logger.error('Could not convert cell value (%s) to %s', cell, col_types[col_index])
                                     raise ValueError(f'[ERROR] Could not convert cell value ({cell}) to {col_types[col_index]} ')
                         in_col_label_line = False
                     else:
@@ -189,7 +377,7 @@ def read_csv_file_with_headers(
             return header, columns_labels, csv
 
     except FileNotFoundError as e:
-        print(f"[ERROR] Price file not found \n{e}")
+        logger.error("Price file not found \n%s", e)
         raise e
     except Exception as e:
-        print(f"[ERROR] Unhandeled error during price file reading \n{e}")
+        logger.error("Unhandeled error during price file reading \n%s", e)
@@ -0,0 +1,30 @@
+"""
+Tests of the calculation core, run from the repository root :
+    python -m pytest tests
+The sources are imported from src and run from the src directory, like the application
+(tariff paths are '../data/...').
+"""
+import logging
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+os.chdir(SRC)
+
+
+@pytest.fixture(scope="session")
+def calculateur():
+    from calculateur import CalculateurFraisLivraison
+    # Partitions over the max weight are expected by the enumeration, not worth a warning each
+    logging.getLogger("utils.utils").setLevel(logging.ERROR)
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 0})
+    return calculateur
+
+
+@pytest.fixture(scope="session")
+def tarif_dpd(calculateur):
+    return calculateur.transporteurs["dpd"].get_tarif_dpd()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from models.calculation_errors import CalculationCancelled
+from utils import utils
+from utils.annulation import Annulation
+
+# Far more partitions than the test waits for : only a cancelled search returns in time
+ARTICLES = [500 + (i % 7)*700 for i in range(13)]
+
+
+def annuler_apres(annulation, delai):
+    threading.Timer(delai, annulation.annuler).start()
+
+
+def moteurs():
+    from bin import c
+    return {"c": c.find_best_config, "python": utils.find_best_config}
+
+
+@pytest.mark.parametrize("nom", ["c", "python"])
+def test_annulation_moteur(tarif_dpd, nom):
+    find_best_config = moteurs()[nom]
+    annulation = Annulation()
+    annuler_apres(annulation, 0.05)
+    debut = time.perf_counter()
+    with pytest.raises(CalculationCancelled):
+        find_best_config(list(ARTICLES), tarif=tarif_dpd, annulation=annulation)
+    assert time.perf_counter() - debut < 2
+
+
+def test_annulation_calculer_rien_en_cache():
+    from calculateur import CalculateurFraisLivraison
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"BUDGET_LATENCE_MS": 100000})
+    panier = [{"nom": f"a{i}", "poids": 0.5 + (i % 7)*0.7} for i in range(13)]
+    options = {"country": "france", "departement": "75"}
+    annulation = Annulation()
+    annulation.annuler()
+    with pytest.raises(CalculationCancelled):
+        calculateur.calculer(panier, options, annulation=annulation)
+    assert calculateur.cache_devis.statistiques()["entrees"] == 0
+    # A new calculation right after the cancelled one runs normally
+    resultats = calculateur.calculer(panier[:8], options, annulation=Annulation())
+    assert resultats["dpd"]["prix"] > 0
@@ -0,0 +1,50 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+
+COMMANDES_CSV = """id,country,departement,nom,poids,quantite
+C1,france,75,vis,2.5,3
+C1,france,75,plaque,7.1,1
+C2,france,13,vis,2.5,1
+"""
+
+
+def commande(identifiant, departement="75", articles=None):
+    return {"id": identifiant, "departement": departement,
+            "articles": articles or [{"nom": "vis", "poids": 2.5, "quantite": 3}, {"nom": "plaque", "poids": 7.1}]}
+
+
+def test_lire_csv_groupe_les_lignes_contigues():
+    commandes = list(batch.lire_csv(io.StringIO(COMMANDES_CSV)))
+    assert [c["id"] for c in commandes] == ["C1", "C2"]
+    assert commandes[0]["articles"] == 4
+    jsonl = io.StringIO(json.dumps(commande("C1")) + "\n\n")
+    # Same cart from both formats : same deduplication key
+    assert next(batch.lire_jsonl(jsonl))["lignes"] == commandes[0]["lignes"]
+
+
+def test_quoter_ordre_et_deduplication():
+    lignes = [commande("A"), commande("B", "13"), commande("C"), commande("D", "999")]
+    commandes = [batch.normaliser_commande(c["id"], None, c["departement"], c["articles"]) for c in lignes]
+    statistiques = {"calculees": 0, "dedupliquees": 0, "erreurs": 0}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sorties = list(batch.quoter(commandes, executor, fenetre=2, taille_cache=10, statistiques=statistiques))
+    assert [c["id"] for c, _ in sorties] == ["A", "B", "C", "D"]
+    # C is the cart of A : quoted once
+    assert statistiques == {"calculees": 3, "dedupliquees": 1, "erreurs": 1}
+    assert sorties[2][1] == sorties[0][1]
+    ligne = batch.resumer(*sorties[0])
+    assert ligne["prix_meilleur"] == min(prix for prix in ligne["prix"].values() if prix is not None)
+    assert "erreurs" in batch.resumer(*sorties[3]) and "calcul" in batch.resumer(*sorties[3])["erreurs"]
+
+
+def test_main_jsonl_vers_csv(tmp_path):
+    entree = tmp_path / "commandes.jsonl"
+    entree.write_text("\n".join(json.dumps(commande(str(rang))) for rang in range(3)))
+    sortie = tmp_path / "devis.csv"
+    assert batch.main([str(entree), "--output", str(sortie), "--workers", "1", "--marge", "10"]) == 0
+    lignes = sortie.read_text().splitlines()
+    assert lignes[0].split(",")[:4] == ["id", "country", "departement", "articles"]
+    assert len(lignes) == 4
@@ -0,0 +1,60 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from models.calculation_errors import InvalidQuoteInput
+from models.cart import Cart
+from utils.utils import masse_en_grammes
+
+
+def cas_aleatoires(calculateur, nombre=300, graine=26):
+    """ (mass kg, departement) pairs : 0.1 kg steps and arbitrary masses, a few unknown departements """
+    generateur = random.Random(graine)
+    departements = calculateur.lister_departements() + ["999"]
+    cas = []
+    for rang in range(nombre):
+        masse = round(generateur.uniform(0.1, 3000), 1) if rang % 2 else generateur.uniform(0.1, 3000)
+        cas.append((masse, generateur.choice(departements)))
+    return cas
+
+
+def prix_scalaire(transporteur, masse, departement):
+    panier = Cart.depuis_articles([{"nom": "colis", "poids": masse}])
+    options = {"country": "france", "departement": departement}
+    try:
+        if transporteur.nom == transporteur.options["SCHENKER_PALETTE"]:
+            resultat = transporteur.calculer_tarif_schenker_palette(panier, options)
+        else:
+            resultat = transporteur.calculer_tarif_schenker_messagerie(panier, options)
+    except InvalidQuoteInput:
+        return math.nan
+    return resultat.get("prix_brut", math.nan)
+
+
+@pytest.mark.parametrize("nom", ["schenker_palette", "schenker_messagerie"])
+def test_bulk_egal_au_calcul_scalaire(calculateur, nom):
+    transporteur = calculateur.transporteurs[nom]
+    cas = cas_aleatoires(calculateur)
+    masses = np.array([masse for masse, _ in cas])
+    departements = np.array([departement for _, departement in cas])
+    prix = transporteur.calculer_tarifs_bulk(masses, departements, marge=False)
+    attendus = np.array([prix_scalaire(transporteur, masse, departement) for masse, departement in cas])
+    np.testing.assert_allclose(prix, attendus, equal_nan=True)
+
+
+def test_bulk_dpd_egal_au_tarif(calculateur, tarif_dpd):
+    transporteur = calculateur.transporteurs["dpd"]
+    masses = np.array([round(masse*0.37, 1) for masse in range(1, 120)])
+    prix = transporteur.calculer_tarifs_bulk(masses, marge=False)
+    attendus = np.array([tarif_dpd(masse_en_grammes(masse)) for masse in masses])
+    np.testing.assert_allclose(prix, attendus)
+
+
+def test_bulk_marge(calculateur):
+    transporteur = calculateur.transporteurs["schenker_messagerie"]
+    masses, departements = np.array([150.0, 420.5]), np.array(["13", "75"])
+    sans_marge = transporteur.calculer_tarifs_bulk(masses, departements, marge=False)
+    reglages = dict(transporteur.options, POURCENTAGE_MAGE=10)
+    np.testing.assert_allclose(transporteur.calculer_tarifs_bulk(masses, departements, reglages=reglages), sans_marge*1.1)
@@ -0,0 +1,83 @@
+from calculateur import CalculateurFraisLivraison
+from utils.cache import CacheTTL
+
+PANIER = [{"nom": "vis", "poids": 2.5, "quantite": 3}, {"nom": "plaque", "poids": 7.1}]
+OPTIONS = {"country": "france", "departement": "13"}
+
+
+class Horloge:
+    """ Manual clock of the tests """
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_expiration():
+    horloge = Horloge()
+    cache = CacheTTL(taille=4, ttl=10, horloge=horloge)
+    cache.enregistrer("a", 1)
+    horloge.t = 9.9
+    assert cache.obtenir("a") == 1
+    horloge.t = 10
+    assert cache.obtenir("a") is None
+    statistiques = cache.statistiques()
+    assert (statistiques["hits"], statistiques["misses"], statistiques["expirations"]) == (1, 1, 1)
+    assert statistiques["entrees"] == 0
+
+
+def test_eviction_lru():
+    cache = CacheTTL(taille=2, ttl=10, horloge=Horloge())
+    cache.enregistrer("a", 1)
+    cache.enregistrer("b", 2)
+    # Reading a makes b the least recently used
+    assert cache.obtenir("a") == 1
+    cache.enregistrer("c", 3)
+    assert cache.obtenir("b") is None
+    assert (cache.obtenir("a"), cache.obtenir("c")) == (1, 3)
+    assert cache.statistiques()["evictions"] == 1
+
+
+def test_taille_nulle():
+    cache = CacheTTL(taille=0, ttl=10)
+    cache.enregistrer("a", 1)
+    assert cache.obtenir("a") is None
+    assert cache.statistiques()["entrees"] == 0
+
+
+def test_vider():
+    cache = CacheTTL(taille=4, ttl=10)
+    cache.enregistrer("a", 1)
+    cache.obtenir("a")
+    cache.vider()
+    assert cache.obtenir("a") is None
+    statistiques = cache.statistiques()
+    assert statistiques["invalidations"] == 1
+    # Counters are kept across invalidations
+    assert (statistiques["hits"], statistiques["misses"]) == (1, 1)
+
+
+def test_calculer_depuis_le_cache():
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 16})
+    premier = calculateur.calculer(PANIER, OPTIONS)
+    # Same cart, lines in another order : same key, served from the cache
+    second = calculateur.calculer(list(reversed(PANIER)), OPTIONS)
+    assert second == premier
+    statistiques = calculateur.cache_devis.statistiques()
+    assert (statistiques["entrees"], statistiques["hits"], statistiques["misses"]) == (1, 1, 1)
+    # A calculation option is part of the key
+    calculateur.set_options({"MODE_DPD": "deux_phases"})
+    calculateur.calculer(PANIER, OPTIONS)
+    assert calculateur.cache_devis.statistiques()["entrees"] == 2
+
+
+def test_recharger_tarifs_vide_le_cache():
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 16})
+    calculateur.calculer(PANIER, OPTIONS)
+    calculateur.recharger_tarifs()
+    assert calculateur.cache_devis.statistiques()["entrees"] == 0
+    calculateur.calculer(PANIER, OPTIONS)
+    assert calculateur.cache_devis.statistiques()["misses"] == 2
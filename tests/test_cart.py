@@ -0,0 +1,32 @@
+from models.cart import Cart
+
+
+def test_lignes_fusionnees():
+    panier = Cart.depuis_articles([
+        {"nom": "vis", "poids": 0.2},
+        {"nom": "vis", "poids": 0.2, "quantite": 3},
+        {"nom": "plaque", "poids": 7.1},
+        {"nom": "ecrou", "poids": 0.05, "quantite": 0},
+    ])
+    assert (len(panier), panier.nombre_lignes) == (5, 2)
+    assert panier.masse_totale_g() == 4*200 + 7100
+    assert panier.masse_max_g() == 7100
+
+
+def test_empreinte_independante_de_l_ordre():
+    articles = [{"nom": "vis", "poids": 0.2, "quantite": 2}, {"nom": "plaque", "poids": 7.1}]
+    assert Cart.depuis_articles(articles).empreinte() == Cart.depuis_articles(list(reversed(articles))).empreinte()
+
+
+def test_unites_triees():
+    panier = Cart.depuis_lignes([("plaque", 7100, 1), ("vis", 200, 2)])
+    assert panier.unites() == ([200, 200, 7100], ["vis", "vis", "plaque"])
+
+
+def test_compacter():
+    panier = Cart.depuis_lignes([("vis", 400, 5), ("plaque", 7100, 1)])
+    compacte = panier.compacter(seuil_leger=1, seuil_compactage=1)
+    # Light units grouped until a group exceeds 1 kg : 3 + 2 units, the heavy line kept
+    assert sorted(compacte.lignes_g()) == sorted([("3x vis", 1200, 1), ("2x vis", 800, 1), ("plaque", 7100, 1)])
+    assert compacte.masse_totale_g() == panier.masse_totale_g()
+    assert panier.compacter(seuil_leger=0.1, seuil_compactage=1) is panier
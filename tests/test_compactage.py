@@ -0,0 +1,31 @@
+import pytest
+
+from models.cart import Cart
+
+OPTIONS = {"country": "france", "departement": "75"}
+
+
+@pytest.mark.parametrize("cible", [4, 8, 10])
+def test_seuils_compactage_atteignent_la_cible(calculateur, cible):
+    dpd = calculateur.transporteurs["dpd"]
+    panier = Cart.depuis_lignes([("bobine", 300, 25), ("cable", 1200, 6), ("moteur", 9000, 2)])
+    masses, _ = panier.unites()
+    seuils = dpd.calculer_seuils_compactage(masses, cible)
+    assert seuils is not None
+    reglages = dict(calculateur.options)
+    reglages["SEUIL_ARTICLE_LEGER"], reglages["SEUIL_COMPACTAGE"] = seuils
+    # A single compaction pass is enough, no group heavier than a colis
+    compacte = dpd.compact_shopping_cart(panier, reglages)
+    assert len(compacte) <= cible
+    assert compacte.masse_totale_g() == panier.masse_totale_g()
+    assert compacte.masse_max_g() < reglages["POIDS_MAX_COLIS_DPD"]*1000
+
+
+def test_compactage_sans_effet_sur_les_options(calculateur):
+    options = dict(calculateur.options)
+    dpd = calculateur.transporteurs["dpd"]
+    # 40 units : far over any exact engine, compacted for this call only
+    resultat = calculateur.calculer([{"nom": "bobine", "poids": 0.3, "quantite": 40}], OPTIONS)["dpd"]
+    assert resultat["compacting_count"] == 1
+    assert dict(calculateur.options) == options
+    assert dict(dpd.options) == options
@@ -0,0 +1,46 @@
+import pytest
+
+from models.cost_model import ModeleCout, Moteur
+from utils.utils import partitions_count
+
+
+def modele_fixe():
+    """ Cost model with fixed costs, never calibrated : exact_c 10x cheaper per partition than exact_python """
+    charger = lambda: None
+    return ModeleCout({
+        "exact_c": Moteur("exact_c", True, 18, 1e-4, 1e-7, charger),
+        "exact_python": Moteur("exact_python", True, 10, 1e-5, 1e-6, charger),
+        "heuristique": Moteur("heuristique", False, 10**6, 1e-5, 1e-6, charger),
+    })
+
+
+def test_nombres_de_bell():
+    assert [partitions_count(n) for n in range(8)] == [1, 1, 2, 5, 15, 52, 203, 877]
+    assert partitions_count(10) == 115975
+    # 2 articles added to 1 colis : both in it, one each side, or both in new colis (1 + 2 + 2)
+    assert partitions_count(2, 1) == 5
+
+
+def test_choisir_le_plus_rapide():
+    modele = modele_fixe()
+    # Tiny cart : the fixed cost dominates
+    assert modele.choisir(2, budget=1).nom == "exact_python"
+    assert modele.choisir(9, budget=1).nom == "exact_c"
+    # Over its max_articles an engine is never picked, whatever the budget
+    assert modele.estimations(11)["exact_python"] == float("inf")
+
+
+def test_budget_insuffisant():
+    modele = modele_fixe()
+    # B(12) = 4213597 partitions : about 0.42 s with exact_c
+    assert modele.choisir(12, budget=0.5).nom == "exact_c"
+    assert modele.choisir(12, budget=0.1) is None
+    assert modele.max_articles_exacts(0.1) == 11
+    assert modele.heuristique().nom == "heuristique"
+
+
+def test_moteur_indisponible():
+    modele = modele_fixe()
+    modele.moteurs["exact_c"].disponible = False
+    assert modele.choisir(9, budget=1).nom == "exact_python"
+    assert modele.choisir(11, budget=100) is None
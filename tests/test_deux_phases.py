@@ -0,0 +1,44 @@
+import pytest
+
+from calculateur import CalculateurFraisLivraison
+from models.cart import Cart
+from utils.utils import find_best_config, ranger_articles_legers
+
+OPTIONS = {"country": "france", "departement": "75"}
+
+
+@pytest.fixture(scope="module")
+def calculateur_deux_phases():
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 0, "MODE_DPD": "deux_phases", "SEUIL_ARTICLE_LEGER": 1})
+    return calculateur
+
+
+def test_tous_les_articles_ranges(calculateur_deux_phases, tarif_dpd):
+    panier = Cart.depuis_lignes([("bobine", 300, 30), ("cable", 2500, 3), ("moteur", 9000, 2)])
+    resultat = calculateur_deux_phases.transporteurs["dpd"].calculer_tarif_brut(panier, OPTIONS)
+    labels = sorted(label for colis in resultat["arrangement (labels)"] for label in colis)
+    assert labels == sorted(["bobine"]*30 + ["cable"]*3 + ["moteur"]*2)
+    assert sum(resultat["masses colis"]) == pytest.approx(panier.masse_totale())
+    assert resultat["prix_brut"] == pytest.approx(sum(resultat["prix_colis"]))
+    # 35 units, yet no compaction : only the 5 heavy ones are optimized
+    assert resultat["compacting_count"] == 0
+
+
+def test_legers_dans_la_marge_du_palier(tarif_dpd):
+    # Light articles fitting under the next grid weight of a colis do not change its price
+    lourds = [4000]
+    exact = find_best_config(list(lourds), tarif=tarif_dpd)
+    marge = min(poids for poids in tarif_dpd.weights if poids > 4000) - 4000
+    legers = [(marge//4, "vis")]*3
+    rangement = ranger_articles_legers(exact["config"], [["plaque"]], legers, tarif_dpd)
+    assert rangement["price"] == pytest.approx(exact["price"])
+    assert len(rangement["config"]) == 1
+
+
+def test_sans_article_leger(calculateur_deux_phases, tarif_dpd):
+    # Only heavy articles : the exact optimum of the default mode
+    panier = Cart.depuis_lignes([("cable", 2500, 3), ("moteur", 9000, 2)])
+    resultat = calculateur_deux_phases.transporteurs["dpd"].calculer_tarif_brut(panier, OPTIONS)
+    masses, _ = panier.unites()
+    assert resultat["prix_brut"] == pytest.approx(find_best_config(masses, tarif=tarif_dpd)["price"])
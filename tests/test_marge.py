@@ -0,0 +1,21 @@
+import pytest
+
+from calculateur import CalculateurFraisLivraison
+
+PANIER = [{"nom": "vis", "poids": 2.5, "quantite": 3}, {"nom": "plaque", "poids": 7.1}]
+OPTIONS = {"country": "france", "departement": "13"}
+
+
+def test_marge_sans_reoptimisation():
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 16})
+    brut = calculateur.calculer(PANIER, OPTIONS)
+    # Only the margin changes : same cache entry, prices re-derived from the raw quote
+    calculateur.set_options({"POURCENTAGE_MAGE": 20})
+    avec_marge = calculateur.calculer(PANIER, OPTIONS)
+    statistiques = calculateur.cache_devis.statistiques()
+    assert statistiques["entrees"] == 1
+    for nom, resultat in brut.items():
+        if "prix" in resultat:
+            assert avec_marge[nom]["prix"] == pytest.approx(resultat["prix"]*1.2)
+            assert avec_marge[nom]["prix_brut"] == resultat["prix_brut"]
@@ -0,0 +1,32 @@
+import math
+
+import numpy as np
+import pytest
+
+from models.calculation_errors import InvalidQuoteInput
+
+PANIER = [{"nom": "vis", "poids": 12.5, "quantite": 4}, {"nom": "plaque", "poids": 21.4}]
+
+
+def test_matrice_egale_aux_devis(calculateur):
+    matrice = calculateur.calculer_matrice(PANIER, {"country": "france"})
+    prix = matrice["prix"]
+    assert prix.shape == (len(matrice["departements"]), len(matrice["transporteurs"]))
+    # DPD does not depend on the departement : one optimization, the same price on every line
+    dpd = matrice["transporteurs"].index("dpd")
+    assert np.all(prix[:, dpd] == matrice["dpd"]["prix"])
+    for ligne in range(0, len(matrice["departements"]), 7):
+        departement = matrice["departements"][ligne]
+        try:
+            devis = calculateur.calculer(PANIER, {"country": "france", "departement": departement})
+        except InvalidQuoteInput:
+            # Known by one carrier only : the other one raises in the detailed calculation
+            continue
+        for colonne, nom in enumerate(matrice["transporteurs"]):
+            attendu = devis[nom].get("prix", math.nan)
+            assert prix[ligne, colonne] == pytest.approx(attendu, nan_ok=True), (departement, nom)
+
+
+def test_matrice_pays_non_disponible(calculateur):
+    matrice = calculateur.calculer_matrice(PANIER, {"country": "atlantide"})
+    assert np.isnan(matrice["prix"]).all()
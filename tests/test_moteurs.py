@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+from utils.utils import find_best_config, find_config_heuristique, masse_en_grammes
+
+
+def paniers_aleatoires(n, nombre=40, graine=2025):
+    """ Sorted article masses (g) between 0.2 and 15 kg, rounded to 100 g like user inputs """
+    generateur = random.Random(graine + n)
+    return [sorted(masse_en_grammes(round(generateur.uniform(0.2, 15), 1)) for _ in range(n)) for _ in range(nombre)]
+
+
+@pytest.mark.parametrize("n", [3, 6, 8])
+def test_moteurs_exacts_et_heuristique(tarif_dpd, n):
+    from bin import c
+    for items in paniers_aleatoires(n, nombre=10):
+        exact = find_best_config(list(items), tarif=tarif_dpd)
+        assert c.find_best_config(list(items), tarif=tarif_dpd)["price"] == pytest.approx(exact["price"])
+        # The greedy packing never beats the enumeration of every partition
+        heuristique = find_config_heuristique(list(items), tarif_dpd)
+        assert heuristique["price"] >= exact["price"] - 1e-9
+        assert sorted(masse for colis in heuristique["config"] for masse in colis) == items
+
+
+def test_exact_c_sans_plafond_memoire():
+    from calculateur import CalculateurFraisLivraison
+    # exact_c streams the partitions : an 11-article cart is solved exactly when the budget allows it
+    calculateur = CalculateurFraisLivraison()
+    calculateur.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 0, "BUDGET_LATENCE_MS": 100000})
+    panier = [{"nom": f"article {i}", "poids": round(0.5 + (i*1.3) % 6, 1)} for i in range(11)]
+    resultat = calculateur.calculer(panier, {"country": "france", "departement": "75"})["dpd"]
+    assert resultat["moteur"] == "exact_c"
+    assert resultat["compacting_count"] == 0
@@ -0,0 +1,71 @@
+import os
+import signal
+
+import pytest
+
+from models.calculation_errors import CalculationCancelled
+from models.cost_model import moteurs_par_defaut
+from models.pool_optimiseurs import PoolOptimiseurs
+from utils.annulation import Annulation
+from utils.progression import Progression
+from utils.utils import partitions_count
+
+ARTICLES = [500 + (i % 5)*500 for i in range(8)]
+
+
+@pytest.fixture(scope="module")
+def pool(tarif_dpd):
+    pool = PoolOptimiseurs(workers=1, tarifs=[tarif_dpd], slots_par_worker=1, intervalle_sante=None)
+    yield pool
+    pool.arreter()
+
+
+def test_progression_finale_job_court(pool, tarif_dpd):
+    # Done before the first poll : the counters of the worker are still forwarded
+    progression = Progression()
+    result = pool.executer(moteurs_par_defaut()["exact_c"], ARTICLES, tarif_dpd, progression=progression)
+    assert result["price"] > 0
+    assert progression.instantane()["explorees"] == partitions_count(len(ARTICLES))
+    assert pool.statistiques()["jobs"] >= 1
+
+
+def test_annulation_en_attente_de_slot(pool, tarif_dpd):
+    # Every slot in flight : a cancelled caller stops waiting
+    slot = pool.slots.get()
+    try:
+        annulation = Annulation()
+        annulation.annuler()
+        with pytest.raises(CalculationCancelled):
+            pool.executer(moteurs_par_defaut()["exact_c"], ARTICLES, tarif_dpd, annulation=annulation)
+    finally:
+        pool.slots.put(slot)
+
+
+def tuer_workers(pool):
+    for pid in pool.verifier_sante()["pids"]:
+        os.kill(pid, signal.SIGKILL)
+
+
+def test_relance_apres_worker_tue(tarif_dpd):
+    pool = PoolOptimiseurs(workers=1, tarifs=[tarif_dpd], slots_par_worker=1, intervalle_sante=None)
+    try:
+        attendu = moteurs_par_defaut()["exact_c"].executer(ARTICLES, tarif_dpd)["price"]
+        tuer_workers(pool)
+        # The broken pool is started again and the job submitted once more
+        assert pool.executer(moteurs_par_defaut()["exact_c"], ARTICLES, tarif_dpd)["price"] == attendu
+        assert pool.statistiques()["relances"] == 1
+    finally:
+        pool.arreter()
+
+
+def test_verifier_sante_relance(tarif_dpd):
+    pool = PoolOptimiseurs(workers=1, tarifs=[tarif_dpd], slots_par_worker=1, intervalle_sante=None)
+    try:
+        pids = pool.verifier_sante()["pids"]
+        tuer_workers(pool)
+        sante = pool.verifier_sante()
+        assert (sante["ok"], sante["relances"]) == (False, 1)
+        sante = pool.verifier_sante()
+        assert sante["ok"] and sante["pids"] and sante["pids"] != pids
+    finally:
+        pool.arreter()
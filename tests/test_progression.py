@@ -0,0 +1,32 @@
+import pytest
+
+from models.cost_model import moteurs_par_defaut
+from utils.progression import Progression
+from utils.utils import partitions_count
+
+ARTICLES = [500 + (i % 5)*500 for i in range(7)]
+
+
+def test_instantane_avant_recherche():
+    assert Progression().instantane() is None
+
+
+@pytest.mark.parametrize("nom", ["exact_python", "exact_c"])
+def test_recherche_exacte_complete(tarif_dpd, nom):
+    progression = Progression()
+    result = moteurs_par_defaut()[nom].executer(ARTICLES, tarif_dpd, progression=progression)
+    instantane = progression.instantane()
+    assert (instantane["moteur"], instantane["unite"]) == (nom, "partitions")
+    assert instantane["explorees"] == instantane["total"] == partitions_count(len(ARTICLES))
+    assert instantane["fraction"] == 1.0
+    assert instantane["meilleur_prix"] == pytest.approx(result["price"])
+
+
+def test_fraction_et_eta():
+    progression = Progression()
+    progression.demarrer("exact_c", 200)
+    progression.avancer(50, 12.5)
+    instantane = progression.instantane()
+    assert instantane["fraction"] == 0.25
+    assert instantane["meilleur_prix"] == 12.5
+    assert instantane["eta_s"] == pytest.approx(3*instantane["ecoule_s"])
@@ -0,0 +1,68 @@
+import pytest
+
+from calculateur import CalculateurFraisLivraison
+
+
+def panier(n):
+    return [{"nom": f"article {i}", "poids": round(0.5 + (i*1.7) % 9, 1)} for i in range(n)]
+
+
+@pytest.mark.parametrize("n", [8, 10])
+def test_scenario_egal_au_devis(calculateur, n):
+    transporteur = calculateur.transporteurs["dpd"]
+    scenarios = [
+        {"nom": "actuel"},
+        {"nom": "grille", "fichier": calculateur.options["DPD_PATH"]},
+        {"nom": "20 kg", "POIDS_MAX_COLIS_DPD": 20},
+        {"nom": "15 kg", "POIDS_MAX_COLIS_DPD": 15},
+    ]
+    resultats = transporteur.calculer_tarif_dpd_scenarios(panier(n), scenarios)
+    options = {"country": "france", "departement": "75"}
+    for scenario in scenarios:
+        devis = CalculateurFraisLivraison()
+        devis.set_options({"POURCENTAGE_MAGE": 0, "CACHE_DEVIS_TAILLE": 0,
+                           "POIDS_MAX_COLIS_DPD": scenario.get("POIDS_MAX_COLIS_DPD", calculateur.options["POIDS_MAX_COLIS_DPD"])})
+        # Same calibrated engine costs : the same engine is picked for the cart
+        devis.transporteurs["dpd"].modele_cout = transporteur.get_modele_cout()
+        attendu = devis.calculer(panier(n), options)["dpd"]
+        assert resultats[scenario["nom"]]["prix"] == pytest.approx(attendu["prix"])
+        assert resultats[scenario["nom"]]["moteur"] == attendu["moteur"]
+
+
+def scenarios_fichier(calculateur):
+    return [
+        {"nom": "actuel"},
+        {"nom": "grille", "fichier": calculateur.options["DPD_PATH"]},
+        {"nom": "15 kg", "POIDS_MAX_COLIS_DPD": 15},
+    ]
+
+
+def test_une_seule_enumeration(calculateur):
+    from utils.timing import Chronometre
+    from utils.utils import partitions_count
+    chrono = Chronometre()
+    calculateur.transporteurs["dpd"].calculer_tarif_dpd_scenarios(panier(10), scenarios_fichier(calculateur), chrono)
+    resume = chrono.resume()
+    assert "find_best_configs" in resume["etapes_ms"]
+    assert "find_best_config" not in resume["etapes_ms"]
+    assert resume["compteurs"]["partitions"] == partitions_count(10)
+
+
+def test_grille_fichier_lue_une_fois(calculateur):
+    from models.transporteurs import _lire_grille_dpd
+    transporteur = calculateur.transporteurs["dpd"]
+    transporteur.calculer_tarif_dpd_scenarios(panier(6), scenarios_fichier(calculateur))
+    lectures = _lire_grille_dpd.cache_info().misses
+    transporteur.calculer_tarif_dpd_scenarios(panier(6), scenarios_fichier(calculateur))
+    assert _lire_grille_dpd.cache_info().misses == lectures
+
+
+@pytest.mark.parametrize("n", [1, 4, 7])
+def test_moteur_c_plusieurs_tarifs(tarif_dpd, n):
+    from bin import c
+    from utils.utils import find_best_config, fonction_tarif
+    tarifs = [tarif_dpd, fonction_tarif(tarif_dpd.weights, [prix*1.1 for prix in tarif_dpd.prices], 20000),
+              fonction_tarif(tarif_dpd.weights, tarif_dpd.prices, 15000)]
+    items = [700 + (i*3413) % 9000 for i in range(n)]
+    for tarif, resultat in zip(tarifs, c.find_best_configs(items, tarifs)):
+        assert resultat["price"] == pytest.approx(find_best_config(list(items), tarif=tarif)["price"])
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import service
+
+
+@pytest.fixture(scope="module")
+def service_devis():
+    # Worker threads instead of processes : same calculer_worker, no process start in the tests
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield service.ServiceDevis(executor, workers=1, max_attente=8, timeout=30)
+
+
+def devis(service_devis, commande):
+    return asyncio.run(service_devis.traiter("POST", "/quote", json.dumps(commande).encode()))
+
+
+def test_devis(service_devis):
+    statut, _, corps = devis(service_devis, {"departement": "75", "articles": [{"nom": "vis", "poids": 2.5, "quantite": 3}]})
+    assert statut == 200
+    assert json.loads(corps)["dpd"]["prix"] > 0
+
+
+def test_departement_inconnu_400(service_devis):
+    with pytest.raises(service.RequeteInvalide) as erreur:
+        devis(service_devis, {"departement": "999", "articles": [{"nom": "vis", "poids": 2.5}]})
+    assert erreur.value.statut == 400
+    assert service_devis.metriques.compteurs["devis_erreurs_total"] == 0
+
+
+def test_erreur_interne_500(service_devis, monkeypatch):
+    # A ValueError of the computation itself is a server failure, not a client one
+    def calculer_worker(lignes, options):
+        raise ValueError("operands could not be broadcast together")
+    monkeypatch.setattr(service, "calculer_worker", calculer_worker)
+    erreurs = service_devis.metriques.compteurs["devis_erreurs_total"]
+    with pytest.raises(service.RequeteInvalide) as erreur:
+        devis(service_devis, {"departement": "13", "articles": [{"nom": "vis", "poids": 1.5}]})
+    assert erreur.value.statut == 500
+    assert service_devis.metriques.compteurs["devis_erreurs_total"] == erreurs + 1
+
+
+def service_bloque(monkeypatch, max_attente=8, timeout=30):
+    """ Service whose worker waits for the returned event, with the number of calls made """
+    libere = threading.Event()
+    appels = []
+
+    def calculer_worker(lignes, options):
+        appels.append(lignes)
+        libere.wait(5)
+        return {"dpd": {"prix": 1.0}}
+    monkeypatch.setattr(service, "calculer_worker", calculer_worker)
+    executor = ThreadPoolExecutor(max_workers=4)
+    return service.ServiceDevis(executor, workers=4, max_attente=max_attente, timeout=timeout), libere, appels
+
+
+def corps(departement):
+    return json.dumps({"departement": departement, "articles": [{"nom": "vis", "poids": 1.5}]}).encode()
+
+
+def test_sature_503(monkeypatch):
+    service_devis, libere, _ = service_bloque(monkeypatch, max_attente=1)
+
+    async def scenario():
+        premier = asyncio.ensure_future(service_devis.traiter("POST", "/quote", corps("13")))
+        await asyncio.sleep(0.05)
+        # A distinct cart while the only waiting slot is taken
+        with pytest.raises(service.RequeteInvalide) as erreur:
+            await service_devis.traiter("POST", "/quote", corps("75"))
+        libere.set()
+        return erreur.value.statut, await premier
+
+    statut, (statut_premier, _, _) = asyncio.run(scenario())
+    service_devis.executor.shutdown()
+    assert (statut, statut_premier) == (503, 200)
+    assert service_devis.metriques.compteurs["devis_rejetes_total"] == 1
+
+
+def test_timeout_504(monkeypatch):
+    service_devis, libere, _ = service_bloque(monkeypatch, timeout=0.05)
+    with pytest.raises(service.RequeteInvalide) as erreur:
+        asyncio.run(service_devis.traiter("POST", "/quote", corps("13")))
+    libere.set()
+    service_devis.executor.shutdown()
+    assert erreur.value.statut == 504
+    assert service_devis.metriques.compteurs["devis_erreurs_total"] == 1
+
+
+def test_paniers_identiques_coalesces(monkeypatch):
+    service_devis, libere, appels = service_bloque(monkeypatch)
+
+    async def scenario():
+        requetes = [asyncio.ensure_future(service_devis.traiter("POST", "/quote", corps("13"))) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        libere.set()
+        return await asyncio.gather(*requetes)
+
+    reponses = asyncio.run(scenario())
+    service_devis.executor.shutdown()
+    assert [statut for statut, _, _ in reponses] == [200]*3
+    assert len(appels) == 1
+    compteurs = service_devis.metriques.compteurs
+    assert (compteurs["devis_calcules_total"], compteurs["devis_coalesces_total"]) == (1, 2)
+    assert not service_devis.en_cours
+
+
+def test_chemins_invalides(service_devis):
+    for methode, chemin, statut in [("GET", "/quote", 405), ("GET", "/inconnu", 404)]:
+        with pytest.raises(service.RequeteInvalide) as erreur:
+            asyncio.run(service_devis.traiter(methode, chemin, b""))
+        assert erreur.value.statut == statut
+    with pytest.raises(service.RequeteInvalide) as erreur:
+        asyncio.run(service_devis.traiter("POST", "/quote", b"{not json"))
+    assert erreur.value.statut == 400
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+import pytest
+
+from test_bulk import cas_aleatoires, prix_scalaire
+
+
+@pytest.mark.parametrize("nom", ["schenker_palette", "schenker_messagerie"])
+def test_surface_egale_au_calcul_scalaire(calculateur, nom):
+    transporteur = calculateur.transporteurs[nom]
+    # On the surface grid (0.1 kg steps) and between its points (priced by calculer_tarifs_bulk)
+    cas = cas_aleatoires(calculateur, graine=28)
+    masses = np.array([masse for masse, _ in cas])
+    departements = np.array([departement for _, departement in cas])
+    prix = transporteur.lire_surface_prix(masses, departements, marge=False)
+    attendus = np.array([prix_scalaire(transporteur, masse, departement) for masse, departement in cas])
+    np.testing.assert_allclose(prix, attendus, equal_nan=True)
+
+
+def test_surface_lecture_seule(calculateur):
+    surface = calculateur.transporteurs["schenker_messagerie"].get_surface_prix()
+    assert surface.dtype == np.float32
+    with pytest.raises(ValueError):
+        surface[0, 0] = 1
+    assert calculateur.transporteurs["dpd"].get_surface_prix() is None
+
+
+def test_export_surface(calculateur, tmp_path):
+    transporteur = calculateur.transporteurs["schenker_palette"]
+    surface = transporteur.get_surface_prix()
+    with np.load(transporteur.exporter_surface_prix(tmp_path / "palette.npz")) as archive:
+        np.testing.assert_array_equal(archive["prix"], surface)
+    with open(transporteur.exporter_surface_prix(tmp_path / "palette.json")) as f:
+        export = json.load(f)
+    assert len(export["prix"]) == surface.shape[0] and not export["marge_incluse"]